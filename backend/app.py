@@ -4,19 +4,36 @@ app.py - SwimTrack 24 API Server
 Endpoints:
   POST /auth/login         POST /auth/register
   GET/POST/PUT/DELETE /competitions
-  GET /competitions/<id>/stats   /team-stats   /swimmer-stats
+  GET /competitions/<id>/stats   /team-stats   /swimmer-stats   /results
   GET/POST/PUT/DELETE /teams
   GET/POST/PUT/DELETE /swimmers
   GET/POST/DELETE /referees      POST /referees/<id>/reset-password
   GET/POST/PUT /swim-sessions
   GET/POST /lap-counts
+  POST /competitions/<id>/archive
+  GET /competitions/<id>/events   /standings   POST /competitions/<id>/rebuild
+  GET /competitions/<id>/lanes/<n>/state
+  GET /metrics
   GET /health
+
+Each phase of a start is timed (startup.py): logged once the app is built,
+and shown in /metrics as `startup`.
 """
 
+import time
+_IMPORT_T0 = time.perf_counter()
+
 import os
+import sqlite3
 import logging
 from flask import Flask, jsonify, request
-from database import init_db
+import startup
+from startup import phase
+from database import init_db, is_busy, set_write_site, follow_archive_changes
+from scheduler import start_scheduler
+from maintenance import maintenance_bp, start_maintenance
+from changes import start_change_feed
+import live
 from auth import auth_bp
 from competitions import competitions_bp
 from teams import teams_bp
@@ -25,39 +42,52 @@ from referees import referees_bp
 from swim_sessions import sessions_bp
 from lap_counts import lap_counts_bp
 from stats import stats_bp
+from archive import archive_bp
+from events import events_bp
+from lanes import lanes_bp
+from utils import cors_headers
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s  %(levelname)-8s  %(name)s: %(message)s",
 )
 logger = logging.getLogger(__name__)
+_imports_ms = (time.perf_counter() - _IMPORT_T0) * 1000
 
 
 def create_app() -> Flask:
+    global _imports_ms
+    startup.reset()
+    if _imports_ms is not None:          # only the first app of a process paid for them
+        startup.record("imports", _imports_ms)
+        _imports_ms = None
+
     # Disable Flask static file serving to avoid accidental file exposure.
     app = Flask(__name__, static_folder=None)
     init_db()
 
-    for bp in (auth_bp, competitions_bp, teams_bp, swimmers_bp,
-               referees_bp, sessions_bp, lap_counts_bp, stats_bp):
-        app.register_blueprint(bp)
+    with phase("blueprints"):
+        for bp in (auth_bp, competitions_bp, teams_bp, swimmers_bp,
+                   referees_bp, sessions_bp, lap_counts_bp, stats_bp, archive_bp,
+                   events_bp, lanes_bp, maintenance_bp):
+            app.register_blueprint(bp)
 
-    # ── CORS ──────────────────────────────────────────────────────────────────
-    allowed_origins = os.environ.get(
-        "CORS_ORIGINS",
-        "http://localhost:8080,https://24swim.de"
-    ).split(",")
+    with phase("background"):
+        # Background auto_start / auto_finish transitions (SWIMTRACK_SCHEDULER=0 disables)
+        # plus WAL checkpoints and online backups
+        start_maintenance(start_scheduler())
+
+        # Cross-worker change feed (SWIMTRACK_CHANGE_POLL_MS=0 disables): drops
+        # live models made stale by team/swimmer/competition edits elsewhere,
+        # and cached archived flags of competitions archived elsewhere.
+        feed = start_change_feed()
+        feed.subscribe(live.on_change)
+        follow_archive_changes(feed)
 
+    # ── CORS ──────────────────────────────────────────────────────────────────
     @app.after_request
     def add_cors(response):
-        origin = request.headers.get("Origin", "")
-        if origin in allowed_origins or "*" in allowed_origins:
-            response.headers["Access-Control-Allow-Origin"] = origin
-        else:
-            response.headers["Access-Control-Allow-Origin"] = allowed_origins[0]
-        response.headers["Access-Control-Allow-Methods"]     = "GET, POST, PUT, DELETE, OPTIONS"
-        response.headers["Access-Control-Allow-Headers"]     = "Content-Type, Authorization, X-API-Key"
-        response.headers["Access-Control-Allow-Credentials"] = "true"
+        response.headers.update(cors_headers(request.headers.get("Origin", "")))
         return response
 
     @app.before_request
@@ -65,6 +95,11 @@ def create_app() -> Flask:
         if request.method == "OPTIONS":
             return app.make_default_options_response()
 
+    # Write contention (database.contention_status) is counted per route.
+    @app.before_request
+    def label_write_site():
+        set_write_site(f"{request.method} {request.url_rule.rule}" if request.url_rule else None)
+
     # ── Basic sensitive-path guard ────────────────────────────────────────────
     # Flask does not expose arbitrary files by default, but block common DB
     # filenames explicitly as defense-in-depth.
@@ -100,6 +135,16 @@ def create_app() -> Flask:
         logger.exception("Unhandled exception")
         return jsonify({"error": "Internal server error"}), 500
 
+    # A write still locked out after SWIMTRACK_WRITE_BUDGET_MS of retries
+    @app.errorhandler(sqlite3.OperationalError)
+    def e_sqlite(e):
+        if not is_busy(e):
+            logger.exception("Unhandled exception")
+            return jsonify({"error": "Internal server error"}), 500
+        resp = jsonify({"error": "Database busy, please retry"})
+        resp.headers["Retry-After"] = "1"
+        return resp, 503
+
     @app.route("/api-docs")
     def api_docs():
         return jsonify({"openapi":"3.0.0","info":{"title":"SwimTrack 24 API","version":"1.0.0"}}), 200
@@ -116,6 +161,7 @@ def create_app() -> Flask:
             ok = False
         return jsonify({"status": "ok" if ok else "degraded", "database": "ok" if ok else "error", "version": "1.0.0"}), 200 if ok else 503
 
+    startup.log_report()
     return app
 
 
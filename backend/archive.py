@@ -0,0 +1,159 @@
+"""
+archive.py - Cold storage for completed competitions
+POST /competitions/<id>/archive     (?vacuum=1 also compacts the live database)
+
+CLI:
+  python archive.py <competition_id> [<competition_id> ...] [--vacuum]
+
+A completed competition's lap_counts, swim_sessions, events and
+event_checkpoints rows are moved into archive/<id>.sqlite (WITHOUT ROWID
+tables, no competition_id column, vacuumed) and deleted from the live tables.
+`database.get_db(<id>)` transparently reads them back, so stats, results,
+list exports and the event log keep working. The aggregates (totals,
+lap_buckets, results snapshot) stay live; old `changes` rows are pruned by
+maintenance.
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+from flask import Blueprint, request
+from database import (
+    get_db, archive_dir, archive_path, create_private_file, mark_archived, ARCHIVED_TABLES,
+)
+from utils import ok, error, utc_now_iso
+
+archive_bp = Blueprint("archive", __name__)
+logger     = logging.getLogger(__name__)
+
+
+class ArchiveError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status  = status
+
+
+def _copy_table(src: sqlite3.Connection, dst: sqlite3.Connection, table: str, pk: str, cid: str) -> int:
+    cols = [c for c in src.execute(f"PRAGMA main.table_info({table})").fetchall()
+            if c["name"] != "competition_id"]
+    names = ", ".join(c["name"] for c in cols)
+    decls = ", ".join(f"{c['name']} {c['type']}" for c in cols)
+    dst.execute(f"CREATE TABLE {table} ({decls}, PRIMARY KEY ({pk})) WITHOUT ROWID")
+    rows = src.execute(f"SELECT {names} FROM main.{table} WHERE competition_id = ?", (cid,))
+    dst.executemany(
+        f"INSERT INTO {table} ({names}) VALUES ({', '.join('?' * len(cols))})", rows
+    )
+    return dst.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def archive_competition(cid: str, vacuum: bool = False) -> dict:
+    """Move a completed competition's laps, sessions and event log into its archive file."""
+    path = archive_path(cid)
+    tmp  = f"{path}.tmp"
+
+    db = get_db(cid)
+    try:
+        # Hold the write lock for the whole move so nothing changes underneath.
+        db.execute("BEGIN IMMEDIATE")
+        comp = db.execute(
+            "SELECT status, archived_at FROM competitions WHERE id = ?", (cid,)
+        ).fetchone()
+        if not comp:
+            raise ArchiveError("Competition not found", 404)
+        if comp["archived_at"]:
+            raise ArchiveError("Competition is already archived", 409)
+        if comp["status"] != "completed":
+            raise ArchiveError("Only completed competitions can be archived", 422)
+
+        # 1. Write and vacuum the archive under a temporary name.
+        create_private_file(tmp)
+        arc = sqlite3.connect(tmp)
+        try:
+            counts = {t: _copy_table(db, arc, t, pk, cid) for t, pk in ARCHIVED_TABLES.items()}
+            arc.commit()
+            arc.execute("VACUUM")
+        finally:
+            arc.close()
+
+        for table, n in counts.items():
+            live = db.execute(
+                f"SELECT COUNT(*) FROM main.{table} WHERE competition_id = ?", (cid,)
+            ).fetchone()[0]
+            if live != n:
+                raise ArchiveError(f"Archive verification failed for {table}", 500)
+
+        # 2. Publish the file, then drop the live rows. A crash in between
+        #    leaves the live rows in place (archived_at unset), so it is safe.
+        os.replace(tmp, path)
+        archived_at = utc_now_iso()
+        for table in ARCHIVED_TABLES:
+            db.execute(f"DELETE FROM main.{table} WHERE competition_id = ?", (cid,))
+        db.execute("UPDATE competitions SET archived_at = ? WHERE id = ?", (archived_at, cid))
+        db.commit()
+        mark_archived(cid)
+    except Exception:
+        db.rollback()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        db.close()
+
+    if vacuum:
+        # Rebuilds the live tables and indexes without the archived rows.
+        # Blocks writers while it runs, so only on request.
+        db = get_db(cid)
+        try:
+            db.execute("VACUUM")
+        finally:
+            db.close()
+
+    result = {
+        "competitionId": cid,
+        "archivedAt":    archived_at,
+        "archived":      {"lapCounts": counts["lap_counts"], "swimSessions": counts["swim_sessions"],
+                          "events": counts["events"]},
+        "archiveBytes":  os.path.getsize(path),
+        "vacuumed":      vacuum,
+    }
+    logger.info("Competition archived: %s (%d laps, %d sessions, %d events, %d bytes)",
+                cid, counts["lap_counts"], counts["swim_sessions"], counts["events"], result["archiveBytes"])
+    return result
+
+
+def remove_archive(cid: str) -> None:
+    path = archive_path(cid)
+    if os.path.isfile(path) and not os.path.islink(path):
+        os.remove(path)
+
+
+@archive_bp.route("/competitions/<cid>/archive", methods=["POST"])
+def archive(cid):
+    vacuum = request.args.get("vacuum", "").lower() in ("1", "true")
+    try:
+        return ok(archive_competition(cid, vacuum=vacuum))
+    except ArchiveError as e:
+        return error(e.message, e.status)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-8s %(message)s")
+    args   = [a for a in sys.argv[1:] if not a.startswith("--")]
+    vacuum = "--vacuum" in sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(2)
+    from database import init_db
+    init_db()
+    status = 0
+    for i, cid in enumerate(args):
+        try:
+            res = archive_competition(cid, vacuum=vacuum and i == len(args) - 1)
+            print(f"{cid}: {res['archived']['lapCounts']} laps, "
+                  f"{res['archived']['swimSessions']} sessions -> {archive_dir()} ({res['archiveBytes']} bytes)")
+        except ArchiveError as e:
+            print(f"{cid}: {e.message}", file=sys.stderr)
+            status = 1
+    sys.exit(status)
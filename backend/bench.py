@@ -0,0 +1,350 @@
+"""
+bench.py - Microbenchmarks against a throwaway database
+
+CLI:
+  python bench.py lists [--laps N] [--requests N]
+  python bench.py serialize [--laps N] [--requests N]
+  python bench.py writes [--laps N] [--threads N]
+  python bench.py startup [--laps N] [--requests N] [--budget-ms MS]
+  python bench.py stress [--processes N] [--threads N] [--seconds S]
+
+lists: median time per GET /teams, /swimmers, /swim-sessions and /lap-counts
+request, once with a fresh connection per request (pool size 0, how get_db()
+worked before the pool) and once with pooled connections whose statement
+caches are warm.
+
+serialize: CPU time and peak Python memory (tracemalloc) of turning one
+competition's laps (default 50k) into API objects, the old way (sqlite3.Row,
+dict(row), serialize_lap_count) against repository.LAP_COUNTS, plus the whole
+GET /lap-counts request.
+
+writes: sustained POST /lap-counts throughput and latency from concurrent
+request threads, one commit per lap (SWIMTRACK_WRITE_BATCH_MS=0) against the
+group-committing lap writer.
+
+startup: cold starts (a fresh interpreter importing app and running
+create_app) against a database of --laps laps, with every init step
+(SWIMTRACK_FAST_START=0) and with the schema-version fast path, phase by
+phase from startup.report(). Exits 1 when the median fast start is over
+--budget-ms (default startup.STARTUP_BUDGET_MS), so CI can hold the budget.
+
+stress: --threads referees (default 20) tapping laps on their own lanes and
+two organizers editing teams, swimmers and the competition, all at once and
+spread over --processes worker processes (default 4) sharing one database
+file, for --seconds each: once with busy retries off
+(SWIMTRACK_WRITE_BUDGET_MS=0) and once with them on. Reports status codes and
+latency per endpoint, and each worker's database.contention_status() summed
+per route: lock waits, retries and failures.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+import subprocess
+import threading
+import multiprocessing
+from collections import Counter
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+# The throwaway database must be configured before any app import; worker
+# processes (stress) inherit the parent's.
+if "SWIMTRACK_BENCH_DIR" not in os.environ:
+    os.environ["SWIMTRACK_BENCH_DIR"] = tempfile.mkdtemp(prefix="swimtrack-bench-")
+    atexit.register(shutil.rmtree, os.environ["SWIMTRACK_BENCH_DIR"], ignore_errors=True)
+os.environ["SWIMTRACK_DB"] = os.path.join(os.environ["SWIMTRACK_BENCH_DIR"], "bench.db")
+os.environ.setdefault("SWIMTRACK_CHANGE_POLL_MS", "0")
+os.environ.setdefault("SWIMTRACK_SCHEDULER", "0")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database                             # noqa: E402
+from app import create_app                  # noqa: E402
+import repository                           # noqa: E402
+from database import get_db                 # noqa: E402
+from utils import serialize_lap_count       # noqa: E402
+from lap_counts import insert_lap, lap_writes  # noqa: E402
+import startup                              # noqa: E402
+
+
+def seed(client, teams: int = 8, swimmers_per_team: int = 6, laps: int = 5000) -> dict:
+    """One active competition with `laps` laps spread over its teams; returns the ids."""
+    org = client.post("/auth/register", json={"email": "bench@example.com", "password": "bench",
+                                              "name": "Bench", "role": "organizer"}).get_json()["user"]["id"]
+    cid = client.post("/competitions", json={
+        "name": "Bench 24h", "date": "2025-09-06", "startTime": "10:00", "location": "Pool",
+        "organizerId": org, "numberOfLanes": teams, "doubleCountTimeout": 0,
+    }).get_json()["data"]["id"]
+    client.put(f"/competitions/{cid}", json={"status": "active"})
+    referee = client.post("/referees", json={"competitionId": cid}).get_json()["data"]["id"]
+
+    roster = []
+    for lane in range(1, teams + 1):
+        tid = client.post("/teams", json={"name": f"Team {lane}", "color": "#336699",
+                                          "competitionId": cid, "assignedLane": lane}).get_json()["data"]["id"]
+        sids = [client.post("/swimmers", json={"name": f"Swimmer {lane}.{n}", "teamId": tid,
+                                               "competitionId": cid}).get_json()["data"]["id"]
+                for n in range(swimmers_per_team)]
+        sess = client.post("/swim-sessions", json={"competitionId": cid, "swimmerId": sids[0],
+                                                   "teamId": tid, "laneNumber": lane}).get_json()["data"]["id"]
+        roster.append((lane, tid, sids, sess))
+
+    start = datetime(2025, 9, 6, 8, tzinfo=timezone.utc)
+    with get_db(cid) as db:
+        for n in range(laps):
+            lane, tid, sids, sess = roster[n % teams]
+            at = (start + timedelta(seconds=n * 86400 / max(laps, 1))).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            insert_lap(db, cid, lane, tid, sids[(n // teams) % len(sids)], referee,
+                       n // teams + 1, sess, at, timezone.utc)
+    return {"competitionId": cid, "teamId": roster[0][1], "swimmerId": roster[0][2][0],
+            "refereeId": referee, "lanes": [(lane, tid, sids[0]) for lane, tid, sids, _ in roster]}
+
+
+def _median_us(client, url: str, requests: int) -> float:
+    times = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        r = client.get(url)
+        times.append(time.perf_counter() - t0)
+        assert r.status_code == 200, (url, r.status_code)
+    return statistics.median(times) * 1e6
+
+
+def bench_lists(laps: int, requests: int) -> None:
+    client = create_app().test_client()
+    ids    = seed(client, laps=laps)
+    cid    = ids["competitionId"]
+    urls   = [
+        f"/teams?competitionId={cid}",
+        f"/swimmers?competitionId={cid}",
+        f"/swim-sessions?competitionId={cid}",
+        f"/lap-counts?teamId={ids['teamId']}",
+        f"/lap-counts?competitionId={cid}",
+    ]
+    pool_size = database.POOL_SIZE
+    print(f"{laps} laps, median of {requests} requests")
+    print(f"{'endpoint':<48}{'fresh µs':>10}{'pooled µs':>11}{'speedup':>9}")
+    for url in urls:
+        database.POOL_SIZE = 0
+        database.drain_pool()
+        fresh = _median_us(client, url, requests)
+        database.POOL_SIZE = pool_size
+        _median_us(client, url, 5)          # warm the pool and its statement cache
+        pooled = _median_us(client, url, requests)
+        print(f"{url.replace(cid, '<cid>').replace(ids['teamId'], '<tid>'):<48}"
+              f"{fresh:>10.0f}{pooled:>11.0f}{fresh / pooled:>8.2f}x")
+    print("pool:", database.pool_status())
+
+
+def _measure(fn, repeat: int) -> tuple[float, float]:
+    """Median CPU ms over `repeat` runs and the peak traced MiB of one run."""
+    cpu = []
+    for _ in range(repeat):
+        t0 = time.process_time()
+        fn()
+        cpu.append(time.process_time() - t0)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(cpu) * 1000, peak / 2**20
+
+
+def bench_serialize(laps: int, requests: int) -> None:
+    client = create_app().test_client()
+    cid    = seed(client, laps=laps)["competitionId"]
+    old_sql, params = repository.LAP_COUNTS.sql(counted=True, competition_id=cid)
+    old_sql = old_sql.replace(", ".join(repository.LAP_COUNTS.keys), "*")
+
+    def rows_old():
+        with get_db(cid) as db:
+            return [serialize_lap_count(dict(r)) for r in db.execute(old_sql, params).fetchall()]
+
+    def rows_new():
+        with get_db(cid) as db:
+            return repository.list_lap_counts(db, competition_id=cid)
+
+    def request():
+        assert len(client.get(f"/lap-counts?competitionId={cid}").get_json()["data"]) == laps
+
+    assert rows_old() == rows_new()
+    print(f"{laps} laps, median of {requests} runs")
+    print(f"{'':<28}{'CPU ms':>10}{'peak MiB':>10}")
+    for label, fn in (("Row + dict + serialize", rows_old), ("tuple shape", rows_new),
+                      ("GET /lap-counts", request)):
+        cpu, peak = _measure(fn, requests)
+        print(f"{label:<28}{cpu:>10.1f}{peak:>10.1f}")
+
+
+def bench_writes(laps: int, threads: int) -> None:
+    client = create_app().test_client()
+    ids    = seed(client, laps=0)
+    lanes  = ids["lanes"]
+
+    def tap(n):
+        lane, tid, sid = lanes[n % len(lanes)]
+        t0 = time.perf_counter()
+        r = client.post("/lap-counts", json={"competitionId": ids["competitionId"], "laneNumber": lane,
+                                             "teamId": tid, "swimmerId": sid, "refereeId": ids["refereeId"]})
+        assert r.status_code == 201, r.get_json()
+        return time.perf_counter() - t0
+
+    window = os.environ.get("SWIMTRACK_WRITE_BATCH_MS")
+    print(f"{laps} laps from {threads} threads")
+    print(f"{'':<24}{'laps/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for label, ms in (("commit per lap", "0"), ("group commit", window or "5")):
+        os.environ["SWIMTRACK_WRITE_BATCH_MS"] = ms
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            latencies = sorted(pool.map(tap, range(laps)))
+        rate = laps / (time.perf_counter() - t0)
+        print(f"{label:<24}{rate:>10.0f}{latencies[len(latencies) // 2] * 1000:>9.1f}"
+              f"{latencies[int(len(latencies) * 0.99)] * 1000:>9.1f}")
+    print("writer:", lap_writes.status())
+
+
+_COLD_START = (
+    "import time, json; t0 = time.perf_counter(); import app; app.create_app(); "
+    "import startup; print(json.dumps({**startup.report(), 'wallMs': (time.perf_counter() - t0) * 1000}))"
+)
+
+
+def _cold_start(fast: bool) -> dict:
+    env = {**os.environ, "SWIMTRACK_FAST_START": "1" if fast else "0"}
+    out = subprocess.run([sys.executable, "-c", _COLD_START], env=env, check=True, capture_output=True,
+                         text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def bench_startup(laps: int, starts: int, budget_ms: float) -> int:
+    client = create_app().test_client()     # builds and stamps the schema
+    seed(client, laps=laps)
+    database.drain_pool()
+    size = os.path.getsize(os.environ["SWIMTRACK_DB"]) / 2**20
+    print(f"{laps} laps ({size:.0f} MiB), median of {starts} cold starts, ms")
+    medians = {}
+    for label, fast in (("full init", False), ("fast start", True)):
+        runs = [_cold_start(fast) for _ in range(starts)]
+        assert all(r["fastStart"] == fast for r in runs), runs[0]
+        phases = {name: statistics.median(r["phases"].get(name, 0.0) for r in runs)
+                  for name in runs[0]["phases"]}
+        medians[label] = statistics.median(r["totalMs"] for r in runs)
+        print(f"{label:<12}{medians[label]:>8.1f}  "
+              + "  ".join(f"{name} {ms:.1f}" for name, ms in phases.items()))
+    if medians["fast start"] > budget_ms:
+        print(f"FAIL: fast start {medians['fast start']:.0f} ms > budget {budget_ms:.0f} ms")
+        return 1
+    print(f"ok: fast start within {budget_ms:.0f} ms")
+    return 0
+
+
+def _stress_worker(ids: dict, seconds: float, referees: list, organizers: list) -> dict:
+    """One worker process: its share of referees and organizers against its own app."""
+    app      = create_app()
+    cid      = ids["competitionId"]
+    deadline = time.monotonic() + seconds
+    results: dict[str, tuple[Counter, list]] = {}
+    lock = threading.Lock()
+
+    def call(client, label, method, url, body):
+        t0 = time.perf_counter()
+        status = client.open(url, method=method, json=body).status_code
+        with lock:
+            statuses, latencies = results.setdefault(label, (Counter(), []))
+            statuses[status] += 1
+            latencies.append(time.perf_counter() - t0)
+
+    def referee(n):
+        client = app.test_client()
+        lane, tid, sid = ids["lanes"][n % len(ids["lanes"])]
+        while time.monotonic() < deadline:
+            call(client, "POST /lap-counts", "POST", "/lap-counts",
+                 {"competitionId": cid, "laneNumber": lane, "teamId": tid, "swimmerId": sid,
+                  "refereeId": ids["refereeId"]})
+
+    def organizer(n):
+        client = app.test_client()
+        _, tid, _ = ids["lanes"][n % len(ids["lanes"])]
+        k = 0
+        while time.monotonic() < deadline:
+            k += 1
+            call(client, "PUT /teams/<tid>", "PUT", f"/teams/{tid}", {"name": f"Team {n}.{k}"})
+            call(client, "POST /swimmers", "POST", "/swimmers",
+                 {"name": f"Sub {n}.{k}", "teamId": tid, "competitionId": cid})
+            call(client, "PUT /competitions/<cid>", "PUT", f"/competitions/{cid}", {"description": f"rev {k}"})
+
+    threads = ([threading.Thread(target=referee, args=(n,)) for n in referees]
+               + [threading.Thread(target=organizer, args=(n,)) for n in organizers])
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {"endpoints": {label: (dict(st), lat) for label, (st, lat) in results.items()},
+            "contention": database.contention_status()["sites"]}
+
+
+def bench_stress(processes: int, referees: int, seconds: float) -> None:
+    organizers = 2
+    client = create_app().test_client()
+    ids    = seed(client, teams=referees, swimmers_per_team=2, laps=0)
+    database.drain_pool()
+    ctx    = multiprocessing.get_context("spawn")
+    jobs   = [(ids, seconds, list(range(p, referees, processes)), list(range(p, organizers, processes)))
+              for p in range(processes)]
+    budget = os.environ.get("SWIMTRACK_WRITE_BUDGET_MS") or "2000"
+    print(f"{referees} referees + {organizers} organizers over {processes} processes, {seconds:.0f}s per run")
+    for label, ms in (("no retries", "0"), (f"retries, {budget} ms budget", budget)):
+        os.environ["SWIMTRACK_WRITE_BUDGET_MS"] = ms
+        with ctx.Pool(processes) as pool:
+            outs = pool.starmap(_stress_worker, jobs)
+        print(f"\n{label}")
+        print(f"{'endpoint':<26}{'requests':>9}{'2xx':>7}{'429':>6}{'503':>6}{'5xx':>6}{'p50 ms':>8}{'p99 ms':>8}")
+        endpoints: dict[str, tuple[Counter, list]] = {}
+        for out in outs:
+            for ep, (statuses, latencies) in out["endpoints"].items():
+                total = endpoints.setdefault(ep, (Counter(), []))
+                total[0].update({int(k): v for k, v in statuses.items()})
+                total[1].extend(latencies)
+        for ep, (statuses, latencies) in sorted(endpoints.items()):
+            latencies.sort()
+            ok2xx = sum(v for k, v in statuses.items() if 200 <= k < 300)
+            other = sum(v for k, v in statuses.items() if k >= 500 and k != 503)
+            print(f"{ep:<26}{len(latencies):>9}{ok2xx:>7}{statuses[429]:>6}{statuses[503]:>6}{other:>6}"
+                  f"{latencies[len(latencies) // 2] * 1000:>8.1f}{latencies[int(len(latencies) * 0.99)] * 1000:>8.1f}")
+        sites: dict[str, Counter] = {}
+        for out in outs:
+            for site, entry in out["contention"].items():
+                sites.setdefault(site, Counter()).update(entry)
+        print(f"{'contention (server side)':<26}{'busy':>9}{'retries':>9}{'failed':>8}{'wait ms':>10}")
+        for site, entry in sorted(sites.items()):
+            print(f"{site:<26}{entry['busy']:>9}{entry['retries']:>9}{entry['failed']:>8}{entry['waitMs']:>10.0f}")
+        if not sites:
+            print("(none)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SwimTrack microbenchmarks")
+    parser.add_argument("command", choices=["lists", "serialize", "writes", "startup", "stress"])
+    parser.add_argument("--laps", type=int)
+    parser.add_argument("--requests", type=int)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--budget-ms", type=float, default=startup.STARTUP_BUDGET_MS)
+    args = parser.parse_args()
+    if args.command == "lists":
+        bench_lists(args.laps or 5000, args.requests or 200)
+    elif args.command == "serialize":
+        bench_serialize(args.laps or 50000, args.requests or 5)
+    elif args.command == "writes":
+        bench_writes(args.laps or 2000, args.threads or 16)
+    elif args.command == "startup":
+        sys.exit(bench_startup(args.laps or 200000, args.requests or 5, args.budget_ms))
+    elif args.command == "stress":
+        bench_stress(args.processes, args.threads or 20, args.seconds)
@@ -0,0 +1,41 @@
+-- SwimTrack 24 - Change feed triggers (changes.py) on the per-competition tables
+-- Run after competition_schema.sql and the migrations (database.init_db,
+-- create_shard), so one-off backfills do not log a change row per lap.
+-- The competitions triggers are in schema.sql.
+
+CREATE TRIGGER IF NOT EXISTS trg_teams_insert AFTER INSERT ON teams BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.competition_id, 'team', NEW.id, 'insert');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_teams_update AFTER UPDATE ON teams BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.competition_id, 'team', NEW.id, 'update');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_teams_delete AFTER DELETE ON teams BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (OLD.competition_id, 'team', OLD.id, 'delete');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_swimmers_insert AFTER INSERT ON swimmers BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.competition_id, 'swimmer', NEW.id, 'insert');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_swimmers_update AFTER UPDATE ON swimmers BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.competition_id, 'swimmer', NEW.id, 'update');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_swimmers_delete AFTER DELETE ON swimmers BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (OLD.competition_id, 'swimmer', OLD.id, 'delete');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_swim_sessions_insert AFTER INSERT ON swim_sessions BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.competition_id, 'session', NEW.id, 'insert');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_swim_sessions_update AFTER UPDATE ON swim_sessions BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.competition_id, 'session', NEW.id, 'update');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_swim_sessions_delete AFTER DELETE ON swim_sessions BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (OLD.competition_id, 'session', OLD.id, 'delete');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_lap_counts_insert AFTER INSERT ON lap_counts BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.competition_id, 'lap', NEW.id, 'insert');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_lap_counts_update AFTER UPDATE ON lap_counts BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.competition_id, 'lap', NEW.id, 'update');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_lap_counts_delete AFTER DELETE ON lap_counts BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (OLD.competition_id, 'lap', OLD.id, 'delete');
+END;
@@ -0,0 +1,238 @@
+"""
+changes.py - Cross-process change feed
+
+Triggers on competitions, teams, swimmers, swim_sessions and lap_counts append
+one row per insert/update/delete to the `changes` table of the database file
+that holds the row (main or the competition's shard), in the writer's own
+transaction, so every worker's writes are captured without any code in the
+endpoints.
+
+Each worker runs one ChangeFeed thread. It keeps a connection per database
+file and polls `PRAGMA data_version` every SWIMTRACK_CHANGE_POLL_MS (default
+20 ms); the value only moves when another connection committed to that file,
+so an idle poll reads no pages. On a change the new rows are read past the
+file's cursor and handed to every subscriber as Change tuples. Rows older than
+CHANGE_RETENTION_S are pruned by maintenance, except each competition's newest.
+
+A competition's data version is the newest change seq of its rows (summed over
+the main file and its shard). seq is AUTOINCREMENT and pruning keeps the newest
+row, so the version only grows; wait_for_version() blocks a request until it
+passes a version the client already has (long-polling /stats).
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from database import database_files, get_db, is_sharded
+
+logger = logging.getLogger(__name__)
+
+CHANGE_RETENTION_S = 3600
+FILES_RESCAN_S     = 1.0     # how often new shard files are looked for
+VERSION_RECHECK_S  = 1.0     # long-poll re-reads the version this often without a running feed
+
+# Hot reads, shared with the query-plan checks in test_e2e.py
+CHANGES_SINCE_SQL = "SELECT seq, competition_id, entity, entity_id, op FROM changes WHERE seq>? ORDER BY seq"
+DATA_VERSION_SQL  = "SELECT COALESCE(MAX(seq), 0) FROM {schema}.changes WHERE competition_id=?"
+
+# db: database_files() name ('main' or a shard's competition id)
+Change = namedtuple("Change", "db seq competition_id entity entity_id op")
+
+
+def poll_interval_s() -> float:
+    """0 disables the feed thread."""
+    try:
+        return float(os.environ.get("SWIMTRACK_CHANGE_POLL_MS", 20)) / 1000
+    except ValueError:
+        return 0.02
+
+
+class ChangeFeed:
+    def __init__(self):
+        self._subs: list = []
+        self._files: dict[str, dict] = {}    # name -> {"conn", "version", "cursor"}
+        self._files_at = 0.0
+        self._thread = None
+        self._stop   = threading.Event()
+        self.delivered = 0
+
+    # ── subscribers ───────────────────────────────────────────────────────────
+    def subscribe(self, fn):
+        """Call `fn(change)` for every change committed from now on (feed thread)."""
+        self._subs.append(fn)
+        return fn
+
+    def unsubscribe(self, fn) -> None:
+        if fn in self._subs:
+            self._subs.remove(fn)
+
+    # ── polling ───────────────────────────────────────────────────────────────
+    def _open(self, name: str, path: str, from_start: bool) -> None:
+        conn = sqlite3.connect(path, timeout=0)
+        cursor = 0 if from_start else conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        self._files[name] = {
+            "conn":    conn,
+            "version": conn.execute("PRAGMA data_version").fetchone()[0],
+            "cursor":  cursor,
+        }
+
+    def _refresh_files(self) -> None:
+        # Files present at the first scan start at their newest change; shards
+        # created later are read from their first one.
+        later   = self._files_at > 0
+        current = dict(database_files())
+        for name in list(self._files):
+            if name not in current:
+                self._files.pop(name)["conn"].close()
+        for name, path in current.items():
+            if name not in self._files and os.path.exists(path):
+                try:
+                    self._open(name, path, from_start=later)
+                except sqlite3.Error:
+                    logger.debug("Change feed: %s not ready yet", name)
+        self._files_at = time.monotonic()
+
+    def poll_once(self) -> int:
+        """Deliver changes committed since the last poll; returns how many."""
+        if not self._files or time.monotonic() - self._files_at >= FILES_RESCAN_S:
+            self._refresh_files()
+        count = 0
+        for name, f in self._files.items():
+            try:
+                version = f["conn"].execute("PRAGMA data_version").fetchone()[0]
+                if version == f["version"]:
+                    continue
+                f["version"] = version
+                rows = f["conn"].execute(CHANGES_SINCE_SQL, (f["cursor"],)).fetchall()
+            except sqlite3.OperationalError:
+                continue             # locked by a writer: pick it up next poll
+            for row in rows:
+                change = Change(name, *row)
+                for fn in list(self._subs):
+                    try:
+                        fn(change)
+                    except Exception:
+                        logger.exception("Change subscriber failed")
+            if rows:
+                f["cursor"] = rows[-1][0]
+                count += len(rows)
+        self.delivered += count
+        return count
+
+    def status(self) -> dict:
+        return {"running": self.running, "files": len(self._files), "delivered": self.delivered}
+
+    # ── thread ────────────────────────────────────────────────────────────────
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name="swimtrack-changes", daemon=True)
+        self._thread.start()
+        logger.info("Change feed started (%.0f ms poll)", interval * 1000)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self, interval: float) -> None:
+        # The connections belong to this thread.
+        while not self._stop.wait(interval):
+            try:
+                self.poll_once()
+            except Exception:
+                logger.exception("Change feed poll failed")
+        for f in self._files.values():
+            f["conn"].close()
+        self._files.clear()
+
+
+def prune(path: str, retention_s: float = CHANGE_RETENTION_S) -> int:
+    """Delete change rows older than `retention_s` from one database file."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=retention_s)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    conn = sqlite3.connect(path)
+    try:
+        # Each competition's newest row carries its data version: keep it.
+        cur = conn.execute(
+            """DELETE FROM changes WHERE at < ?
+               AND seq NOT IN (SELECT MAX(seq) FROM changes GROUP BY competition_id)""",
+            (cutoff,),
+        )
+        conn.commit()
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def prune_all(retention_s: float = CHANGE_RETENTION_S) -> int:
+    return sum(prune(path, retention_s) for _, path in database_files())
+
+
+# ── Data versions ─────────────────────────────────────────────────────────────
+def competition_version(competition_id: str) -> int | None:
+    """Current data version of a competition, None if it does not exist."""
+    with get_db(competition_id) as db:
+        if not db.execute("SELECT 1 FROM competitions WHERE id=?", (competition_id,)).fetchone():
+            return None
+        schemas = ("main", "catalog") if is_sharded(competition_id) else ("main",)
+        return sum(
+            db.execute(DATA_VERSION_SQL.format(schema=schema), (competition_id,)).fetchone()[0]
+            for schema in schemas
+        )
+
+
+_bumps: dict[str, int] = {}          # competition id -> changes delivered by the feed
+_bumped = threading.Condition()
+
+
+def _count_change(change: Change) -> None:
+    with _bumped:
+        _bumps[change.competition_id] = _bumps.get(change.competition_id, 0) + 1
+        _bumped.notify_all()
+
+
+def wait_for_version(competition_id: str, after: int, timeout: float) -> int | None:
+    """
+    Block until the competition's data version is greater than `after` or
+    `timeout` seconds passed; returns the version last read (None if the
+    competition does not exist). Woken by the change feed; without a running
+    feed the version is re-read every VERSION_RECHECK_S.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        with _bumped:
+            token = _bumps.get(competition_id, 0)
+        version   = competition_version(competition_id)
+        remaining = deadline - time.monotonic()
+        if version is None or version > after or remaining <= 0:
+            return version
+        if not _feed.running:
+            remaining = min(remaining, VERSION_RECHECK_S)
+        with _bumped:
+            _bumped.wait_for(lambda: _bumps.get(competition_id, 0) != token, remaining)
+
+
+_feed = ChangeFeed()
+_feed.subscribe(_count_change)
+
+
+def feed() -> ChangeFeed:
+    return _feed
+
+
+def start_change_feed() -> ChangeFeed:
+    """Start the process-wide feed unless SWIMTRACK_CHANGE_POLL_MS=0."""
+    interval = poll_interval_s()
+    if interval > 0:
+        _feed.start(interval)
+    return _feed
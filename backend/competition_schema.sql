@@ -0,0 +1,157 @@
+-- SwimTrack 24 - Per-competition operational tables
+-- Created in the main database, and in each shard file when per-competition
+-- sharding is enabled (see database.py: there the REFERENCES to the catalog
+-- tables competitions/referees are dropped, as SQLite FKs cannot cross files).
+
+PRAGMA foreign_keys = ON;
+
+-- Teams
+CREATE TABLE IF NOT EXISTS teams (
+    id             TEXT PRIMARY KEY,        -- UUID
+    name           TEXT NOT NULL,
+    color          TEXT NOT NULL DEFAULT '#3b82f6',  -- hex color
+    logo           TEXT,                    -- optional URL/base64
+    competition_id TEXT NOT NULL REFERENCES competitions(id) ON DELETE CASCADE,
+    assigned_lane  INTEGER NOT NULL DEFAULT 1,
+    created_at     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
+    UNIQUE(competition_id, color, assigned_lane)  -- same color same lane forbidden
+);
+
+-- Swimmers
+CREATE TABLE IF NOT EXISTS swimmers (
+    id             TEXT PRIMARY KEY,        -- UUID
+    name           TEXT NOT NULL,
+    team_id        TEXT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+    competition_id TEXT NOT NULL REFERENCES competitions(id) ON DELETE CASCADE,
+    is_under_12    INTEGER NOT NULL DEFAULT 0,
+    parent_name    TEXT,
+    parent_contact TEXT,
+    parent_present INTEGER NOT NULL DEFAULT 0,
+    created_at     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+);
+
+-- Swim Sessions (a swimmer actively in the water)
+CREATE TABLE IF NOT EXISTS swim_sessions (
+    id             TEXT PRIMARY KEY,        -- UUID
+    competition_id TEXT NOT NULL REFERENCES competitions(id) ON DELETE CASCADE,
+    swimmer_id     TEXT NOT NULL REFERENCES swimmers(id) ON DELETE CASCADE,
+    team_id        TEXT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+    lane_number    INTEGER NOT NULL,
+    start_time     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
+    end_time       TEXT,
+    lap_count      INTEGER NOT NULL DEFAULT 0,
+    is_active      INTEGER NOT NULL DEFAULT 1
+);
+
+-- Lap Counts (immutable event log)
+CREATE TABLE IF NOT EXISTS lap_counts (
+    id             TEXT PRIMARY KEY,        -- UUID
+    competition_id TEXT NOT NULL REFERENCES competitions(id) ON DELETE CASCADE,
+    lane_number    INTEGER NOT NULL,
+    team_id        TEXT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+    swimmer_id     TEXT NOT NULL REFERENCES swimmers(id) ON DELETE CASCADE,
+    referee_id     TEXT REFERENCES referees(id) ON DELETE SET NULL,
+    lap_number     INTEGER NOT NULL,
+    timestamp      TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
+    session_id     TEXT,                    -- session credited with the lap
+    voided_at      TEXT,                    -- soft delete; voided laps count nowhere
+    voided_by      TEXT,
+    void_reason    TEXT,
+    local_hour     INTEGER                  -- hour of `timestamp` in the competition's
+                                            -- timezone (bird counts)
+);
+
+-- Materialized lap totals, adjusted on every record / void / reassign
+CREATE TABLE IF NOT EXISTS team_totals (
+    competition_id TEXT NOT NULL,
+    team_id        TEXT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+    laps           INTEGER NOT NULL DEFAULT 0,
+    last_lap_at    TEXT,                    -- forecast state (stats.update_lap_rate)
+    ewma_interval_s REAL,                   -- smoothed seconds between laps
+    PRIMARY KEY (competition_id, team_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS swimmer_totals (
+    competition_id TEXT NOT NULL,
+    swimmer_id     TEXT NOT NULL REFERENCES swimmers(id) ON DELETE CASCADE,
+    team_id        TEXT NOT NULL,
+    laps           INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (competition_id, swimmer_id)
+) WITHOUT ROWID;
+
+-- Laps per team per time bucket (size = 300s / 3600s), for the timeseries charts
+CREATE TABLE IF NOT EXISTS lap_buckets (
+    competition_id TEXT NOT NULL,
+    size           INTEGER NOT NULL,        -- bucket width in seconds
+    team_id        TEXT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
+    bucket         INTEGER NOT NULL,        -- bucket start, unix seconds
+    laps           INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (competition_id, size, bucket, team_id)
+) WITHOUT ROWID;
+
+-- Event log (append-only): every change that affects the counters.
+-- swim_sessions.lap_count and all standings can be rebuilt by replaying it.
+CREATE TABLE IF NOT EXISTS events (
+    seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+    competition_id TEXT NOT NULL,
+    type           TEXT NOT NULL,           -- lap_recorded | lap_voided | lap_reassigned | session_started | session_ended | status_changed
+    entity_id      TEXT,                    -- lap / session id
+    team_id        TEXT,
+    swimmer_id     TEXT,
+    lane_number    INTEGER,
+    payload        TEXT,                    -- JSON
+    timestamp      TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+);
+
+-- Fold state of the event log every N events, so replays start close by
+CREATE TABLE IF NOT EXISTS event_checkpoints (
+    competition_id TEXT NOT NULL,
+    seq            INTEGER NOT NULL,        -- last event folded in
+    timestamp      TEXT NOT NULL,           -- timestamp of that event
+    state          TEXT NOT NULL,           -- JSON
+    PRIMARY KEY (competition_id, seq)
+);
+
+-- Change feed (changes.py): one row per write to teams, swimmers, swim_sessions,
+-- lap_counts (change_triggers.sql) and competitions (schema.sql), appended by
+-- triggers in the writer's transaction and polled by every worker.
+CREATE TABLE IF NOT EXISTS changes (
+    seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+    competition_id TEXT NOT NULL,
+    entity         TEXT NOT NULL,           -- competition | team | swimmer | session | lap
+    entity_id      TEXT NOT NULL,
+    op             TEXT NOT NULL,           -- insert | update | delete
+    at             TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+);
+CREATE INDEX IF NOT EXISTS idx_changes_at ON changes(at);
+CREATE INDEX IF NOT EXISTS idx_changes_competition ON changes(competition_id, seq);
+
+-- Indexes for common query patterns. Each list query has an index that also
+-- yields its ORDER BY; test_e2e.py ("Query Plans") checks the hot ones.
+-- Indexes involving columns added by migrations are in database._ADDED_INDEXES.
+CREATE INDEX IF NOT EXISTS idx_teams_lane ON teams(competition_id, assigned_lane, name);
+CREATE INDEX IF NOT EXISTS idx_swimmers_name ON swimmers(competition_id, name);
+CREATE INDEX IF NOT EXISTS idx_swimmers_team ON swimmers(team_id);
+CREATE INDEX IF NOT EXISTS idx_swim_sessions_start ON swim_sessions(competition_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_swim_sessions_team_start ON swim_sessions(team_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_swim_sessions_active ON swim_sessions(competition_id, is_active);
+-- RULES: one swimmer per team in the water; enforced by the insert itself
+CREATE UNIQUE INDEX IF NOT EXISTS idx_swim_sessions_one_active
+    ON swim_sessions(competition_id, team_id) WHERE is_active = 1;
+CREATE INDEX IF NOT EXISTS idx_lap_counts_team_time ON lap_counts(team_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_lap_counts_swimmer_time ON lap_counts(swimmer_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_lap_counts_recent ON lap_counts(competition_id, timestamp);
+-- Renumbering after a void / reassign (lap_counts._shift_lap_numbers)
+CREATE INDEX IF NOT EXISTS idx_lap_counts_number ON lap_counts(competition_id, team_id, lap_number);
+-- Superseded by the wider indexes above (same leading columns)
+DROP INDEX IF EXISTS idx_teams_competition;
+DROP INDEX IF EXISTS idx_swimmers_competition;
+DROP INDEX IF EXISTS idx_swim_sessions_competition;
+DROP INDEX IF EXISTS idx_swim_sessions_team;
+DROP INDEX IF EXISTS idx_lap_counts_competition;
+DROP INDEX IF EXISTS idx_lap_counts_team;
+DROP INDEX IF EXISTS idx_lap_counts_timestamp;    -- team ids are unique: same as idx_lap_counts_team_time
+CREATE INDEX IF NOT EXISTS idx_team_totals_rank ON team_totals(competition_id, laps DESC);
+CREATE INDEX IF NOT EXISTS idx_swimmer_totals_rank ON swimmer_totals(competition_id, laps DESC);
+CREATE INDEX IF NOT EXISTS idx_events_competition ON events(competition_id, seq);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(competition_id, timestamp);
@@ -9,10 +9,17 @@ DELETE /competitions/<id>
 
 import logging
 from flask import Blueprint, request
-from database import get_db
+import live
+import scheduler
+from archive import remove_archive
+from database import get_db, sharding_enabled, create_shard, remove_shard, forget_archived
+from events import append_event, STATUS_CHANGED
+from lap_counts import localize_laps
+from stats import build_results_snapshot
+from swim_sessions import close_active_sessions
 from utils import (
-    new_uuid, ok, created, success, error, not_found,
-    serialize_competition,
+    new_uuid, ok, created, success, error, not_found, conflict,
+    serialize_competition, utc_now_iso, is_valid_timezone,
 )
 
 competitions_bp = Blueprint("competitions", __name__)
@@ -54,6 +61,8 @@ def create_competition():
     missing  = [f for f in required if not data.get(f)]
     if missing:
         return error(f"Missing required fields: {', '.join(missing)}")
+    if data.get("timezone") and not is_valid_timezone(data["timezone"]):
+        return error("Unknown timezone (expected an IANA name such as Europe/Berlin)")
 
     # Validate organizer exists
     with get_db() as db:
@@ -64,14 +73,17 @@ def create_competition():
     if not org:
         return error("Organizer not found or not an organizer", 404)
 
-    cid = new_uuid()
-    with get_db() as db:
+    cid     = new_uuid()
+    sharded = sharding_enabled()
+    if sharded:
+        create_shard(cid)
+    with get_db(cid) as db:
         db.execute(
             """INSERT INTO competitions
                (id, name, description, date, start_time, end_time, location,
                 number_of_lanes, lane_length, double_count_timeout,
-                organizer_id, status)
-               VALUES (?,?,?,?,?,?,?,?,?,?,?,?)""",
+                organizer_id, status, sharded, timezone)
+               VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
             (
                 cid,
                 data["name"],
@@ -85,12 +97,16 @@ def create_competition():
                 int(data.get("doubleCountTimeout", 15)),
                 data["organizerId"],
                 "upcoming",
+                int(sharded),
+                data.get("timezone") or None,
             ),
         )
+        append_event(db, cid, STATUS_CHANGED, payload={"from": None, "to": "upcoming"})
         db.commit()
         row = db.execute("SELECT * FROM competitions WHERE id = ?", (cid,)).fetchone()
 
     logger.info("Competition created: %s (%s)", data["name"], cid)
+    scheduler.wake()
     return created(serialize_competition(dict(row)))
 
 
@@ -111,7 +127,14 @@ def update_competition(cid):
     if new_status not in VALID_STATUSES:
         return error(f"Invalid status. Must be one of: {', '.join(VALID_STATUSES)}")
 
-    with get_db() as db:
+    tz_name = data.get("timezone", ex.get("timezone")) or None
+    if tz_name and not is_valid_timezone(tz_name):
+        return error("Unknown timezone (expected an IANA name such as Europe/Berlin)")
+    tz_changed = tz_name != ex.get("timezone")
+    if tz_changed and ex.get("archived_at"):
+        return conflict("Cannot change the timezone of an archived competition")
+
+    with get_db(cid) as db:
         db.execute(
             """UPDATE competitions SET
                name                = ?,
@@ -122,6 +145,7 @@ def update_competition(cid):
                location            = ?,
                number_of_lanes     = ?,
                lane_length         = ?,
+               timezone            = ?,
                double_count_timeout = ?,
                status              = ?,
                auto_start          = ?,
@@ -139,6 +163,7 @@ def update_competition(cid):
                 data.get("location",           ex["location"]),
                 int(data.get("numberOfLanes",  ex["number_of_lanes"])),
                 int(data.get("laneLength",     ex.get("lane_length", 25))),
+                tz_name,
                 int(data.get("doubleCountTimeout", ex["double_count_timeout"])),
                 new_status,
                 int(data.get("autoStart",      ex.get("auto_start", 0))),
@@ -149,10 +174,23 @@ def update_competition(cid):
                 cid,
             ),
         )
+        if new_status != ex["status"]:
+            append_event(db, cid, STATUS_CHANGED, payload={"from": ex["status"], "to": new_status})
+        if tz_changed:
+            localize_laps(db, cid, tz_name)
+        if new_status == "completed":
+            if ex["status"] != "completed":
+                close_active_sessions(db, cid, data.get("actualEndTime") or utc_now_iso())
+            # Freeze results on completion; later organizer edits regenerate them.
+            build_results_snapshot(db, cid)
+        elif ex["status"] == "completed":
+            db.execute("DELETE FROM results_snapshots WHERE competition_id = ?", (cid,))
         db.commit()
         row = db.execute("SELECT * FROM competitions WHERE id = ?", (cid,)).fetchone()
 
+    live.invalidate(cid)
     logger.info("Competition updated: %s status=%s", cid, new_status)
+    scheduler.wake()
     return ok(serialize_competition(dict(row)))
 
 
@@ -160,25 +198,30 @@ def update_competition(cid):
 def delete_competition(cid):
     with get_db() as db:
         existing = db.execute(
-            "SELECT id FROM competitions WHERE id = ?", (cid,)
+            "SELECT id, archived_at, sharded FROM competitions WHERE id = ?", (cid,)
         ).fetchone()
     if not existing:
         return not_found("Competition")
 
-    # Count before cascade delete (for response)
-    with get_db() as db:
+    # Count before cascade delete (for response); shard/archive rows included
+    with get_db(cid) as db:
         teams_count    = db.execute("SELECT COUNT(*) FROM teams WHERE competition_id = ?", (cid,)).fetchone()[0]
         swimmers_count = db.execute("SELECT COUNT(*) FROM swimmers WHERE competition_id = ?", (cid,)).fetchone()[0]
-        refs_count     = db.execute("SELECT COUNT(*) FROM referees WHERE competition_id = ?", (cid,)).fetchone()[0]
         laps_count     = db.execute("SELECT COUNT(*) FROM lap_counts WHERE competition_id = ?", (cid,)).fetchone()[0]
         sess_count     = db.execute("SELECT COUNT(*) FROM swim_sessions WHERE competition_id = ?", (cid,)).fetchone()[0]
 
+    with get_db() as db:
+        refs_count     = db.execute("SELECT COUNT(*) FROM referees WHERE competition_id = ?", (cid,)).fetchone()[0]
+
         ref_user_ids = [
             r[0] for r in db.execute(
                 "SELECT user_id FROM referees WHERE competition_id = ?", (cid,)
             ).fetchall()
         ]
         # Delete in FK dependency order
+        db.execute("DELETE FROM shard_rows WHERE competition_id = ?", (cid,))
+        db.execute("DELETE FROM event_checkpoints WHERE competition_id = ?", (cid,))
+        db.execute("DELETE FROM events WHERE competition_id = ?", (cid,))
         db.execute("DELETE FROM lap_counts WHERE competition_id = ?", (cid,))
         db.execute("DELETE FROM swim_sessions WHERE competition_id = ?", (cid,))
         db.execute("DELETE FROM referees WHERE competition_id = ?", (cid,))
@@ -188,6 +231,12 @@ def delete_competition(cid):
         db.execute("DELETE FROM teams WHERE competition_id = ?", (cid,))
         db.execute("DELETE FROM competitions WHERE id = ?", (cid,))
         db.commit()
+    if existing["archived_at"]:
+        remove_archive(cid)
+    if existing["sharded"]:
+        remove_shard(cid)
+    forget_archived(cid)
+    live.invalidate(cid)
     logger.info("Competition deleted: %s", cid)
     return success({
         "deleted": {
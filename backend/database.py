@@ -4,14 +4,31 @@ database.py - SQLite connection management and helpers
 
 import sqlite3
 import os
+import re
 import stat
+import time
+import random
+import hashlib
 import logging
+import threading
+from contextlib import contextmanager
 from werkzeug.security import generate_password_hash
+from startup import phase, note
 
 SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+COMPETITION_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "competition_schema.sql")
+CHANGE_TRIGGERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "change_triggers.sql")
 logger = logging.getLogger(__name__)
 PASSWORD_HASH_METHOD = "pbkdf2:sha256:600000"
+WAL_SIZE_LIMIT = 16 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 256   # prepared statements kept per connection (sqlite3 default: 128)
+POOL_SIZE = 8                # idle connections kept per database file
 SECURE_HASH_PREFIXES = ("pbkdf2:", "scrypt:", "argon2:")
+SCHEMA_REVISION = 1          # bump when a migration changes but the schema files and _ADDED_* don't
+BUSY_SLICE_S = 0.05          # SQLite's own busy wait per attempt on pooled connections
+BUSY_TIMEOUT_S = 5.0         # SQLite's busy wait with retries off (SWIMTRACK_WRITE_BUDGET_MS=0)
+BUSY_BACKOFF_BASE_S = 0.005  # retry delays: uniform(0, min(cap, base * 2**attempt))
+BUSY_BACKOFF_CAP_S  = 0.25
 
 
 def _db_path() -> str:
@@ -22,6 +39,47 @@ def _db_path() -> str:
     return os.path.abspath(os.environ.get("SWIMTRACK_DB", "swimtrack.db"))
 
 
+def sharding_enabled() -> bool:
+    """New competitions get their own shard file when SWIMTRACK_SHARDING=1."""
+    return os.environ.get("SWIMTRACK_SHARDING", "0") == "1"
+
+
+def shard_dir() -> str:
+    default = os.path.join(os.path.dirname(_db_path()), "shards")
+    return os.path.abspath(os.environ.get("SWIMTRACK_SHARD_DIR", default))
+
+
+def shard_path(competition_id: str) -> str:
+    return os.path.join(shard_dir(), f"{competition_id}.db")
+
+
+def archive_dir() -> str:
+    """Directory holding per-competition archive files (next to the DB by default)."""
+    default = os.path.join(os.path.dirname(_db_path()), "archive")
+    return os.path.abspath(os.environ.get("SWIMTRACK_ARCHIVE_DIR", default))
+
+
+def archive_path(competition_id: str) -> str:
+    return os.path.join(archive_dir(), f"{competition_id}.sqlite")
+
+
+def backup_dir() -> str:
+    default = os.path.join(os.path.dirname(_db_path()), "backups")
+    return os.path.abspath(os.environ.get("SWIMTRACK_BACKUP_DIR", default))
+
+
+def create_private_file(path: str) -> None:
+    """Create an empty owner-only file (0600), replacing any existing one."""
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.lexists(path):
+        os.remove(path)
+    old_umask = os.umask(0o177)
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+    finally:
+        os.umask(old_umask)
+
+
 def _ensure_secure_db_path(path: str) -> None:
     """
     Harden database path against accidental exposure/overwrite:
@@ -75,27 +133,724 @@ def _harden_sidecar_files(path: str) -> None:
                 os.chmod(sidecar, secure_mode)
 
 
-def get_db() -> sqlite3.Connection:
-    """Open a database connection with row_factory for dict-like access."""
-    path = _db_path()
+def _connect(path: str, factory=sqlite3.Connection, timeout: float = BUSY_TIMEOUT_S) -> sqlite3.Connection:
     _ensure_secure_db_path(path)
-    conn = sqlite3.connect(path)
+    conn = sqlite3.connect(path, factory=factory, cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=factory is sqlite3.Connection, timeout=timeout)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
     conn.execute("PRAGMA journal_mode = WAL")
+    # Truncate the WAL back to this size whenever a checkpoint lets it restart.
+    conn.execute(f"PRAGMA journal_size_limit = {WAL_SIZE_LIMIT}")
     return conn
 
 
-def init_db() -> None:
-    """Create all tables from schema.sql if they don't exist yet."""
-    with open(SCHEMA_PATH, "r") as f:
-        schema = f.read()
+# ── Connection pool ───────────────────────────────────────────────────────────
+# Connections are reused across requests so that their prepared-statement
+# caches (STATEMENT_CACHE_SIZE) stay warm; a fresh connection re-prepares every
+# statement. A connection is only ever used by one thread at a time.
+
+class PooledConnection(sqlite3.Connection):
+    """
+    A connection handed out by get_db(). Leaving its `with` block commits (or
+    rolls back) as usual and then returns it to the pool; close() does the same.
+    Connections with per-connection state (an attached archive) are closed
+    instead.
+    """
+    pool_key    = None
+    checked_out = False
+    poolable    = True
+    busy_timeout_s = None
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return super().__exit__(exc_type, exc, tb)
+        finally:
+            _release(self)
+
+    def close(self) -> None:
+        _release(self)
+
+    # A statement run outside a transaction may open one and take the write
+    # lock; if that is busy nothing has been written yet, so it can be retried.
+    def execute(self, sql, parameters=()):
+        if self.in_transaction:
+            return super().execute(sql, parameters)
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.OperationalError as exc:
+            if not is_busy(exc):
+                raise
+            return _retry_busy(self, exc, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.in_transaction:
+            return super().executemany(sql, seq_of_parameters)
+        seq_of_parameters = list(seq_of_parameters)   # may be run twice
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        except sqlite3.OperationalError as exc:
+            if not is_busy(exc):
+                raise
+            return _retry_busy(self, exc, super().executemany, sql, seq_of_parameters)
+
+
+_pool: dict[tuple, list[PooledConnection]] = {}
+_pool_lock = threading.Lock()
+_pool_stats = {"opened": 0, "reused": 0}
+
+
+def _checkout(path: str, catalog: str | None = None) -> PooledConnection:
+    key = (path, catalog)
+    with _pool_lock:
+        idle = _pool.get(key)
+        conn = idle.pop() if idle else None
+        _pool_stats["reused" if conn else "opened"] += 1
+    timeout = _busy_timeout_s()
+    if conn is None:
+        conn = _connect(path, factory=PooledConnection, timeout=timeout)
+        if catalog:
+            conn.execute("ATTACH DATABASE ? AS catalog", (catalog,))
+        conn.pool_key = key
+    elif conn.busy_timeout_s != timeout:
+        conn.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+    conn.busy_timeout_s = timeout
+    conn.checked_out = True
+    return conn
+
+
+def _release(conn: PooledConnection) -> None:
+    if not conn.checked_out:
+        return
+    conn.checked_out = False
+    if conn.in_transaction:
+        conn.rollback()          # never hand out a connection mid-transaction
+    with _pool_lock:
+        idle = _pool.setdefault(conn.pool_key, [])
+        if conn.poolable and len(idle) < POOL_SIZE:
+            idle.append(conn)
+            return
+    sqlite3.Connection.close(conn)
+
+
+def drain_pool(path: str | None = None) -> None:
+    """Close the idle connections to `path` (every file when None)."""
+    with _pool_lock:
+        keys = [k for k in _pool if path is None or k[0] == path]
+        conns = [c for k in keys for c in _pool.pop(k)]
+    for conn in conns:
+        sqlite3.Connection.close(conn)
+
+
+def pool_status() -> dict:
+    with _pool_lock:
+        return {**_pool_stats, "idle": sum(len(v) for v in _pool.values()), "maxIdlePerFile": POOL_SIZE}
+
+
+# ── Write contention ──────────────────────────────────────────────────────────
+# SQLite's busy handler polls on a fixed schedule, so writers that queued up
+# behind one lock wake up together, and a deferred transaction whose snapshot
+# went stale gets SQLITE_BUSY without waiting at all. Pooled connections wait
+# only BUSY_SLICE_S inside SQLite; after that the statement that opened the
+# transaction is rolled back and retried with full-jitter backoff until
+# SWIMTRACK_WRITE_BUDGET_MS is spent, then the error reaches the caller (503).
+# With the budget at 0 they wait BUSY_TIMEOUT_S inside SQLite instead.
+
+def write_budget_s() -> float:
+    """0 disables retries."""
+    try:
+        return float(os.environ.get("SWIMTRACK_WRITE_BUDGET_MS", 2000)) / 1000
+    except ValueError:
+        return 2.0
+
+
+def _busy_timeout_s() -> float:
+    """With retries off, SQLite's busy handler waits as long as it did before them."""
+    return BUSY_SLICE_S if write_budget_s() > 0 else BUSY_TIMEOUT_S
+
+
+def is_busy(exc: BaseException) -> bool:
+    """SQLITE_BUSY / SQLITE_LOCKED (including extended codes such as BUSY_SNAPSHOT)."""
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    code = getattr(exc, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(exc) or "busy" in str(exc)
+
+
+_site = threading.local()
+_contention: dict[str, dict] = {}
+_contention_lock = threading.Lock()
+
+
+def set_write_site(name: str | None) -> None:
+    """Label this thread's contention counters (app.py: the request's route)."""
+    _site.name = name
+
+
+def _count_contention(field: str, wait_s: float = 0.0) -> None:
+    site = getattr(_site, "name", None) or threading.current_thread().name
+    with _contention_lock:
+        entry = _contention.setdefault(site, {"busy": 0, "retries": 0, "failed": 0, "waitMs": 0.0})
+        entry[field] += 1
+        entry["waitMs"] += wait_s * 1000
+
+
+def _retry_busy(conn: sqlite3.Connection, exc: sqlite3.OperationalError, run, *args):
+    t0       = time.monotonic()
+    deadline = t0 + write_budget_s()
+    attempt  = 0
+    _count_contention("busy", BUSY_SLICE_S)
+    while True:
+        if conn.in_transaction:
+            conn.rollback()          # only the implicit BEGIN: nothing was written
+        delay = random.uniform(0, min(BUSY_BACKOFF_CAP_S, BUSY_BACKOFF_BASE_S * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            _count_contention("failed")
+            logger.warning("Write gave up after %d retries (%.0f ms): %s",
+                           attempt, (time.monotonic() - t0) * 1000, exc)
+            raise exc
+        time.sleep(delay)
+        attempt += 1
+        t1 = time.monotonic()
+        try:
+            result = run(*args)
+        except sqlite3.OperationalError as again:
+            if not is_busy(again):
+                raise
+            exc = again
+            _count_contention("busy", delay + time.monotonic() - t1)
+            continue
+        _count_contention("retries", delay + time.monotonic() - t1)
+        return result
+
+
+def contention_status() -> dict:
+    with _contention_lock:
+        sites = {site: {**entry, "waitMs": round(entry["waitMs"], 1)} for site, entry in _contention.items()}
+    return {
+        "budgetMs": round(write_budget_s() * 1000),
+        **{field: sum(e[field] for e in sites.values()) for field in ("busy", "retries", "failed")},
+        "sites":    sites,
+    }
+
+
+def get_db(competition_id: str | None = None) -> sqlite3.Connection:
+    """
+    A pooled database connection with row_factory for dict-like access. Use it
+    as `with get_db(...) as db:`; the block commits and returns it to the pool.
+
+    Pass `competition_id` whenever the work is scoped to one competition:
+    - sharded competitions get a connection to their shard file with the main
+      database attached as `catalog` (users, competitions, referees, ... resolve
+      there because the shard does not define them);
+    - archived competitions read their laps, sessions and event log from the
+      archive file.
+    """
+    if competition_id and is_sharded(competition_id):
+        conn = _checkout(shard_path(competition_id), catalog=_db_path())
+    else:
+        conn = _checkout(_db_path())
+    if competition_id:
+        attach_archive(conn, competition_id)
+    return conn
+
+
+def begin_write(conn: sqlite3.Connection) -> None:
+    """
+    Start a transaction holding the write lock of the connection's own file,
+    like BEGIN IMMEDIATE. On a shard connection BEGIN IMMEDIATE would lock the
+    attached catalog (the main database) too and queue every shard's writers
+    behind it; an empty write to main.changes takes the shard's lock alone,
+    and a busy lock is retried like any statement that opens a transaction.
+    """
+    try:
+        _lock_main(conn)
+    except sqlite3.OperationalError as exc:
+        if not is_busy(exc):
+            raise
+        _retry_busy(conn, exc, _lock_main, conn)
+
+
+def _lock_main(conn: sqlite3.Connection) -> None:
+    conn.execute("BEGIN")
+    try:
+        conn.execute("DELETE FROM main.changes WHERE 0")
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+# competition id -> sharded flag; the flag is fixed at creation, so it is safe
+# to remember for the lifetime of the process.
+_sharded_cache: dict[str, bool] = {}
+
+
+def is_sharded(competition_id: str) -> bool:
+    cached = _sharded_cache.get(competition_id)
+    if cached is not None:
+        return cached
+    conn = _connect(_db_path())
+    try:
+        row = conn.execute(
+            "SELECT sharded FROM competitions WHERE id = ?", (competition_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        row = None  # schema not migrated yet
+    finally:
+        conn.close()
+    if row is None:
+        return False
+    _sharded_cache[competition_id] = bool(row["sharded"])
+    return _sharded_cache[competition_id]
+
+
+def shard_ids() -> list[str]:
+    """Competition ids that have a shard file."""
+    try:
+        names = os.listdir(shard_dir())
+    except FileNotFoundError:
+        return []
+    return [n[:-3] for n in names if n.endswith(".db")]
+
+
+def database_files() -> list[tuple[str, str]]:
+    """(name, path) of every database file: 'main' plus one per shard."""
+    return [("main", _db_path())] + [(cid, shard_path(cid)) for cid in shard_ids()]
+
+
+# Tables whose rows of sharded competitions are listed in the catalog's
+# shard_rows. Laps and sessions are written too often for a catalog write each;
+# their by-id routes take the competitionId from the client instead.
+LOCATED_TABLES = ("teams", "swimmers")
+
+
+def locate_competition(table: str, row_id: str) -> str | None:
+    """
+    Competition whose shard holds `table` row `row_id`, for routes that only
+    carry a row id. None (main database) for rows outside shards.
+    """
+    if table not in LOCATED_TABLES or not shard_ids():
+        return None
     with get_db() as conn:
-        conn.executescript(schema)
-        _migrate_lap_counts_referee_fk(conn)
-        _migrate_legacy_user_passwords(conn)
+        row = conn.execute("SELECT competition_id FROM shard_rows WHERE id = ?", (row_id,)).fetchone()
+    return row[0] if row else None
+
+
+def register_shard_rows(db: sqlite3.Connection, competition_id: str, *row_ids: str) -> None:
+    """Record new team / swimmer rows of a sharded competition; part of the caller's transaction."""
+    if is_sharded(competition_id):
+        db.executemany("INSERT OR REPLACE INTO catalog.shard_rows (id, competition_id) VALUES (?,?)",
+                       [(row_id, competition_id) for row_id in row_ids])
+
+
+def forget_shard_rows(db: sqlite3.Connection, competition_id: str, *row_ids: str) -> None:
+    if is_sharded(competition_id):
+        db.executemany("DELETE FROM catalog.shard_rows WHERE id = ?", [(row_id,) for row_id in row_ids])
+
+
+def _shard_schema() -> str:
+    """competition_schema.sql without the FKs into catalog tables."""
+    with open(COMPETITION_SCHEMA_PATH, "r") as f:
+        schema = f.read()
+    return re.sub(
+        r"\s+REFERENCES\s+(competitions|referees)\(id\)(\s+ON DELETE (CASCADE|SET NULL))?",
+        "", schema,
+    )
+
+
+def create_shard(competition_id: str) -> None:
+    """Create the shard file of a newly created sharded competition."""
+    os.makedirs(shard_dir(), mode=0o700, exist_ok=True)
+    path = shard_path(competition_id)
+    with _connect(path) as conn:
+        conn.executescript(_shard_schema())
+        _migrate_added_columns(conn)
+        _create_change_triggers(conn)
+        conn.execute(f"PRAGMA user_version = {schema_fingerprint()}")
+    _harden_sidecar_files(path)
+    _sharded_cache[competition_id] = True
+
+
+def remove_shard(competition_id: str) -> None:
+    path = shard_path(competition_id)
+    drain_pool(path)
+    for p in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.isfile(p) and not os.path.islink(p):
+            os.remove(p)
+    _sharded_cache.pop(competition_id, None)
+
+
+# Per-lap tables moved into the archive file, with their primary key there
+# (competition_id is dropped: the file holds one competition).
+ARCHIVED_TABLES = {
+    "lap_counts":        "id",
+    "swim_sessions":     "id",
+    "events":            "seq",
+    "event_checkpoints": "seq",
+}
+
+# Local hour of a UTC timestamp for competitions without a timezone (all of
+# them when the column was added).
+LOCAL_HOUR_UTC_SQL = "CAST(substr(timestamp, 12, 2) AS INTEGER)"
+
+# Archives written before a column existed: derive it instead of NULL.
+_ARCHIVE_FALLBACKS = {"local_hour": LOCAL_HOUR_UTC_SQL}
+
+
+# competition id -> archived flag. Archiving is one-way, so True is kept until
+# the competition is deleted. False is only remembered while the change feed
+# runs (follow_archive_changes): it reports other workers archiving the
+# competition; this worker's own archive_competition() calls mark_archived().
+_archived_cache: dict[str, bool] = {}
+_archive_feed = None
+
+
+def is_archived(conn: sqlite3.Connection, competition_id: str) -> bool:
+    cached = _archived_cache.get(competition_id)
+    if cached is not None:
+        return cached
+    try:
+        row = conn.execute(
+            "SELECT archived_at FROM competitions WHERE id = ?", (competition_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return False  # schema not migrated yet
+    if row is None:
+        return False
+    archived = bool(row["archived_at"])
+    if archived or (_archive_feed is not None and _archive_feed.running):
+        # setdefault: a concurrent mark_archived() wins over a stale read
+        return _archived_cache.setdefault(competition_id, archived)
+    return archived
+
+
+def mark_archived(competition_id: str) -> None:
+    """After the archive transaction committed."""
+    _archived_cache[competition_id] = True
+
+
+def forget_archived(competition_id: str) -> None:
+    _archived_cache.pop(competition_id, None)
+
+
+def follow_archive_changes(feed) -> None:
+    """Subscribe the archived-flag cache to the change feed (changes.ChangeFeed)."""
+    global _archive_feed
+    _archive_feed = feed
+    feed.subscribe(_on_competition_change)
+
+
+def _on_competition_change(change) -> None:
+    if change.entity == "competition" and _archived_cache.get(change.competition_id) is False:
+        forget_archived(change.competition_id)
+
+
+def attach_archive(conn: sqlite3.Connection, competition_id: str) -> bool:
+    """
+    If the competition is archived, shadow the ARCHIVED_TABLES on this
+    connection with TEMP views that union the archive rows (competition_id is
+    implied by the file) with the live tables, so existing queries work
+    unchanged. Archived data is read-only. Returns True if attached.
+    """
+    if not is_archived(conn, competition_id):
+        return False
+    if any(d["name"] == "archive" for d in conn.execute("PRAGMA database_list")):
+        return True
+
+    path = archive_path(competition_id)
+    if not os.path.isfile(path) or os.path.islink(path):
+        logger.error("Archive file missing for competition %s: %s", competition_id, path)
+        return False
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    if isinstance(conn, PooledConnection):
+        conn.poolable = False    # the TEMP views must not leak to other competitions
+    cid_literal = "'" + competition_id.replace("'", "''") + "'"
+    for table in ARCHIVED_TABLES:
+        live_cols = [c["name"] for c in conn.execute(f"PRAGMA main.table_info({table})")]
+        arch_cols = {c["name"] for c in conn.execute(f"PRAGMA archive.table_info({table})")}
+        select = ", ".join(
+            f"{cid_literal} AS competition_id" if col == "competition_id"
+            else col if col in arch_cols
+            else f"{_ARCHIVE_FALLBACKS[col]} AS {col}" if col in _ARCHIVE_FALLBACKS
+            else f"NULL AS {col}"
+            for col in live_cols
+        )
+        conn.execute(
+            f"CREATE TEMP VIEW {table} AS "
+            f"SELECT {select} FROM archive.{table} "
+            f"UNION ALL SELECT {', '.join(live_cols)} FROM main.{table}"
+        )
+    return True
+
+
+def fast_start_enabled() -> bool:
+    return os.environ.get("SWIMTRACK_FAST_START", "1") != "0"
+
+
+def schema_fingerprint() -> int:
+    """
+    Stamped into a file's PRAGMA user_version once init_db brought it up to
+    date: a hash of the schema files, the added columns / indexes / backfills
+    and SCHEMA_REVISION. Any change to them makes every file migrate again.
+    """
+    h = hashlib.sha256()
+    for path in (SCHEMA_PATH, COMPETITION_SCHEMA_PATH, CHANGE_TRIGGERS_PATH):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    h.update(repr((_ADDED_COLUMNS, _ADDED_INDEXES, sorted(_ADDED_COLUMN_BACKFILLS.items()),
+                   SCHEMA_REVISION)).encode("utf-8"))
+    return int.from_bytes(h.digest()[:4], "big") & 0x7FFFFFFF or 1
+
+
+def _is_current(conn: sqlite3.Connection, fingerprint: int) -> bool:
+    return fast_start_enabled() and conn.execute("PRAGMA user_version").fetchone()[0] == fingerprint
+
+
+def init_db() -> None:
+    """
+    Create all tables from the schema files if they don't exist yet and run
+    the migrations. The schema scripts, PRAGMA introspection and full-table
+    migration scans cost a start time that grows with the database, so a file
+    already stamped with the current schema_fingerprint() is left alone
+    (SWIMTRACK_FAST_START=0 runs everything regardless).
+    """
+    from events import backfill_events  # events imports this module
+    fingerprint = schema_fingerprint()
+    # Not pooled: workers starting together wait the full busy timeout on each other.
+    conn = _connect(_db_path())
+    with conn:
+        current = _is_current(conn, fingerprint)
+        if not current:
+            with phase("schema"):
+                with open(SCHEMA_PATH, "r") as f:
+                    conn.executescript(f.read())
+                _close_duplicate_active_sessions(conn)
+                with open(COMPETITION_SCHEMA_PATH, "r") as f:
+                    conn.executescript(f.read())
+                _migrate_lap_counts_referee_fk(conn)
+                _migrate_added_columns(conn)
+            with phase("migrations"):
+                _migrate_legacy_user_passwords(conn)
+                _migrate_lap_totals(conn)
+                _migrate_lap_buckets(conn)
+                backfill_events(conn)
+            _create_change_triggers(conn)
+            conn.execute(f"PRAGMA user_version = {fingerprint}")
+    conn.close()
     _harden_sidecar_files(_db_path())
-    logger.info("Database initialised at %s", _db_path())
+    note(fastStart=current)
+
+    with phase("shards"):
+        shard_schema = None
+        for cid in shard_ids():
+            path = shard_path(cid)
+            conn = _connect(path)
+            try:
+                if not _is_current(conn, fingerprint):
+                    shard_schema = shard_schema or _shard_schema()
+                    _close_duplicate_active_sessions(conn)
+                    conn.executescript(shard_schema)
+                    _migrate_added_columns(conn)
+                    _migrate_lap_totals(conn)
+                    _migrate_lap_buckets(conn)
+                    backfill_events(conn)
+                    _create_change_triggers(conn)
+                    conn.execute(f"PRAGMA user_version = {fingerprint}")
+                    conn.commit()
+                    _register_existing_shard_rows(conn, cid)
+            finally:
+                conn.close()
+            _harden_sidecar_files(path)
+    logger.info("Database initialised at %s%s", _db_path(), " (schema current)" if current else "")
+
+
+def _register_existing_shard_rows(shard: sqlite3.Connection, competition_id: str) -> None:
+    """Fill the catalog's shard_rows for shards created before it existed."""
+    ids = [(r[0], competition_id) for r in shard.execute("SELECT id FROM teams UNION ALL SELECT id FROM swimmers")]
+    with _connect(_db_path()) as main:
+        main.executemany("INSERT OR IGNORE INTO shard_rows (id, competition_id) VALUES (?,?)", ids)
+    main.close()
+
+
+def _close_duplicate_active_sessions(conn: sqlite3.Connection) -> None:
+    """
+    Older databases may hold two active sessions for one team (the check and
+    the insert used to be separate). Keep the newest so the partial unique
+    index in competition_schema.sql can be created. Each closed session gets
+    its session_ended event, as in swim_sessions.close_active_sessions; a
+    competition without a log yet gets them from events.backfill_events.
+    """
+    from events import append_event, SESSION_ENDED  # events imports this module
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    if "swim_sessions" not in tables:
+        return
+    duplicates = conn.execute(
+        """SELECT id, competition_id, team_id, swimmer_id, lane_number,
+                  COALESCE(end_time, strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+           FROM swim_sessions WHERE is_active=1 AND EXISTS (
+               SELECT 1 FROM swim_sessions newer
+               WHERE newer.competition_id=swim_sessions.competition_id
+                 AND newer.team_id=swim_sessions.team_id AND newer.is_active=1
+                 AND (newer.start_time, newer.id) > (swim_sessions.start_time, swim_sessions.id))"""
+    ).fetchall()
+    for sess_id, cid, team_id, swimmer_id, lane_number, end_time in duplicates:
+        conn.execute("UPDATE swim_sessions SET is_active=0, end_time=? WHERE id=?", (end_time, sess_id))
+        if "events" in tables and conn.execute(
+            "SELECT 1 FROM events WHERE competition_id=? LIMIT 1", (cid,)
+        ).fetchone():
+            append_event(conn, cid, SESSION_ENDED, entity_id=sess_id, team_id=team_id,
+                         swimmer_id=swimmer_id, lane_number=lane_number, timestamp=end_time)
+    if duplicates:
+        logger.warning("Closed %d duplicate active swim sessions", len(duplicates))
+    conn.commit()
+
+
+# Columns added after the first release: (table, column, declaration).
+# schema.sql has them too; this brings older databases up to date.
+_ADDED_COLUMNS = (
+    ("competitions", "archived_at", "TEXT"),
+    ("competitions", "sharded",     "INTEGER NOT NULL DEFAULT 0"),
+    ("lap_counts",   "session_id",  "TEXT"),
+    ("lap_counts",   "voided_at",   "TEXT"),
+    ("lap_counts",   "voided_by",   "TEXT"),
+    ("lap_counts",   "void_reason", "TEXT"),
+    ("team_totals",  "last_lap_at", "TEXT"),
+    ("team_totals",  "ewma_interval_s", "REAL"),
+    ("competitions", "timezone",    "TEXT"),
+    ("lap_counts",   "local_hour",  "INTEGER"),
+)
+
+# Indexes on added columns; created after the columns exist, so they cannot
+# live in the schema files that run first. The partial indexes over counted
+# laps also list voided_at (always NULL in them): SQLite only treats an index
+# as covering when every column the query mentions is in it.
+_ADDED_INDEXES = (
+    # Bird counts (stats._bird_laps)
+    """CREATE INDEX IF NOT EXISTS idx_lap_counts_local_hour
+       ON lap_counts(competition_id, local_hour, team_id, swimmer_id, voided_at) WHERE voided_at IS NULL""",
+    # Stats and live-model reads of a competition's counted laps in time order
+    """CREATE INDEX IF NOT EXISTS idx_lap_counts_counted
+       ON lap_counts(competition_id, timestamp, team_id, swimmer_id, local_hour, voided_at)
+       WHERE voided_at IS NULL""",
+)
+
+# One-off fills for columns that are derivable from existing rows.
+_ADDED_COLUMN_BACKFILLS = {
+    ("lap_counts", "session_id"): """
+        UPDATE lap_counts SET session_id = (
+            SELECT ss.id FROM swim_sessions ss
+            WHERE ss.competition_id=lap_counts.competition_id AND ss.team_id=lap_counts.team_id
+              AND ss.swimmer_id=lap_counts.swimmer_id AND ss.lane_number=lap_counts.lane_number
+              AND ss.start_time<=lap_counts.timestamp
+              AND (ss.end_time IS NULL OR ss.end_time>=lap_counts.timestamp)
+            ORDER BY ss.start_time DESC LIMIT 1)
+    """,
+    ("lap_counts", "local_hour"): f"UPDATE lap_counts SET local_hour = {LOCAL_HOUR_UTC_SQL}",
+    ("team_totals", "last_lap_at"): """
+        UPDATE team_totals SET last_lap_at = (
+            SELECT MAX(timestamp) FROM main.lap_counts l
+            WHERE l.competition_id=team_totals.competition_id AND l.team_id=team_totals.team_id
+              AND l.voided_at IS NULL)
+    """,
+    # Seed the smoothed interval with the plain average interval so far.
+    ("team_totals", "ewma_interval_s"): """
+        UPDATE team_totals SET ewma_interval_s = (
+            SELECT (strftime('%s', MAX(timestamp)) - strftime('%s', MIN(timestamp))) * 1.0
+                   / NULLIF(COUNT(*) - 1, 0)
+            FROM main.lap_counts l
+            WHERE l.competition_id=team_totals.competition_id AND l.team_id=team_totals.team_id
+              AND l.voided_at IS NULL)
+    """,
+}
+
+
+def _migrate_added_columns(conn: sqlite3.Connection) -> None:
+    """Tables missing from this database (e.g. catalog tables in a shard) are skipped."""
+    for table, column, decl in _ADDED_COLUMNS:
+        cols = {c["name"] for c in conn.execute(f"PRAGMA main.table_info({table})").fetchall()}
+        if cols and column not in cols:
+            logger.info("Applying migration: %s.%s", table, column)
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+            if (table, column) in _ADDED_COLUMN_BACKFILLS:
+                with change_trigger_paused(conn, table):
+                    conn.execute(_ADDED_COLUMN_BACKFILLS[(table, column)])
+    for ddl in _ADDED_INDEXES:
+        conn.execute(ddl)
+
+
+def _create_change_triggers(conn: sqlite3.Connection) -> None:
+    """After the migrations: their backfills must not log a change row per row."""
+    with open(CHANGE_TRIGGERS_PATH, "r") as f:
+        conn.executescript(f.read())
+
+
+@contextmanager
+def change_trigger_paused(conn: sqlite3.Connection, table: str):
+    """
+    Run a bulk UPDATE of `table` without its per-row change rows (files that
+    already have change_triggers.sql). The trigger is dropped and recreated
+    inside one transaction, so no other writer runs without it; the caller
+    logs a single change row if readers must hear of the update.
+    """
+    name = f"trg_{table}_update"
+    row  = conn.execute("SELECT sql FROM main.sqlite_master WHERE type='trigger' AND name=?", (name,)).fetchone()
+    if row is None:
+        yield
+        return
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute(f"DROP TRIGGER main.{name}")
+    yield
+    conn.execute(row[0])
+
+
+def _migrate_lap_buckets(conn: sqlite3.Connection) -> None:
+    """Fill lap_buckets (5m and 1h) for laps recorded before it existed."""
+    if conn.execute("SELECT 1 FROM lap_buckets LIMIT 1").fetchone():
+        return
+    if not conn.execute("SELECT 1 FROM main.lap_counts LIMIT 1").fetchone():
+        return
+    logger.info("Applying migration: lap buckets")
+    for size in (300, 3600):
+        conn.execute(
+            """INSERT INTO lap_buckets (competition_id, size, bucket, team_id, laps)
+               SELECT competition_id, ?, CAST(strftime('%s', timestamp) AS INTEGER) / ? * ?, team_id, COUNT(*)
+               FROM main.lap_counts WHERE voided_at IS NULL
+               GROUP BY 1, 3, 4""",
+            (size, size, size),
+        )
+
+
+def _migrate_lap_totals(conn: sqlite3.Connection) -> None:
+    """
+    Fill team_totals / swimmer_totals for laps recorded before they existed,
+    and give every team / swimmer a row (the leaderboard reads only these).
+    """
+    conn.execute(
+        """INSERT OR IGNORE INTO team_totals (competition_id, team_id, laps)
+           SELECT competition_id, id, 0 FROM teams"""
+    )
+    conn.execute(
+        """INSERT OR IGNORE INTO swimmer_totals (competition_id, swimmer_id, team_id, laps)
+           SELECT competition_id, id, team_id, 0 FROM swimmers"""
+    )
+    if conn.execute("SELECT 1 FROM team_totals WHERE laps > 0 LIMIT 1").fetchone():
+        return
+    if not conn.execute("SELECT 1 FROM main.lap_counts LIMIT 1").fetchone():
+        return
+    logger.info("Applying migration: lap totals")
+    conn.execute(
+        """INSERT OR REPLACE INTO team_totals (competition_id, team_id, laps)
+           SELECT competition_id, team_id, COUNT(*) FROM main.lap_counts
+           WHERE voided_at IS NULL GROUP BY competition_id, team_id"""
+    )
+    conn.execute(
+        """INSERT OR REPLACE INTO swimmer_totals (competition_id, swimmer_id, team_id, laps)
+           SELECT competition_id, swimmer_id, team_id, COUNT(*) FROM main.lap_counts
+           WHERE voided_at IS NULL GROUP BY competition_id, swimmer_id"""
+    )
 
 
 def _is_secure_password_hash(value: str) -> bool:
@@ -172,9 +927,7 @@ def _migrate_lap_counts_referee_fk(conn: sqlite3.Connection) -> None:
         DROP TABLE lap_counts;
         ALTER TABLE lap_counts_new RENAME TO lap_counts;
 
-        CREATE INDEX IF NOT EXISTS idx_lap_counts_competition ON lap_counts(competition_id);
-        CREATE INDEX IF NOT EXISTS idx_lap_counts_team ON lap_counts(team_id);
-        CREATE INDEX IF NOT EXISTS idx_lap_counts_timestamp ON lap_counts(competition_id, team_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_lap_counts_team_time ON lap_counts(team_id, timestamp);
         """
     )
 
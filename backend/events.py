@@ -0,0 +1,348 @@
+"""
+events.py - Append-only competition event log and replay
+GET  /competitions/<id>/events        (?after=<seq>&limit=)
+GET  /competitions/<id>/standings     (?at=<ISO timestamp>, default now)
+POST /competitions/<id>/rebuild       — recompute derived counters from the log (409 once archived)
+
+Every write that changes the counters appends an event in the same
+transaction: lap_recorded, lap_voided, lap_reassigned, session_started,
+session_ended and status_changed. `fold()` turns events into the counter state
+(laps per team, swimmer and session, open sessions, status). Every
+CHECKPOINT_EVERY seqs (at most that many events of the competition) the fold
+state is stored in `event_checkpoints`, so a replay up to any point in time
+starts from the nearest earlier checkpoint instead of the first event.
+"""
+
+import json
+import logging
+from collections import defaultdict
+from flask import Blueprint, request
+from database import get_db
+from stats import refresh_results_snapshot, recompute_lap_rate, bucket_start, TIMESERIES_BUCKETS
+from utils import ok, error, not_found, conflict, parse_utc, utc_now_iso
+
+events_bp = Blueprint("events", __name__)
+logger    = logging.getLogger(__name__)
+
+LAP_RECORDED    = "lap_recorded"
+LAP_VOIDED      = "lap_voided"
+LAP_REASSIGNED  = "lap_reassigned"
+SESSION_STARTED = "session_started"
+SESSION_ENDED   = "session_ended"
+STATUS_CHANGED  = "status_changed"
+
+CHECKPOINT_EVERY = 500
+
+
+# ── Writing ───────────────────────────────────────────────────────────────────
+def append_event(db, competition_id: str, type_: str, *, entity_id=None,
+                 team_id=None, swimmer_id=None, lane_number=None,
+                 payload: dict | None = None, timestamp: str | None = None) -> int:
+    """
+    Append one event inside the caller's transaction; returns its seq. Writes
+    go to main: for an archived competition `events` is a read-only view.
+    """
+    cur = db.execute(
+        """INSERT INTO main.events
+           (competition_id, type, entity_id, team_id, swimmer_id, lane_number, payload, timestamp)
+           VALUES (?,?,?,?,?,?,?,?)""",
+        (competition_id, type_, entity_id, team_id, swimmer_id, lane_number,
+         json.dumps(payload, separators=(",", ":")) if payload else None,
+         timestamp or utc_now_iso()),
+    )
+    seq = cur.lastrowid
+    # Two index lookups instead of counting the events since the checkpoint:
+    # seqs are shared by the competitions of a file, so `seq - last_cp` is an
+    # upper bound of the events pending and a checkpoint may come early.
+    last_cp = db.execute(
+        """SELECT COALESCE((SELECT MAX(seq) FROM event_checkpoints WHERE competition_id=?),
+                           (SELECT MIN(seq) - 1 FROM events WHERE competition_id=?))""",
+        (competition_id, competition_id),
+    ).fetchone()[0]
+    if seq - last_cp >= CHECKPOINT_EVERY:
+        write_checkpoint(db, competition_id)
+    return seq
+
+
+def write_checkpoint(db, competition_id: str) -> dict:
+    state = replay(db, competition_id)
+    db.execute(
+        "INSERT OR REPLACE INTO main.event_checkpoints (competition_id, seq, timestamp, state) VALUES (?,?,?,?)",
+        (competition_id, state["seq"], state["timestamp"] or utc_now_iso(),
+         json.dumps(state, separators=(",", ":"))),
+    )
+    return state
+
+
+# ── Folding ───────────────────────────────────────────────────────────────────
+def empty_state() -> dict:
+    return {"seq": 0, "timestamp": None, "status": None,
+            "teams": {}, "swimmers": {}, "sessions": {}}
+
+
+def _credit(state: dict, team_id: str, swimmer_id: str, session_id: str | None, delta: int) -> None:
+    teams, swimmers = state["teams"], state["swimmers"]
+    teams[team_id]       = teams.get(team_id, 0) + delta
+    swimmers[swimmer_id] = swimmers.get(swimmer_id, 0) + delta
+    session = state["sessions"].get(session_id)
+    if session:
+        session["laps"] += delta
+
+
+def apply(state: dict, ev: dict) -> dict:
+    """Fold one event (a row of `events`) into `state` in place."""
+    kind    = ev["type"]
+    payload = json.loads(ev["payload"]) if ev.get("payload") else {}
+    if kind in (LAP_RECORDED, LAP_VOIDED):
+        _credit(state, ev["team_id"], ev["swimmer_id"], payload.get("sessionId"),
+                1 if kind == LAP_RECORDED else -1)
+    elif kind == LAP_REASSIGNED:
+        old = payload["from"]
+        _credit(state, old["teamId"], old["swimmerId"], old.get("sessionId"), -1)
+        _credit(state, ev["team_id"], ev["swimmer_id"], payload.get("sessionId"), 1)
+    elif kind == SESSION_STARTED:
+        previous = state["sessions"].get(ev["entity_id"])   # reopened session keeps its laps
+        state["sessions"][ev["entity_id"]] = {
+            "teamId": ev["team_id"], "swimmerId": ev["swimmer_id"],
+            "laneNumber": ev["lane_number"], "laps": previous["laps"] if previous else 0,
+            "active": True,
+        }
+    elif kind == SESSION_ENDED:
+        session = state["sessions"].get(ev["entity_id"])
+        if session:
+            session["active"] = False
+    elif kind == STATUS_CHANGED:
+        state["status"] = payload.get("to")
+    state["seq"]       = ev["seq"]
+    state["timestamp"] = ev["timestamp"]
+    return state
+
+
+def fold(events, state: dict | None = None) -> dict:
+    state = state if state is not None else empty_state()
+    for ev in events:
+        apply(state, dict(ev))
+    return state
+
+
+def replay(db, competition_id: str, at: str | None = None) -> dict:
+    """
+    Fold state as of timestamp `at` (inclusive; None = everything). Starts
+    from the newest checkpoint that holds no event after `at` and reads only
+    later events. Timestamps do not grow with seq (client end times,
+    backfilled logs), so that is the checkpoint before the first such event,
+    not the one with the newest timestamp.
+    """
+    cp_query  = "SELECT seq, state FROM event_checkpoints WHERE competition_id=?"
+    ev_query  = "SELECT * FROM events WHERE competition_id=? AND seq>?"
+    cp_params = [competition_id]
+    if at:
+        first_after = db.execute(
+            "SELECT MIN(seq) FROM events WHERE competition_id=? AND timestamp > ?", (competition_id, at)
+        ).fetchone()[0]
+        if first_after is not None:
+            cp_query += " AND seq < ?"; cp_params.append(first_after)
+    cp = db.execute(cp_query + " ORDER BY seq DESC LIMIT 1", cp_params).fetchone()
+    state = json.loads(cp["state"]) if cp else empty_state()
+
+    ev_params = [competition_id, state["seq"]]
+    if at:
+        ev_query += " AND timestamp <= ?"; ev_params.append(at)
+    return fold(db.execute(ev_query + " ORDER BY seq", ev_params), state)
+
+
+def rebuild_counters(db, competition_id: str) -> dict:
+    """
+    Reset swim_sessions.lap_count and the team/swimmer totals from the log,
+    and the lap buckets and per-team lap rate from the counted laps; returns
+    the number of rows corrected per counter.
+    """
+    state   = replay(db, competition_id)
+    changed = {"sessions": 0, "teams": 0, "swimmers": 0, "buckets": 0, "lapRates": 0}
+    for row in db.execute(
+        "SELECT id, lap_count FROM swim_sessions WHERE competition_id=?", (competition_id,)
+    ).fetchall():
+        session = state["sessions"].get(row["id"])
+        laps    = session["laps"] if session else 0
+        if laps != row["lap_count"]:
+            db.execute("UPDATE swim_sessions SET lap_count=? WHERE id=?", (laps, row["id"]))
+            changed["sessions"] += 1
+
+    for row in db.execute(
+        """SELECT t.id, tt.laps FROM teams t
+           LEFT JOIN team_totals tt ON tt.competition_id=t.competition_id AND tt.team_id=t.id
+           WHERE t.competition_id=?""", (competition_id,)
+    ).fetchall():
+        laps = state["teams"].get(row["id"], 0)
+        if laps != (row["laps"] or 0):
+            db.execute(
+                """INSERT INTO team_totals (competition_id, team_id, laps) VALUES (?,?,?)
+                   ON CONFLICT(competition_id, team_id) DO UPDATE SET laps=excluded.laps""",
+                (competition_id, row["id"], laps),
+            )
+            changed["teams"] += 1
+
+    for row in db.execute(
+        """SELECT s.id, s.team_id, st.laps FROM swimmers s
+           LEFT JOIN swimmer_totals st ON st.competition_id=s.competition_id AND st.swimmer_id=s.id
+           WHERE s.competition_id=?""", (competition_id,)
+    ).fetchall():
+        laps = state["swimmers"].get(row["id"], 0)
+        if laps != (row["laps"] or 0):
+            db.execute(
+                """INSERT INTO swimmer_totals (competition_id, swimmer_id, team_id, laps) VALUES (?,?,?,?)
+                   ON CONFLICT(competition_id, swimmer_id) DO UPDATE SET laps=excluded.laps""",
+                (competition_id, row["id"], row["team_id"], laps),
+            )
+            changed["swimmers"] += 1
+
+    buckets = defaultdict(int)
+    for row in db.execute(
+        "SELECT team_id, timestamp FROM lap_counts WHERE competition_id=? AND voided_at IS NULL",
+        (competition_id,),
+    ):
+        for size in TIMESERIES_BUCKETS.values():
+            buckets[(size, bucket_start(row["timestamp"], size), row["team_id"])] += 1
+    for row in db.execute(
+        "SELECT size, bucket, team_id, laps FROM lap_buckets WHERE competition_id=?", (competition_id,)
+    ).fetchall():
+        buckets.setdefault((row["size"], row["bucket"], row["team_id"]), 0)
+        if buckets[(row["size"], row["bucket"], row["team_id"])] == row["laps"]:
+            del buckets[(row["size"], row["bucket"], row["team_id"])]
+    for (size, bucket, team_id), laps in buckets.items():
+        db.execute(
+            """INSERT INTO lap_buckets (competition_id, size, bucket, team_id, laps) VALUES (?,?,?,?,?)
+               ON CONFLICT(competition_id, size, bucket, team_id) DO UPDATE SET laps=excluded.laps""",
+            (competition_id, size, bucket, team_id, laps),
+        )
+        changed["buckets"] += 1
+
+    for row in db.execute("SELECT id FROM teams WHERE competition_id=?", (competition_id,)).fetchall():
+        if recompute_lap_rate(db, competition_id, row["id"]):
+            changed["lapRates"] += 1
+    return changed
+
+
+# ── Backfill ──────────────────────────────────────────────────────────────────
+def backfill_events(conn) -> int:
+    """
+    Synthesize the log for competitions recorded before it existed, from
+    swim_sessions and lap_counts (each lap is attached to the session that
+    covered it). Runs from init_db; competitions with events are skipped.
+    """
+    cids = [r[0] for r in conn.execute(
+        """SELECT competition_id FROM swim_sessions UNION SELECT competition_id FROM lap_counts
+           EXCEPT SELECT competition_id FROM events"""
+    ).fetchall()]
+    total = 0
+    for cid in cids:
+        rows = []
+        for s in conn.execute("SELECT * FROM swim_sessions WHERE competition_id=?", (cid,)):
+            rows.append((s["start_time"], 0, SESSION_STARTED, s["id"], s, None))
+            if not s["is_active"] and s["end_time"]:
+                rows.append((s["end_time"], 2, SESSION_ENDED, s["id"], s, None))
+        for lap in conn.execute(
+            """SELECT l.*, (SELECT ss.id FROM swim_sessions ss
+                            WHERE ss.competition_id=l.competition_id AND ss.team_id=l.team_id
+                              AND ss.swimmer_id=l.swimmer_id AND ss.lane_number=l.lane_number
+                              AND ss.start_time<=l.timestamp
+                              AND (ss.end_time IS NULL OR ss.end_time>=l.timestamp)
+                            ORDER BY ss.start_time DESC LIMIT 1) AS session_id
+               FROM lap_counts l WHERE l.competition_id=?""", (cid,)
+        ):
+            payload = {"lapNumber": lap["lap_number"], "sessionId": lap["session_id"]}
+            rows.append((lap["timestamp"], 1, LAP_RECORDED, lap["id"], lap, payload))
+        rows.sort(key=lambda r: (r[0], r[1]))
+        for ts, _, kind, entity_id, src, payload in rows:
+            append_event(conn, cid, kind, entity_id=entity_id, team_id=src["team_id"],
+                         swimmer_id=src["swimmer_id"], lane_number=src["lane_number"],
+                         payload=payload, timestamp=ts)
+        total += len(rows)
+        logger.info("Backfilled %d events for competition %s", len(rows), cid)
+    return total
+
+
+# ── Routes ────────────────────────────────────────────────────────────────────
+def _competition_exists(db, cid: str) -> bool:
+    return db.execute("SELECT 1 FROM competitions WHERE id=?", (cid,)).fetchone() is not None
+
+
+def _serialize_event(row: dict) -> dict:
+    return {
+        "seq":        row["seq"],
+        "type":       row["type"],
+        "entityId":   row["entity_id"],
+        "teamId":     row["team_id"],
+        "swimmerId":  row["swimmer_id"],
+        "laneNumber": row["lane_number"],
+        "payload":    json.loads(row["payload"]) if row["payload"] else None,
+        "timestamp":  row["timestamp"],
+    }
+
+
+@events_bp.route("/competitions/<cid>/events", methods=["GET"])
+def list_events(cid):
+    after = request.args.get("after", 0, type=int)
+    limit = min(request.args.get("limit", 1000, type=int), 10000)
+    with get_db(cid) as db:
+        if not _competition_exists(db, cid):
+            return not_found("Competition")
+        rows = db.execute(
+            "SELECT * FROM events WHERE competition_id=? AND seq>? ORDER BY seq LIMIT ?",
+            (cid, after, limit),
+        ).fetchall()
+    return ok([_serialize_event(dict(r)) for r in rows])
+
+
+@events_bp.route("/competitions/<cid>/standings", methods=["GET"])
+def standings(cid):
+    """Team and swimmer lap totals as of `at`, replayed from the event log."""
+    at = request.args.get("at")
+    if at:
+        parsed = parse_utc(at)
+        if not parsed:
+            return error("Invalid 'at' timestamp")
+        at = parsed.strftime("%Y-%m-%dT%H:%M:%SZ")
+    with get_db(cid) as db:
+        if not _competition_exists(db, cid):
+            return not_found("Competition")
+        state    = replay(db, cid, at)
+        teams    = {r["id"]: dict(r) for r in db.execute(
+            "SELECT id, name, color, assigned_lane FROM teams WHERE competition_id=?", (cid,))}
+        swimmers = {r["id"]: dict(r) for r in db.execute(
+            "SELECT id, name, team_id FROM swimmers WHERE competition_id=?", (cid,))}
+
+    team_rows = sorted(
+        ({"team": {"id": tid, "name": t["name"], "color": t["color"], "assignedLane": t["assigned_lane"]},
+          "totalLaps": state["teams"].get(tid, 0)} for tid, t in teams.items()),
+        key=lambda x: x["totalLaps"], reverse=True,
+    )
+    swimmer_rows = sorted(
+        ({"swimmer": {"id": sid, "name": s["name"], "teamId": s["team_id"]},
+          "totalLaps": state["swimmers"].get(sid, 0)} for sid, s in swimmers.items()),
+        key=lambda x: x["totalLaps"], reverse=True,
+    )
+    return ok({
+        "at":        at or utc_now_iso(),
+        "seq":       state["seq"],
+        "status":    state["status"],
+        "totalLaps": sum(state["teams"].get(tid, 0) for tid in teams),
+        "teams":     team_rows,
+        "swimmers":  swimmer_rows,
+    })
+
+
+@events_bp.route("/competitions/<cid>/rebuild", methods=["POST"])
+def rebuild(cid):
+    with get_db(cid) as db:
+        comp = db.execute("SELECT archived_at FROM competitions WHERE id=?", (cid,)).fetchone()
+        if comp is None:
+            return not_found("Competition")
+        if comp["archived_at"]:
+            return conflict("Competition is archived; its counters are read-only")
+        changed = rebuild_counters(db, cid)
+        if any(changed.values()):
+            refresh_results_snapshot(db, cid)
+        db.commit()
+    logger.info("Counters rebuilt for %s: %s", cid, changed)
+    return ok({"competitionId": cid, "corrected": changed})
@@ -0,0 +1,117 @@
+"""
+lanes.py - Per-lane referee view
+GET /competitions/<cid>/lanes/<n>/state
+
+Everything a lane referee needs in one response — the teams on the lane with
+their rosters, active session, lap total and remaining double-count cooldown —
+read inside a single transaction so the parts are consistent with each other.
+The response carries an ETag; a matching If-None-Match returns 304.
+"""
+
+import json
+import hashlib
+import logging
+from datetime import datetime, timezone
+from flask import Blueprint, Response, request
+from database import get_db
+from utils import not_found, parse_utc, serialize_session
+
+lanes_bp = Blueprint("lanes", __name__)
+logger   = logging.getLogger(__name__)
+
+
+def lane_state(db, comp: dict, lane_number: int, now: datetime) -> dict:
+    cid   = comp["id"]
+    teams = [dict(r) for r in db.execute(
+        """SELECT t.id, t.name, t.color, COALESCE(tt.laps, 0) AS laps
+           FROM teams t LEFT JOIN team_totals tt ON tt.competition_id = t.competition_id AND tt.team_id = t.id
+           WHERE t.competition_id=? AND t.assigned_lane=? ORDER BY t.name""",
+        (cid, lane_number),
+    ).fetchall()]
+    ids = [t["id"] for t in teams]
+    rosters, sessions, last_laps = {}, {}, {}
+    if ids:
+        placeholders = ",".join("?" * len(ids))
+        for r in db.execute(
+            f"""SELECT id, name, team_id, is_under_12, parent_present FROM swimmers
+                WHERE team_id IN ({placeholders}) ORDER BY name""", ids,
+        ):
+            rosters.setdefault(r["team_id"], []).append({
+                "id":            r["id"],
+                "name":          r["name"],
+                "isUnder12":     bool(r["is_under_12"]),
+                "parentPresent": bool(r["parent_present"]),
+            })
+        for r in db.execute(
+            f"""SELECT * FROM swim_sessions
+                WHERE competition_id=? AND is_active=1 AND team_id IN ({placeholders})""", (cid, *ids),
+        ):
+            sessions[r["team_id"]] = serialize_session(dict(r))
+        # Same rule as record_lap: the newest non-voided lap starts the cooldown.
+        last_laps = {r[0]: r[1] for r in db.execute(
+            f"""SELECT team_id, MAX(timestamp) FROM lap_counts
+                WHERE competition_id=? AND voided_at IS NULL AND team_id IN ({placeholders})
+                GROUP BY team_id""", (cid, *ids),
+        )}
+
+    timeout_s = int(comp["double_count_timeout"])
+
+    def cooldown(team_id: str) -> int:
+        last = parse_utc(last_laps.get(team_id))
+        if timeout_s <= 0 or last is None:
+            return 0
+        return max(0, int(timeout_s - (now - last).total_seconds()) + 1)
+
+    return {
+        "competitionId":      cid,
+        "laneNumber":         lane_number,
+        "status":             comp["status"],
+        "doubleCountTimeout": timeout_s,
+        "teams": [{
+            "id":                 t["id"],
+            "name":               t["name"],
+            "color":              t["color"],
+            "totalLaps":          t["laps"],
+            "lastLapAt":          last_laps.get(t["id"]),
+            "cooldownRemaining":  cooldown(t["id"]),
+            "activeSession":      sessions.get(t["id"]),
+            "swimmers":           rosters.get(t["id"], []),
+        } for t in teams],
+    }
+
+
+def load_lane_state(cid: str, lane_number: int) -> tuple[str | None, str | None]:
+    """
+    (JSON payload, ETag) of a lane's state, or (None, missing resource name).
+    """
+    now = datetime.now(timezone.utc)
+    with get_db(cid) as db:
+        # One read transaction: every query below sees the same snapshot.
+        db.execute("BEGIN")
+        try:
+            comp = db.execute("SELECT * FROM competitions WHERE id=?", (cid,)).fetchone()
+            if not comp:
+                return None, "Competition"
+            comp = dict(comp)
+            if not 1 <= lane_number <= int(comp["number_of_lanes"]):
+                return None, "Lane"
+            data = lane_state(db, comp, lane_number, now)
+        finally:
+            db.rollback()
+
+    payload = json.dumps({"data": data}, separators=(",", ":"))
+    return payload, hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+@lanes_bp.route("/competitions/<cid>/lanes/<int:lane_number>/state", methods=["GET"])
+def get_lane_state(cid, lane_number):
+    payload, etag = load_lane_state(cid, lane_number)
+    if payload is None:
+        return not_found(etag)           # etag holds the missing resource's name
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(payload, status=200, mimetype="application/json")
+    resp.headers["ETag"]          = f'"{etag}"'
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
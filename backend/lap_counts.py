@@ -1,26 +1,193 @@
 """
 lap_counts.py - Lap counting endpoints
-GET  /lap-counts
-POST /lap-counts   — session check first, then double-count (429), then insert
+GET    /lap-counts                    (?includeVoided=1 also returns voided laps)
+POST   /lap-counts                    — session check first, then double-count (429), then a
+                                        group-committed insert (write_queue.py)
+DELETE /lap-counts/<id>               — soft void, kept for audit
+POST   /lap-counts/<id>/reassign      — credit the lap to another swimmer/team
 """
 
 import logging
+import sqlite3
+from collections import namedtuple
 from datetime import datetime, timezone
 from flask import Blueprint, request
-from database import get_db
-from utils import new_uuid, ok, created, error, too_many_requests, serialize_lap_count
+from database import get_db, locate_competition, change_trigger_paused
+import repository
+from events import append_event, LAP_RECORDED, LAP_VOIDED, LAP_REASSIGNED
+import live as live_state
+from stats import (
+    refresh_results_snapshot, bucket_start, update_lap_rate, recompute_lap_rate, TIMESERIES_BUCKETS,
+)
+from write_queue import WriteQueue
+from utils import (
+    new_uuid, ok, created, error, not_found, conflict, too_many_requests,
+    serialize_lap_count, utc_now_iso, local_hour, parse_utc, zone,
+)
 
 lap_counts_bp = Blueprint("lap_counts", __name__)
 logger        = logging.getLogger(__name__)
 
 
-def _parse_utc(ts: str):
-    if not ts:
-        return None
+# ── Counters ──────────────────────────────────────────────────────────────────
+# Every lap write adjusts the materialized counters by ±1 instead of recounting.
+
+def _credit(db, competition_id: str, team_id: str, swimmer_id: str,
+            session_id: str | None, timestamp: str, delta: int) -> None:
+    db.execute(
+        """INSERT INTO team_totals (competition_id, team_id, laps) VALUES (?,?,?)
+           ON CONFLICT(competition_id, team_id) DO UPDATE SET laps = laps + excluded.laps""",
+        (competition_id, team_id, delta),
+    )
+    db.execute(
+        """INSERT INTO swimmer_totals (competition_id, swimmer_id, team_id, laps) VALUES (?,?,?,?)
+           ON CONFLICT(competition_id, swimmer_id) DO UPDATE SET laps = laps + excluded.laps,
+                                                                team_id = excluded.team_id""",
+        (competition_id, swimmer_id, team_id, delta),
+    )
+    for size in TIMESERIES_BUCKETS.values():
+        db.execute(
+            """INSERT INTO lap_buckets (competition_id, size, bucket, team_id, laps) VALUES (?,?,?,?,?)
+               ON CONFLICT(competition_id, size, bucket, team_id) DO UPDATE SET laps = laps + excluded.laps""",
+            (competition_id, size, bucket_start(timestamp, size), team_id, delta),
+        )
+    if session_id:
+        db.execute("UPDATE swim_sessions SET lap_count = lap_count + ? WHERE id=?", (delta, session_id))
+
+
+def _shift_lap_numbers(db, competition_id: str, team_id: str, from_number: int, delta: int) -> None:
+    """
+    Renumber the team's later laps (lap_number >= from_number) by `delta`.
+
+    Stored lap numbers keep every read (lists, live model, events) a plain
+    column read, at the price of rewriting the k laps after a voided or
+    reassigned one. Both are rare corrections, and idx_lap_counts_number
+    keeps the rewrite to the affected rows.
+    """
+    db.execute(
+        """UPDATE lap_counts SET lap_number = lap_number + ?
+           WHERE competition_id=? AND team_id=? AND voided_at IS NULL AND lap_number >= ?""",
+        (delta, competition_id, team_id, from_number),
+    )
+
+
+def insert_lap(db, competition_id: str, lane_number: int, team_id: str, swimmer_id: str,
+               referee_id: str, lap_number: int, session_id: str, timestamp: str, tz) -> str:
+    """
+    Insert one validated lap with its counter updates and event; caller commits.
+    `tz` is the competition's zone() (from the live model), for local_hour.
+    """
+    lap_id = new_uuid()
+    db.execute(
+        """INSERT INTO lap_counts
+           (id, competition_id, lane_number, team_id, swimmer_id, referee_id, lap_number, timestamp, session_id,
+            local_hour)
+           VALUES (?,?,?,?,?,?,?,?,?,?)""",
+        (lap_id, competition_id, lane_number, team_id, swimmer_id, referee_id, lap_number, timestamp, session_id,
+         local_hour(timestamp, tz))
+    )
+    # Only the session the lap was validated against is credited.
+    _credit(db, competition_id, team_id, swimmer_id, session_id, timestamp, 1)
+    update_lap_rate(db, competition_id, team_id, timestamp)
+    append_event(db, competition_id, LAP_RECORDED, entity_id=lap_id, team_id=team_id,
+                 swimmer_id=swimmer_id, lane_number=lane_number, timestamp=timestamp,
+                 payload={"lapNumber": lap_number, "sessionId": session_id})
+    return lap_id
+
+
+# ── Group-committed inserts ───────────────────────────────────────────────────
+# The lap number is always the team's next one, assigned by the writer.
+# zone: the competition's tzinfo as the live model has it.
+PendingLap  = namedtuple("PendingLap", "competition_id lane_number team_id swimmer_id referee_id "
+                                       "session_id timestamp double_count_timeout zone")
+RecordedLap = namedtuple("RecordedLap", "id lap_number")
+
+LAP_WAIT_S = 10      # longest a request waits for its lap to be written
+
+
+class DoubleCount(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _write_pending_lap(db, lap: PendingLap) -> RecordedLap:
+    """
+    Writer side of POST /lap-counts. The double-count timeout and the lap
+    number are taken again inside the write transaction: two taps validated
+    concurrently against the same live model must not both be recorded or get
+    the same number.
+    """
+    if lap.double_count_timeout > 0:
+        last = db.execute(
+            """SELECT timestamp FROM lap_counts WHERE team_id=? AND voided_at IS NULL
+               ORDER BY timestamp DESC LIMIT 1""", (lap.team_id,),
+        ).fetchone()
+        if last:
+            elapsed = (parse_utc(lap.timestamp) - parse_utc(last[0])).total_seconds()
+            if elapsed < lap.double_count_timeout:
+                raise DoubleCount(int(lap.double_count_timeout - max(elapsed, 0)) + 1)
+    total = db.execute("SELECT laps FROM team_totals WHERE competition_id=? AND team_id=?",
+                       (lap.competition_id, lap.team_id)).fetchone()
+    lap_number = (total[0] if total else 0) + 1
+    lap_id = insert_lap(db, lap.competition_id, lap.lane_number, lap.team_id, lap.swimmer_id,
+                        lap.referee_id, lap_number, lap.session_id, lap.timestamp, lap.zone)
+    return RecordedLap(lap_id, lap_number)
+
+
+def _await_lap(future) -> RecordedLap:
+    """
+    Wait up to LAP_WAIT_S for the writer. A timeout is only reported (503) if
+    the lap could still be withdrawn from the queue; once the writer has
+    started on it, a retry would record it twice, so wait for the outcome.
+    """
     try:
-        return datetime.fromisoformat(ts.replace("Z", "+00:00"))
-    except ValueError:
-        return None
+        return future.result(timeout=LAP_WAIT_S)
+    except TimeoutError:
+        if future.cancel():
+            raise
+        return future.result()
+
+
+lap_writes = WriteQueue("laps", _write_pending_lap, after_commit=live_state.catch_up)
+
+
+def localize_laps(db, competition_id: str, tz_name: str | None) -> int:
+    """
+    Recompute local_hour of every lap after a timezone change; caller commits.
+    The change feed gets one competition-level row instead of one per lap.
+    """
+    tz   = zone(tz_name)
+    laps = db.execute("SELECT id, timestamp FROM lap_counts WHERE competition_id=?", (competition_id,)).fetchall()
+    with change_trigger_paused(db, "lap_counts"):
+        db.executemany(
+            "UPDATE lap_counts SET local_hour=? WHERE id=?",
+            [(local_hour(lap["timestamp"], tz), lap["id"]) for lap in laps],
+        )
+    db.execute(
+        "INSERT INTO main.changes (competition_id, entity, entity_id, op) VALUES (?, 'competition', ?, 'update')",
+        (competition_id, competition_id),
+    )
+    return len(laps)
+
+
+def void_laps(db, competition_id: str, reason: str,
+              team_id: str | None = None, swimmer_id: str | None = None) -> int:
+    """
+    Take a team's or a swimmer's laps out of the counters and the log before
+    the team / swimmer (and, by cascade, the laps) is deleted.
+    """
+    column, value = ("team_id", team_id) if team_id else ("swimmer_id", swimmer_id)
+    laps = db.execute(
+        f"SELECT * FROM lap_counts WHERE competition_id=? AND {column}=? AND voided_at IS NULL",
+        (competition_id, value),
+    ).fetchall()
+    for lap in laps:
+        _credit(db, competition_id, lap["team_id"], lap["swimmer_id"], None, lap["timestamp"], -1)
+        append_event(db, competition_id, LAP_VOIDED, entity_id=lap["id"], team_id=lap["team_id"],
+                     swimmer_id=lap["swimmer_id"], lane_number=lap["lane_number"],
+                     payload={"sessionId": lap["session_id"], "reason": reason})
+    return len(laps)
 
 
 @lap_counts_bp.route("/lap-counts", methods=["GET"])
@@ -29,19 +196,15 @@ def list_lap_counts():
     team_id        = request.args.get("teamId")
     swimmer_id     = request.args.get("swimmerId")
 
-    query  = "SELECT * FROM lap_counts WHERE 1=1"
-    params = []
-    if competition_id:
-        query += " AND competition_id = ?"; params.append(competition_id)
-    if team_id:
-        query += " AND team_id = ?";        params.append(team_id)
-    if swimmer_id:
-        query += " AND swimmer_id = ?";     params.append(swimmer_id)
-    query += " ORDER BY timestamp ASC"
+    include_voided = request.args.get("includeVoided", "").lower() in ("1", "true")
 
-    with get_db() as db:
-        rows = db.execute(query, params).fetchall()
-    return ok([serialize_lap_count(dict(r)) for r in rows])
+    cid = (competition_id
+           or (team_id and locate_competition("teams", team_id))
+           or (swimmer_id and locate_competition("swimmers", swimmer_id)))
+    with get_db(cid) as db:
+        rows = repository.list_lap_counts(db, competition_id or None, team_id or None,
+                                          swimmer_id or None, include_voided)
+    return ok(rows)
 
 
 @lap_counts_bp.route("/lap-counts", methods=["POST"])
@@ -52,7 +215,8 @@ def record_lap():
       2. Competition exists & is active      → 404 / 422
       3. Active swim session exists          → 422  (BEFORE double-count)
       4. Double-count timeout per team       → 429 with Retry-After
-      5. Insert + sync session lap_count
+      5. Insert + adjust counters + append lap_recorded event, group-committed
+         by the lap writer, which repeats check 4 and assigns the lap number
     """
     data = request.get_json(silent=True) or {}
 
@@ -67,71 +231,174 @@ def record_lap():
     swimmer_id     = data["swimmerId"]
     referee_id     = data["refereeId"]
 
-    # 1. Competition status
-    with get_db() as db:
-        comp = db.execute(
-            "SELECT status, double_count_timeout FROM competitions WHERE id=?",
-            (competition_id,)
-        ).fetchone()
-
-    if not comp:
-        return error("Competition not found", 404)
-    comp = dict(comp)
-    if comp["status"] != "active":
+    # 1. Competition status — steps 1-4 read the in-memory live model
+    with get_db(competition_id) as db:
+        live = live_state.get(db, competition_id)
+        if live is None:
+            comp = db.execute("SELECT status FROM competitions WHERE id=?", (competition_id,)).fetchone()
+    if live is None:
+        if not comp:
+            return error("Competition not found", 404)
         return error(f"Counting not allowed — competition is {comp['status']}", 422)
-
-    timeout_s = int(comp["double_count_timeout"])
+    status, timeout_s, session, last_lap, _ = live.lap_context(team_id)
+    if status != "active":
+        return error(f"Counting not allowed — competition is {status}", 422)
 
     # 2. Active session must exist (check BEFORE double-count so we return 422, not 429)
-    with get_db() as db:
-        session = db.execute(
-            """SELECT id FROM swim_sessions
-               WHERE competition_id=? AND team_id=? AND swimmer_id=? AND lane_number=? AND is_active=1""",
-            (competition_id, team_id, swimmer_id, lane_number)
-        ).fetchone()
-    if not session:
+    if session is None or session.swimmer_id != swimmer_id or session.lane != lane_number:
         return error("No active swim session found for this swimmer/team/lane", 422)
 
     # 3. Double-count protection
-    if timeout_s > 0:
-        with get_db() as db:
-            last = db.execute(
-                "SELECT timestamp FROM lap_counts WHERE competition_id=? AND team_id=? ORDER BY timestamp DESC LIMIT 1",
-                (competition_id, team_id)
-            ).fetchone()
-        if last:
-            last_ts = _parse_utc(dict(last)["timestamp"])
-            if last_ts:
-                elapsed = (datetime.now(timezone.utc) - last_ts).total_seconds()
-                if elapsed < timeout_s:
-                    retry_after = int(timeout_s - elapsed) + 1
-                    logger.warning("Double count blocked: team=%s elapsed=%.1fs timeout=%ds",
-                                   team_id, elapsed, timeout_s)
-                    return too_many_requests("Double count detected", retry_after)
-
-    # 4. Auto-calculate lap number if not provided
-    with get_db() as db:
-        total = db.execute(
-            "SELECT COUNT(*) FROM lap_counts WHERE competition_id=? AND team_id=?",
-            (competition_id, team_id)
-        ).fetchone()[0]
-    lap_number = int(data["lapNumber"]) if data.get("lapNumber") else (total + 1)
-
-    # 5. Insert lap and sync session counter atomically
-    lap_id  = new_uuid()
-    now_iso = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-
-    with get_db() as db:
+    if timeout_s > 0 and last_lap is not None:
+        elapsed = datetime.now(timezone.utc).timestamp() - last_lap
+        if elapsed < timeout_s:
+            retry_after = int(timeout_s - elapsed) + 1
+            logger.warning("Double count blocked: team=%s elapsed=%.1fs timeout=%ds",
+                           team_id, elapsed, timeout_s)
+            return too_many_requests("Double count detected", retry_after)
+
+    # 4. Insert lap and sync counters atomically; the writer numbers the lap
+    #    (a client-sent lapNumber is ignored: the counter is authoritative)
+    pending = PendingLap(competition_id, lane_number, team_id, swimmer_id, referee_id,
+                         session.id, utc_now_iso(), timeout_s, live.zone)
+    try:
+        lap = _await_lap(lap_writes.submit(competition_id, pending))
+    except DoubleCount as exc:
+        logger.warning("Double count blocked in writer: team=%s", team_id)
+        return too_many_requests("Double count detected", exc.retry_after)
+    except (sqlite3.OperationalError, TimeoutError) as exc:
+        logger.warning("Lap not written: %r", exc)
+        return error("Database busy, please retry", 503)
+
+    with get_db(competition_id) as db:
+        row = db.execute("SELECT * FROM lap_counts WHERE id=?", (lap.id,)).fetchone()
+
+    logger.info("Lap %d: team=%s swimmer=%s lane=%d", lap.lap_number, team_id, swimmer_id, lane_number)
+    return created(serialize_lap_count(dict(row)))
+
+
+def _load_lap_for_edit(db, lap_id: str):
+    """(lap, error response) for a lap that may still be edited."""
+    lap = db.execute("SELECT * FROM lap_counts WHERE id=?", (lap_id,)).fetchone()
+    if not lap:
+        return None, not_found("Lap")
+    lap = dict(lap)
+    comp = db.execute(
+        "SELECT archived_at FROM competitions WHERE id=?", (lap["competition_id"],)
+    ).fetchone()
+    if comp and comp["archived_at"]:
+        return None, conflict("Competition is archived; its laps are read-only")
+    if lap["voided_at"]:
+        return None, conflict("Lap is already voided")
+    return lap, None
+
+
+@lap_counts_bp.route("/lap-counts/<lap_id>", methods=["DELETE"])
+def void_lap(lap_id):
+    """
+    Void a mis-tapped lap. The row stays (voided_at / voided_by / void_reason)
+    and a lap_voided event is logged; counters, the team's later lap numbers
+    and its lap rate are adjusted in place. Laps of sharded competitions need
+    `competitionId` (query string or body).
+    """
+    data = request.get_json(silent=True) or {}
+    cid  = request.args.get("competitionId") or data.get("competitionId")
+    with get_db(cid) as db:
+        lap, err = _load_lap_for_edit(db, lap_id)
+        if err:
+            return err
+        cid = lap["competition_id"]
         db.execute(
-            "INSERT INTO lap_counts (id, competition_id, lane_number, team_id, swimmer_id, referee_id, lap_number, timestamp) VALUES (?,?,?,?,?,?,?,?)",
-            (lap_id, competition_id, lane_number, team_id, swimmer_id, referee_id, lap_number, now_iso)
+            "UPDATE lap_counts SET voided_at=?, voided_by=?, void_reason=? WHERE id=?",
+            (utc_now_iso(), data.get("voidedBy"), data.get("reason"), lap_id),
         )
+        _credit(db, cid, lap["team_id"], lap["swimmer_id"], lap["session_id"], lap["timestamp"], -1)
+        _shift_lap_numbers(db, cid, lap["team_id"], lap["lap_number"] + 1, -1)
+        recompute_lap_rate(db, cid, lap["team_id"])
+        append_event(db, cid, LAP_VOIDED, entity_id=lap_id, team_id=lap["team_id"],
+                     swimmer_id=lap["swimmer_id"], lane_number=lap["lane_number"],
+                     payload={"sessionId": lap["session_id"], "reason": data.get("reason"),
+                              "voidedBy": data.get("voidedBy")})
+        refresh_results_snapshot(db, cid)
+        db.commit()
+        row = db.execute("SELECT * FROM lap_counts WHERE id=?", (lap_id,)).fetchone()
+
+    logger.info("Lap voided: %s (team=%s lap=%d)", lap_id, lap["team_id"], lap["lap_number"])
+    return ok(serialize_lap_count(dict(row)))
+
+
+@lap_counts_bp.route("/lap-counts/<lap_id>/reassign", methods=["POST"])
+def reassign_lap(lap_id):
+    """
+    Credit a lap to another swimmer (and their team). The lap keeps its
+    timestamp; lap numbers of both teams after it are shifted by one and
+    both teams' lap rates are recomputed.
+    """
+    data = request.get_json(silent=True) or {}
+    if not data.get("swimmerId"):
+        return error("Missing required fields: swimmerId")
+
+    # Reassignment stays within the competition, so the new swimmer locates it.
+    cid = data.get("competitionId") or locate_competition("swimmers", data["swimmerId"])
+    with get_db(cid) as db:
+        lap, err = _load_lap_for_edit(db, lap_id)
+        if err:
+            return err
+        cid     = lap["competition_id"]
+        swimmer = db.execute(
+            "SELECT id, team_id FROM swimmers WHERE id=? AND competition_id=?",
+            (data["swimmerId"], cid),
+        ).fetchone()
+        if not swimmer:
+            return error("Swimmer not found in this competition", 404)
+        team_id = data.get("teamId") or swimmer["team_id"]
+        if team_id != swimmer["team_id"]:
+            return error("Swimmer does not belong to this team")
+        if (team_id, swimmer["id"]) == (lap["team_id"], lap["swimmer_id"]):
+            return ok(serialize_lap_count(lap))
+
+        # Session of the new swimmer that covered the lap's time, if any.
+        session = db.execute(
+            """SELECT id, lane_number FROM swim_sessions
+               WHERE competition_id=? AND team_id=? AND swimmer_id=? AND start_time<=?
+                 AND (end_time IS NULL OR end_time>=?)
+               ORDER BY start_time DESC LIMIT 1""",
+            (cid, team_id, swimmer["id"], lap["timestamp"], lap["timestamp"]),
+        ).fetchone()
+        session_id = session["id"] if session else None
+        lane       = session["lane_number"] if session else lap["lane_number"]
+
+        lap_number = lap["lap_number"]
+        if team_id != lap["team_id"]:
+            _shift_lap_numbers(db, cid, lap["team_id"], lap["lap_number"] + 1, -1)
+            # Position among the team's laps by (timestamp, rowid): taps in the
+            # same second are ordered as they arrived, and never share a number.
+            lap_number = 1 + db.execute(
+                """SELECT COUNT(*) FROM lap_counts
+                   WHERE competition_id=? AND team_id=? AND voided_at IS NULL
+                     AND (timestamp, rowid) < (?, (SELECT rowid FROM lap_counts WHERE id=?))""",
+                (cid, team_id, lap["timestamp"], lap_id),
+            ).fetchone()[0]
+            _shift_lap_numbers(db, cid, team_id, lap_number, 1)
+
         db.execute(
-            "UPDATE swim_sessions SET lap_count=lap_count+1 WHERE competition_id=? AND team_id=? AND is_active=1",
-            (competition_id, team_id)
+            """UPDATE lap_counts SET team_id=?, swimmer_id=?, lane_number=?, session_id=?, lap_number=?
+               WHERE id=?""",
+            (team_id, swimmer["id"], lane, session_id, lap_number, lap_id),
         )
+        _credit(db, cid, lap["team_id"], lap["swimmer_id"], lap["session_id"], lap["timestamp"], -1)
+        _credit(db, cid, team_id, swimmer["id"], session_id, lap["timestamp"], 1)
+        if team_id != lap["team_id"]:
+            recompute_lap_rate(db, cid, lap["team_id"])
+            recompute_lap_rate(db, cid, team_id)
+        append_event(db, cid, LAP_REASSIGNED, entity_id=lap_id, team_id=team_id,
+                     swimmer_id=swimmer["id"], lane_number=lane,
+                     payload={"sessionId": session_id, "lapNumber": lap_number,
+                              "from": {"teamId": lap["team_id"], "swimmerId": lap["swimmer_id"],
+                                       "sessionId": lap["session_id"]}})
+        refresh_results_snapshot(db, cid)
         db.commit()
         row = db.execute("SELECT * FROM lap_counts WHERE id=?", (lap_id,)).fetchone()
 
-    logger.info("Lap %d: team=%s swimmer=%s lane=%d", lap_number, team_id, swimmer_id, lane_number)
-    return created(serialize_lap_count(dict(row)))
+    logger.info("Lap reassigned: %s → team=%s swimmer=%s", lap_id, team_id, swimmer["id"])
+    return ok(serialize_lap_count(dict(row)))
@@ -0,0 +1,406 @@
+"""
+live.py - In-memory state of running competitions
+
+A LiveCompetition holds what the hot paths need per team and swimmer — lap
+totals, first/last lap time, fastest interval, bird counters, water time, the
+active session — in __slots__ objects with epoch-second integers instead of row dicts.
+/stats builds its team and swimmer tables from it and record_lap validates
+taps against it, instead of re-reading every lap on each request.
+
+A model is loaded (in one read transaction) on first use while its
+competition is active or paused. It follows the event log: writers call
+catch_up() right after committing a lap or session change (write-through),
+and every get() first folds in any events committed since, so changes made
+by other workers are picked up as well. Events that cannot be applied
+incrementally (voids, reassignments, out-of-order laps, unknown teams or
+swimmers) drop the model and the next get() reloads it. Team, swimmer and
+competition edits are not logged as events; their endpoints call invalidate(),
+and on_change() drops the model when the change feed reports such an edit from
+another worker that is newer than the model's snapshot.
+
+verify() rebuilds a model from the database and compares it with the cached
+one; maintenance runs it for every loaded competition every LIVE_CHECK_S.
+"""
+
+import sys
+import logging
+import threading
+from datetime import datetime
+from database import get_db, is_sharded
+from events import LAP_RECORDED, SESSION_STARTED, SESSION_ENDED, STATUS_CHANGED
+from stats import LATE_BIRD_H, EARLY_BIRD_H, lap_metrics
+from utils import parse_utc, zone
+
+logger = logging.getLogger(__name__)
+
+LIVE_STATUSES = ("active", "paused")
+LIVE_CHECK_S  = 300
+
+# Hot reads, shared with the query-plan checks in test_e2e.py
+LIVE_LAPS_SQL = (
+    "SELECT team_id, swimmer_id, timestamp, local_hour FROM lap_counts"
+    " WHERE competition_id=? AND voided_at IS NULL ORDER BY timestamp"
+)
+EVENTS_SINCE_SQL = "SELECT * FROM events WHERE competition_id=? AND seq>? ORDER BY seq"
+
+_lock   = threading.Lock()
+_models: dict[str, "LiveCompetition"] = {}
+
+
+def _max_change(db, schema: str) -> int:
+    return db.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {schema}.changes").fetchone()[0]
+
+
+def _epoch(ts: str | None) -> int | None:
+    dt = parse_utc(ts)
+    return int(dt.timestamp()) if dt else None
+
+
+class TeamState:
+    __slots__ = ("id", "name", "color", "lane", "laps", "late_bird", "early_bird",
+                 "first_lap", "last_lap", "fastest_s", "session")
+
+    def rate(self) -> tuple:
+        return lap_metrics(self.laps, (self.last_lap or 0) - (self.first_lap or 0), self.fastest_s)
+
+    def __init__(self, row):
+        self.id, self.name, self.color, self.lane = row["id"], row["name"], row["color"], row["assigned_lane"]
+        self.laps = self.late_bird = self.early_bird = 0
+        self.first_lap = self.last_lap = self.fastest_s = None
+        self.session = None          # active SessionState
+
+
+class SwimmerState:
+    __slots__ = ("id", "name", "team_id", "is_under_12", "laps", "late_bird", "early_bird", "water_s",
+                 "first_lap", "last_lap", "fastest_s")
+
+    def __init__(self, row):
+        self.id, self.name, self.team_id = row["id"], row["name"], row["team_id"]
+        self.is_under_12 = bool(row["is_under_12"])
+        self.laps = self.late_bird = self.early_bird = self.water_s = 0
+        self.first_lap = self.last_lap = self.fastest_s = None
+
+    rate = TeamState.rate
+
+
+class SessionState:
+    __slots__ = ("id", "team_id", "swimmer_id", "lane", "start", "end", "active")
+
+    def __init__(self, row):
+        self.id, self.team_id, self.swimmer_id = row["id"], row["team_id"], row["swimmer_id"]
+        self.lane   = row["lane_number"]
+        self.start  = _epoch(row["start_time"])
+        self.end    = _epoch(row["end_time"])
+        self.active = bool(row["is_active"])
+
+    @property
+    def water_s(self) -> int:
+        return self.end - self.start if self.start is not None and self.end is not None else 0
+
+
+class LiveCompetition:
+    __slots__ = ("id", "status", "double_count_timeout", "lane_length", "zone", "seq", "cursors",
+                 "teams", "swimmers", "sessions", "lock")
+
+    def __init__(self, comp: dict):
+        self.id       = comp["id"]
+        self.lock     = threading.Lock()
+        self.seq      = 0
+        self.cursors: dict[str, int] = {}    # change feed file name -> newest seq seen at load
+        self.teams:    dict[str, TeamState]    = {}
+        self.swimmers: dict[str, SwimmerState] = {}
+        self.sessions: dict[str, SessionState] = {}
+        self._set_competition(comp)
+
+    def _set_competition(self, comp) -> None:
+        self.status               = comp["status"]
+        self.double_count_timeout = int(comp["double_count_timeout"])
+        self.lane_length          = comp["lane_length"] or 25
+        self.zone                 = zone(comp["timezone"])
+
+    # ── loading ───────────────────────────────────────────────────────────────
+    @classmethod
+    def load(cls, db, comp: dict) -> "LiveCompetition":
+        cid   = comp["id"]
+        model = cls(comp)
+        own_txn = not db.in_transaction
+        if own_txn:
+            db.execute("BEGIN")     # one snapshot for the seq and every table below
+        try:
+            model.seq = db.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM events WHERE competition_id=?", (cid,)
+            ).fetchone()[0]
+            if is_sharded(cid):
+                model.cursors[cid] = _max_change(db, "main")
+                model.cursors["main"] = _max_change(db, "catalog")
+            else:
+                model.cursors["main"] = _max_change(db, "main")
+            for r in db.execute(
+                "SELECT id, name, color, assigned_lane FROM teams WHERE competition_id=? ORDER BY assigned_lane, name",
+                (cid,),
+            ):
+                model.teams[r["id"]] = TeamState(r)
+            for r in db.execute(
+                "SELECT id, name, team_id, is_under_12 FROM swimmers WHERE competition_id=? ORDER BY name", (cid,)
+            ):
+                model.swimmers[r["id"]] = SwimmerState(r)
+            for r in db.execute(
+                """SELECT id, team_id, swimmer_id, lane_number, start_time, end_time, is_active
+                   FROM swim_sessions WHERE competition_id=?""", (cid,)
+            ):
+                model._put_session(SessionState(r))
+            for r in db.execute(LIVE_LAPS_SQL, (cid,)):
+                model._add_lap(r["team_id"], r["swimmer_id"], _epoch(r["timestamp"]), r["local_hour"])
+        finally:
+            if own_txn:
+                db.rollback()
+        return model
+
+    # ── incremental updates ───────────────────────────────────────────────────
+    def _add_lap(self, team_id: str, swimmer_id: str, at: int | None, hour: int | None = None) -> bool:
+        team, swimmer = self.teams.get(team_id), self.swimmers.get(swimmer_id)
+        if team is None or swimmer is None or at is None:
+            return False
+        if any(e.last_lap is not None and at < e.last_lap for e in (team, swimmer)):
+            return False             # intervals are only kept for laps in time order
+        if hour is None:             # as lap_counts.insert_lap stores it
+            hour = datetime.fromtimestamp(at, self.zone).hour
+        for entity in (team, swimmer):
+            if entity.last_lap is not None:
+                gap = at - entity.last_lap
+                entity.fastest_s = gap if entity.fastest_s is None else min(entity.fastest_s, gap)
+            else:
+                entity.first_lap = at
+            entity.last_lap = at
+            entity.laps += 1
+            entity.late_bird  += hour == LATE_BIRD_H
+            entity.early_bird += hour == EARLY_BIRD_H
+        return True
+
+    def _put_session(self, session: SessionState) -> bool:
+        old = self.sessions.get(session.id)
+        if old is not None:
+            self._drop_session(old)
+        team, swimmer = self.teams.get(session.team_id), self.swimmers.get(session.swimmer_id)
+        if team is None or swimmer is None:
+            return False
+        self.sessions[session.id] = session
+        swimmer.water_s += session.water_s
+        if session.active:
+            team.session = session
+        return True
+
+    def _drop_session(self, session: SessionState) -> None:
+        del self.sessions[session.id]
+        swimmer, team = self.swimmers.get(session.swimmer_id), self.teams.get(session.team_id)
+        if swimmer is not None:
+            swimmer.water_s -= session.water_s
+        if team is not None and team.session is session:
+            team.session = None
+
+    def _apply(self, db, ev) -> bool:
+        """Fold one committed event in; False when it needs a reload."""
+        kind = ev["type"]
+        if kind == LAP_RECORDED:
+            return self._add_lap(ev["team_id"], ev["swimmer_id"], _epoch(ev["timestamp"]))
+        if kind in (SESSION_STARTED, SESSION_ENDED):
+            # The row is the source of truth (end_time may differ from the
+            # event time); re-reading it makes the update idempotent.
+            row = db.execute(
+                """SELECT id, team_id, swimmer_id, lane_number, start_time, end_time, is_active
+                   FROM swim_sessions WHERE id=?""", (ev["entity_id"],)
+            ).fetchone()
+            if row is None:
+                return False
+            return self._put_session(SessionState(row))
+        if kind == STATUS_CHANGED:
+            comp = db.execute("SELECT * FROM competitions WHERE id=?", (self.id,)).fetchone()
+            if comp is None or comp["status"] not in LIVE_STATUSES:
+                return False
+            self._set_competition(comp)
+            return True
+        return False
+
+    def catch_up(self, db) -> bool:
+        with self.lock:
+            for ev in db.execute(EVENTS_SINCE_SQL, (self.id, self.seq)).fetchall():
+                if not self._apply(db, ev):
+                    logger.debug("Live model %s reloads after %s #%d", self.id, ev["type"], ev["seq"])
+                    return False
+                self.seq = ev["seq"]
+        return True
+
+    # ── reads ─────────────────────────────────────────────────────────────────
+    def lap_context(self, team_id: str) -> tuple:
+        """(status, double_count_timeout, active session, last lap epoch, laps) of a team."""
+        with self.lock:
+            team = self.teams.get(team_id)
+            if team is None:
+                return self.status, self.double_count_timeout, None, None, 0
+            return self.status, self.double_count_timeout, team.session, team.last_lap, team.laps
+
+    def total_laps(self) -> int:
+        with self.lock:
+            return sum(t.laps for t in self.teams.values())
+
+    def active_sessions(self) -> int:
+        with self.lock:
+            return sum(1 for t in self.teams.values() if t.session is not None)
+
+    def team_stats(self) -> list[dict]:
+        """Same shape and order as stats._team_stats."""
+        with self.lock:
+            results = []
+            for t in self.teams.values():
+                laps_per_hour, fastest = t.rate()
+                s = t.session
+                swimmer = self.swimmers.get(s.swimmer_id) if s else None
+                results.append({
+                    "team":          {"id": t.id, "name": t.name, "color": t.color, "assignedLane": t.lane},
+                    "totalLaps":     t.laps,
+                    "lateBirdLaps":  t.late_bird,
+                    "earlyBirdLaps": t.early_bird,
+                    "lapsPerHour":   laps_per_hour,
+                    "fastestLapSec": fastest,
+                    "distanceM":     t.laps * self.lane_length,
+                    "activeSwimmer": {"id": s.swimmer_id, "name": swimmer.name if swimmer else None,
+                                      "laneNumber": s.lane} if s else None,
+                })
+        results.sort(key=lambda x: x["totalLaps"], reverse=True)
+        return results
+
+    def swimmer_stats(self) -> list[dict]:
+        """Same shape and order as stats._swimmer_stats."""
+        with self.lock:
+            results = []
+            for s in self.swimmers.values():
+                team = self.teams.get(s.team_id)
+                if team is None:
+                    continue
+                laps_per_hour, fastest = s.rate()
+                results.append({
+                    "swimmer":           {"id": s.id, "name": s.name, "teamId": s.team_id,
+                                          "teamName": team.name, "teamColor": team.color,
+                                          "isUnder12": s.is_under_12},
+                    "totalLaps":         s.laps,
+                    "lateBirdLaps":      s.late_bird,
+                    "earlyBirdLaps":     s.early_bird,
+                    "lapsPerHour":       laps_per_hour,
+                    "fastestLapSec":     fastest,
+                    "distanceM":         s.laps * self.lane_length,
+                    "totalWaterSeconds": int(s.water_s),
+                })
+        results.sort(key=lambda x: x["totalLaps"], reverse=True)
+        return results
+
+    def footprint(self) -> dict:
+        """Approximate heap bytes held by this model (objects, their fields, the indexes)."""
+        seen, size = set(), 0
+        stack = [self, self.teams, self.swimmers, self.sessions]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            size += sys.getsizeof(obj)
+            if isinstance(obj, dict):
+                stack.extend(obj.keys()); stack.extend(obj.values())
+            elif hasattr(type(obj), "__slots__"):
+                stack.extend(getattr(obj, f) for f in type(obj).__slots__
+                             if f != "lock" and hasattr(obj, f))
+        return {"teams": len(self.teams), "swimmers": len(self.swimmers),
+                "sessions": len(self.sessions), "seq": self.seq, "bytes": size}
+
+
+# ── Registry ──────────────────────────────────────────────────────────────────
+def get(db, cid: str) -> LiveCompetition | None:
+    """The up-to-date model of an active/paused competition, else None."""
+    with _lock:
+        model = _models.get(cid)
+    if model is not None and not model.catch_up(db):
+        invalidate(cid)
+        model = None
+    if model is None:
+        comp = db.execute("SELECT * FROM competitions WHERE id=?", (cid,)).fetchone()
+        if comp is None or comp["status"] not in LIVE_STATUSES:
+            return None
+        model = LiveCompetition.load(db, dict(comp))
+        with _lock:
+            _models[cid] = model
+        logger.info("Live model loaded: %s (%d teams, %d swimmers, seq %d)",
+                    cid, len(model.teams), len(model.swimmers), model.seq)
+    return model
+
+
+def catch_up(db, cid: str) -> None:
+    """Write-through after a commit: fold the new events into a loaded model."""
+    with _lock:
+        model = _models.get(cid)
+    if model is not None and not model.catch_up(db):
+        invalidate(cid)
+
+
+def invalidate(cid: str) -> None:
+    with _lock:
+        _models.pop(cid, None)
+
+
+# Entities whose edits are not in the event log (see module docstring).
+_STRUCTURAL = ("competition", "team", "swimmer")
+
+
+def on_change(change) -> None:
+    """Change feed subscriber: drop a model made stale by another worker's edit."""
+    if change.entity not in _STRUCTURAL:
+        return
+    with _lock:
+        model = _models.get(change.competition_id)
+    if model is not None and change.seq > model.cursors.get(change.db, 0):
+        logger.debug("Live model %s dropped after %s %s", change.competition_id, change.entity, change.op)
+        invalidate(change.competition_id)
+
+
+def footprints() -> dict:
+    with _lock:
+        models = dict(_models)
+    return {cid: m.footprint() for cid, m in models.items()}
+
+
+def _state(model: LiveCompetition) -> dict:
+    return {"status": model.status, "doubleCountTimeout": model.double_count_timeout,
+            "teamStats": model.team_stats(), "swimmerStats": model.swimmer_stats()}
+
+
+def verify(cid: str) -> list[str]:
+    """
+    Compare the cached model with one freshly loaded from the database.
+    Returns the names of the parts that differ (empty when consistent); an
+    inconsistent model is dropped.
+    """
+    with _lock:
+        model = _models.get(cid)
+    if model is None:
+        return []
+    with get_db(cid) as db:
+        if not model.catch_up(db):
+            invalidate(cid)
+            return []
+        comp = db.execute("SELECT * FROM competitions WHERE id=?", (cid,)).fetchone()
+        if comp is None:
+            invalidate(cid)
+            return []
+        fresh = LiveCompetition.load(db, dict(comp))
+    if fresh.seq != model.seq:
+        return []                    # a write landed in between; check next time
+    cached, expected = _state(model), _state(fresh)
+    diff = [key for key in expected if cached[key] != expected[key]]
+    if diff:
+        logger.warning("Live model %s inconsistent (%s); dropped", cid, ", ".join(diff))
+        invalidate(cid)
+    return diff
+
+
+def verify_all() -> dict:
+    with _lock:
+        cids = list(_models)
+    return {cid: verify(cid) for cid in cids}
@@ -0,0 +1,279 @@
+"""
+maintenance.py - WAL checkpoints and online backups
+GET /metrics
+
+CLI:
+  python maintenance.py checkpoint
+  python maintenance.py backup
+
+Runs on the background scheduler every MAINTENANCE_S seconds:
+  - PASSIVE checkpoint of every database file (main + shards) once its WAL
+    exceeds SWIMTRACK_CHECKPOINT_WAL_MB or SWIMTRACK_CHECKPOINT_S has passed.
+    PASSIVE never waits for readers or writers, so lap inserts are not held up;
+    frames still in use are simply picked up by the next run.
+  - an online backup every SWIMTRACK_BACKUP_S seconds (leader only) with
+    VACUUM INTO, into backups/<timestamp>/. Each file is copied from one read
+    transaction: a consistent snapshot that writers never restart and never
+    wait for. It runs on its own thread so the scheduler's auto start /
+    finish jobs are not held up. The newest SWIMTRACK_BACKUP_KEEP sets are
+    kept.
+  - change feed rows older than changes.CHANGE_RETENTION_S are deleted
+    (leader only).
+  - every live.LIVE_CHECK_S, a consistency check of the in-memory live models
+    against the database (an inconsistent model is dropped and reloaded).
+
+/metrics also reports the memory held by each loaded live model, the state of
+this worker's change feed, its connection pool counters and the lap writer's
+batch sizes, the phases of the last start (startup.py) and busy / retried /
+failed writes per route.
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from flask import Blueprint
+import live
+import changes
+import startup
+from lap_counts import lap_writes
+from database import database_files, backup_dir, create_private_file, pool_status, contention_status
+from utils import ok, utc_now_iso
+
+maintenance_bp = Blueprint("maintenance", __name__)
+logger         = logging.getLogger(__name__)
+
+MAINTENANCE_S  = 10        # policy evaluation period
+
+_lock  = threading.Lock()
+_files: dict[str, dict] = {}     # name -> last checkpoint result
+_backup: dict = {}               # last backup result
+_backup_thread: threading.Thread | None = None
+_started = time.monotonic()      # first periodic backup one interval after start
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def checkpoint_interval_s() -> float:
+    return _env_float("SWIMTRACK_CHECKPOINT_S", 300)
+
+
+def checkpoint_wal_bytes() -> int:
+    return int(_env_float("SWIMTRACK_CHECKPOINT_WAL_MB", 4) * 1024 * 1024)
+
+
+def backup_interval_s() -> float:
+    """0 disables periodic backups."""
+    return _env_float("SWIMTRACK_BACKUP_S", 3600)
+
+
+def backup_keep() -> int:
+    return max(1, int(_env_float("SWIMTRACK_BACKUP_KEEP", 24)))
+
+
+def wal_size(path: str) -> int:
+    try:
+        return os.path.getsize(f"{path}-wal")
+    except OSError:
+        return 0
+
+
+# ── Checkpoints ───────────────────────────────────────────────────────────────
+def checkpoint(name: str, path: str) -> dict:
+    """Run a PASSIVE checkpoint on one database file and record the outcome."""
+    before = wal_size(path)
+    t0     = time.perf_counter()
+    conn   = sqlite3.connect(path, timeout=0)
+    try:
+        busy, log_frames, done = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    finally:
+        conn.close()
+    result = {
+        "at":                 utc_now_iso(),
+        "monotonic":          time.monotonic(),
+        "busy":               bool(busy),
+        "walFrames":          log_frames,
+        "checkpointedFrames": done,
+        "walBytesBefore":     before,
+        "durationMs":         round((time.perf_counter() - t0) * 1000, 2),
+    }
+    with _lock:
+        _files[name] = result
+    if log_frames > 0 and done < log_frames:
+        logger.info("Checkpoint %s: %d/%d frames (readers still active)", name, done, log_frames)
+    return result
+
+
+def checkpoint_due(name: str, path: str, now: float | None = None) -> bool:
+    now = time.monotonic() if now is None else now
+    wal = wal_size(path)
+    if wal == 0:
+        return False
+    if wal >= checkpoint_wal_bytes():
+        return True
+    with _lock:
+        last = _files.get(name)
+    return last is None or now - last["monotonic"] >= checkpoint_interval_s()
+
+
+def checkpoint_all(force: bool = False) -> dict:
+    return {
+        name: checkpoint(name, path)
+        for name, path in database_files()
+        if force or checkpoint_due(name, path)
+    }
+
+
+# ── Backups ───────────────────────────────────────────────────────────────────
+def _backup_file(src_path: str, dst_path: str) -> dict:
+    """
+    Copy one live database with VACUUM INTO. Unlike the stepped backup API,
+    which starts over whenever another connection writes, it reads a single
+    snapshot, so steady lap inserts cannot keep it from finishing.
+    """
+    tmp = f"{dst_path}.tmp"
+    create_private_file(tmp)          # VACUUM INTO accepts an empty file and keeps its mode
+    src = sqlite3.connect(src_path)
+    try:
+        src.execute("VACUUM INTO ?", (tmp,))
+    finally:
+        src.close()
+    dst = sqlite3.connect(tmp)
+    try:
+        pages = dst.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dst.close()
+    os.replace(tmp, dst_path)
+    return {"pages": pages, "bytes": os.path.getsize(dst_path)}
+
+
+def run_backup() -> dict:
+    """Back up the main database and every shard into a new timestamped set."""
+    stamp  = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    target = os.path.join(backup_dir(), stamp)
+    t0     = time.perf_counter()
+    files  = {}
+    for name, path in database_files():
+        dst = (os.path.join(target, os.path.basename(path)) if name == "main"
+               else os.path.join(target, "shards", f"{name}.db"))
+        files[name] = _backup_file(path, dst)
+
+    result = {
+        "at":         utc_now_iso(),
+        "monotonic":  time.monotonic(),
+        "set":        stamp,
+        "files":      files,
+        "bytes":      sum(f["bytes"] for f in files.values()),
+        "durationMs": round((time.perf_counter() - t0) * 1000, 2),
+    }
+    with _lock:
+        _backup.clear()
+        _backup.update(result)
+    _prune_backups()
+    logger.info("Backup %s written (%d files, %d bytes, %.0f ms)",
+                stamp, len(files), result["bytes"], result["durationMs"])
+    return result
+
+
+def _prune_backups() -> None:
+    sets = sorted(d for d in os.listdir(backup_dir())
+                  if os.path.isdir(os.path.join(backup_dir(), d)))
+    for old in sets[:-backup_keep()]:
+        shutil.rmtree(os.path.join(backup_dir(), old), ignore_errors=True)
+
+
+def backup_due(now: float | None = None) -> bool:
+    interval = backup_interval_s()
+    if interval <= 0:
+        return False
+    now = time.monotonic() if now is None else now
+    with _lock:
+        last = _backup.get("monotonic", _started)
+    return now - last >= interval
+
+
+def start_backup() -> bool:
+    """Run a backup on a background thread unless one is running; True if started."""
+    global _backup_thread
+    with _lock:
+        if _backup_thread is not None and _backup_thread.is_alive():
+            return False
+        _backup_thread = threading.Thread(target=_backup_job, name="swimtrack-backup", daemon=True)
+        _backup_thread.start()
+    return True
+
+
+def _backup_job() -> None:
+    try:
+        run_backup()
+    except Exception:
+        logger.exception("Backup failed")
+
+
+# ── Scheduler job ─────────────────────────────────────────────────────────────
+def maintenance_tick(scheduler) -> None:
+    checkpoint_all()
+    # Several workers share the files; only the lease holder takes backups.
+    if scheduler.is_leader and backup_due():
+        start_backup()
+    if scheduler.is_leader:
+        changes.prune_all()
+
+
+def start_maintenance(scheduler) -> None:
+    """Register the maintenance job on a running scheduler."""
+    if scheduler.running:
+        scheduler.every(MAINTENANCE_S, "maintenance", lambda: maintenance_tick(scheduler))
+        scheduler.every(live.LIVE_CHECK_S, "live-check", live.verify_all)
+
+
+# ── Route ─────────────────────────────────────────────────────────────────────
+def _public(entry: dict) -> dict:
+    return {k: v for k, v in entry.items() if k != "monotonic"}
+
+
+@maintenance_bp.route("/metrics", methods=["GET"])
+def metrics():
+    with _lock:
+        files, backup = dict(_files), dict(_backup)
+    databases = []
+    for name, path in database_files():
+        databases.append({
+            "name":           name,
+            "sizeBytes":      os.path.getsize(path) if os.path.exists(path) else 0,
+            "walBytes":       wal_size(path),
+            "lastCheckpoint": _public(files[name]) if name in files else None,
+        })
+    return ok({
+        "databases":  databases,
+        "lastBackup": _public(backup) if backup else None,
+        "liveModels": [{"competitionId": cid, **fp} for cid, fp in live.footprints().items()],
+        "changeFeed": changes.feed().status(),
+        "connectionPool": pool_status(),
+        "lapQueue":       lap_writes.status(),
+        "startup":        startup.report(),
+        "contention":     contention_status(),
+    })
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-8s %(message)s")
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "checkpoint":
+        for name, res in checkpoint_all(force=True).items():
+            print(f"{name}: {res['checkpointedFrames']}/{res['walFrames']} frames")
+    elif command == "backup":
+        res = run_backup()
+        print(f"{os.path.join(backup_dir(), res['set'])}: {res['bytes']} bytes")
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -8,7 +8,8 @@ POST   /referees/<id>/reset-password
 
 import logging
 from flask import Blueprint, request
-from database import get_db
+from database import get_db, is_sharded
+import repository
 from utils import (
     new_uuid, ok, created, success, error, not_found,
     serialize_referee, generate_human_password, generate_referee_user_id, hash_password,
@@ -17,28 +18,18 @@ from utils import (
 referees_bp = Blueprint("referees", __name__)
 logger      = logging.getLogger(__name__)
 
+UNIQUE_ID_TAKEN_SQL = "SELECT 1 FROM referees WHERE unique_id=?"
+
 
 @referees_bp.route("/referees", methods=["GET"])
 def list_referees():
     competition_id = request.args.get("competitionId")
     user_id_filter = request.args.get("userId")
 
-    query  = "SELECT r.*, u.email as user_email FROM referees r JOIN users u ON r.user_id = u.id WHERE 1=1"
-    params = []
-
-    if competition_id:
-        query += " AND r.competition_id = ?"
-        params.append(competition_id)
-    if user_id_filter:
-        query += " AND (r.unique_id = ? OR u.email = ?)"
-        params += [user_id_filter, user_id_filter]
-
-    query += " ORDER BY r.created_at"
-
     with get_db() as db:
-        rows = db.execute(query, params).fetchall()
+        rows = repository.list_referees(db, competition_id or None, user_id_filter or None)
 
-    return ok([serialize_referee(dict(r)) for r in rows])
+    return ok(rows)
 
 
 @referees_bp.route("/referees", methods=["POST"])
@@ -58,13 +49,12 @@ def create_referee():
     with get_db() as db:
         if not db.execute("SELECT id FROM competitions WHERE id=?", (competition_id,)).fetchone():
             return error("Competition not found", 404)
-        existing_ids = {r[0] for r in db.execute("SELECT unique_id FROM referees").fetchall()}
-
-    unique_id = generate_referee_user_id()
-    for _ in range(100):
-        if unique_id not in existing_ids:
-            break
+        # Point lookups on idx_referees_unique_id instead of loading every id.
         unique_id = generate_referee_user_id()
+        for _ in range(100):
+            if not db.execute(UNIQUE_ID_TAKEN_SQL, (unique_id,)).fetchone():
+                break
+            unique_id = generate_referee_user_id()
 
     plain_password = generate_human_password()
     password_hash = hash_password(plain_password)
@@ -101,6 +91,12 @@ def delete_referee(rid):
 
     ref_dict = dict(ref)
 
+    if is_sharded(ref_dict["competition_id"]):
+        # Shards cannot reference the catalog, so do the FK's SET NULL by hand.
+        with get_db(ref_dict["competition_id"]) as db:
+            db.execute("UPDATE main.lap_counts SET referee_id=NULL WHERE referee_id=?", (rid,))
+            db.commit()
+
     with get_db() as db:
         # Preserve lap history; DB FK sets lap_counts.referee_id to NULL on referee delete.
         db.execute("DELETE FROM referees WHERE id=?", (rid,))
@@ -0,0 +1,132 @@
+"""
+repository.py - Fixed query templates for the list endpoints
+
+Each list endpoint filters on a few optional parameters. Instead of growing a
+"WHERE 1=1 AND ..." string per request, every filter combination's statement
+is built once at import, so the same request always sends byte-identical SQL
+and hits the pooled connection's statement cache (database.STATEMENT_CACHE_SIZE).
+
+Each query also fixes its output shape: it selects exactly the fields of the
+API object, in order, and rows are read as plain tuples and zipped onto the
+camelCase keys. That skips the sqlite3.Row -> dict -> serialize_*() copies
+per row; the shapes must stay in step with the serializers in utils.py.
+"""
+
+from itertools import combinations
+
+
+class ListQuery:
+    """
+    SELECT of `columns` (API key -> SQL expression) with optional AND-ed
+    filters and a fixed ORDER BY.
+
+    `filters` maps a filter name to its condition; the condition's `?`
+    placeholders all take the filter's value. Filters whose value is None are
+    left out; a condition without placeholders is switched on with True.
+    `bools` are the keys of 0/1 columns returned as JSON booleans.
+    """
+
+    def __init__(self, source: str, columns: dict[str, str], filters: dict[str, str],
+                 order_by: str, bools: tuple = ()):
+        self.keys    = tuple(columns)
+        self.bools   = bools
+        self.filters = filters
+        select = f"SELECT {', '.join(columns.values())} FROM {source}"
+        names  = list(filters)
+        self.statements: dict[tuple, str] = {}
+        for n in range(len(names) + 1):
+            for combo in combinations(names, n):
+                where = " AND ".join(filters[f] for f in combo)
+                self.statements[combo] = (f"{select}{' WHERE ' + where if where else ''}"
+                                          f" ORDER BY {order_by}")
+
+    def sql(self, **values) -> tuple[str, list]:
+        used   = tuple(f for f in self.filters if values.get(f) is not None)
+        params = []
+        for f in used:
+            params += [values[f]] * self.filters[f].count("?")
+        return self.statements[used], params
+
+    def fetch(self, db, **values) -> list[dict]:
+        """Run the query and return API objects."""
+        sql, params = self.sql(**values)
+        cur = db.execute(sql, params)
+        cur.row_factory = None               # plain tuples, not sqlite3.Row
+        keys = self.keys
+        rows = [dict(zip(keys, r)) for r in cur]
+        for key in self.bools:
+            for row in rows:
+                row[key] = bool(row[key])
+        return rows
+
+
+TEAMS = ListQuery(
+    "teams",
+    {"id": "id", "name": "name", "color": "color", "logo": "logo",
+     "competitionId": "competition_id", "assignedLane": "assigned_lane", "createdAt": "created_at"},
+    {"competition_id": "competition_id = ?", "lane": "assigned_lane = ?"},
+    "assigned_lane, name",
+)
+
+SWIMMERS = ListQuery(
+    "swimmers",
+    {"id": "id", "name": "name", "teamId": "team_id", "competitionId": "competition_id",
+     "isUnder12": "is_under_12", "parentName": "parent_name", "parentContact": "parent_contact",
+     "parentPresent": "parent_present", "createdAt": "created_at"},
+    {"competition_id": "competition_id = ?", "team_id": "team_id = ?"},
+    "name",
+    bools=("isUnder12", "parentPresent"),
+)
+
+SWIM_SESSIONS = ListQuery(
+    "swim_sessions",
+    {"id": "id", "competitionId": "competition_id", "swimmerId": "swimmer_id", "teamId": "team_id",
+     "laneNumber": "lane_number", "startTime": "start_time", "endTime": "end_time",
+     "lapCount": "lap_count", "isActive": "is_active"},
+    {"competition_id": "competition_id = ?", "team_id": "team_id = ?", "is_active": "is_active = ?"},
+    "start_time DESC",
+    bools=("isActive",),
+)
+
+LAP_COUNTS = ListQuery(
+    "lap_counts",
+    {"id": "id", "competitionId": "competition_id", "laneNumber": "lane_number", "teamId": "team_id",
+     "swimmerId": "swimmer_id", "refereeId": "referee_id", "lapNumber": "lap_number",
+     "timestamp": "timestamp", "sessionId": "session_id", "voidedAt": "voided_at",
+     "voidedBy": "voided_by", "voidReason": "void_reason"},
+    {"counted": "voided_at IS NULL", "competition_id": "competition_id = ?",
+     "team_id": "team_id = ?", "swimmer_id": "swimmer_id = ?"},
+    "timestamp ASC",
+)
+
+REFEREES = ListQuery(
+    "referees r JOIN users u ON r.user_id = u.id",
+    {"id": "r.id", "userId": "r.unique_id", "uniqueId": "r.unique_id",
+     "competitionId": "r.competition_id", "email": "COALESCE(NULLIF(r.email, ''), u.email)",
+     "createdAt": "r.created_at"},
+    {"competition_id": "r.competition_id = ?", "user_id": "(r.unique_id = ? OR u.email = ?)"},
+    "r.created_at",
+)
+
+
+def list_teams(db, competition_id=None, lane=None) -> list[dict]:
+    return TEAMS.fetch(db, competition_id=competition_id, lane=lane)
+
+
+def list_swimmers(db, competition_id=None, team_id=None) -> list[dict]:
+    return SWIMMERS.fetch(db, competition_id=competition_id, team_id=team_id)
+
+
+def list_swim_sessions(db, competition_id=None, team_id=None, is_active=None) -> list[dict]:
+    return SWIM_SESSIONS.fetch(db, competition_id=competition_id, team_id=team_id,
+                               is_active=None if is_active is None else int(is_active))
+
+
+def list_lap_counts(db, competition_id=None, team_id=None, swimmer_id=None,
+                    include_voided: bool = False) -> list[dict]:
+    return LAP_COUNTS.fetch(db, counted=None if include_voided else True, competition_id=competition_id,
+                            team_id=team_id, swimmer_id=swimmer_id)
+
+
+def list_referees(db, competition_id=None, user_id=None) -> list[dict]:
+    return REFEREES.fetch(db, competition_id=competition_id, user_id=user_id)
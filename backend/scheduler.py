@@ -0,0 +1,288 @@
+"""
+scheduler.py - In-process background scheduler
+
+Acts on the competitions' `auto_start` / `auto_finish` flags:
+  - upcoming competitions with auto_start become active at date + start_time
+  - active/paused competitions with auto_finish are completed at their end
+    (open swim sessions are closed, actual_start/end_time are stamped)
+
+Timers live in a hashed timing wheel driven by one daemon thread that sleeps
+until the next deadline, so an idle server costs no CPU. When several worker
+processes share the database only the holder of the 'scheduler' lease (a row
+in the `leases` table) performs transitions; the others keep retrying to take
+over if the leader's lease expires.
+"""
+
+import os
+import json
+import socket
+import threading
+import time
+import logging
+from database import get_db
+from utils import new_uuid, utc_now_iso, competition_window
+from events import append_event, STATUS_CHANGED
+from stats import build_results_snapshot
+from swim_sessions import close_active_sessions
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME   = "scheduler"
+LEASE_TTL_S  = 90
+RESCAN_S     = 30      # lease renewal + competition rescan period
+TICK_S       = 1.0     # timing wheel resolution
+WHEEL_SLOTS  = 512
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel: O(1) schedule/cancel, one bucket per tick. Entries
+    keep their absolute deadline, so timers further away than one revolution
+    simply stay in their bucket until a sweep finds them due.
+    Not thread-safe; the Scheduler serialises access.
+    """
+
+    def __init__(self, tick: float = TICK_S, slots: int = WHEEL_SLOTS, now: float | None = None):
+        self.tick    = tick
+        self.slots   = [dict() for _ in range(slots)]
+        self._where  = {}                       # key -> slot index
+        self._cursor = int((time.time() if now is None else now) // tick)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def schedule(self, key, deadline: float, callback) -> None:
+        self.cancel(key)
+        idx = max(int(deadline // self.tick), self._cursor) % len(self.slots)
+        self.slots[idx][key] = (deadline, callback)
+        self._where[key] = idx
+
+    def cancel(self, key) -> bool:
+        idx = self._where.pop(key, None)
+        if idx is None:
+            return False
+        self.slots[idx].pop(key, None)
+        return True
+
+    def next_deadline(self):
+        """Earliest pending deadline, or None when the wheel is empty."""
+        if not self._where:
+            return None
+        return min(self.slots[idx][key][0] for key, idx in self._where.items())
+
+    def advance(self, now: float) -> list:
+        """Sweep buckets from the cursor up to `now`, returning due callbacks."""
+        due    = []
+        target = int(now // self.tick)
+        first  = max(self._cursor, target - len(self.slots) + 1)
+        for tick_no in range(first, target + 1):
+            bucket = self.slots[tick_no % len(self.slots)]
+            for key, (deadline, cb) in list(bucket.items()):
+                if deadline <= now:
+                    del bucket[key]
+                    del self._where[key]
+                    due.append(cb)
+        # The current tick is swept again next time, so timers scheduled
+        # "now" (or in the past) are never skipped.
+        self._cursor = max(self._cursor, target)
+        return due
+
+
+class Scheduler:
+    def __init__(self):
+        self._wheel   = TimerWheel()
+        self._cond    = threading.Condition()
+        self._thread  = None
+        self._stop    = False
+        self._comp_keys: set = set()
+        self.holder   = f"{socket.gethostname()}:{os.getpid()}:{new_uuid()[:8]}"
+        self.is_leader = False
+
+    # ── public API ────────────────────────────────────────────────────────────
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        self.every(RESCAN_S, "rescan", self._rescan, run_now=True)
+        self._thread = threading.Thread(target=self._run, name="swimtrack-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("Scheduler started (%s)", self.holder)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def at(self, key, when: float, fn) -> None:
+        """Run `fn` once at unix time `when` (replaces any timer with the same key)."""
+        with self._cond:
+            self._wheel.schedule(key, when, fn)
+            self._cond.notify_all()
+
+    def every(self, interval: float, key, fn, run_now: bool = False) -> None:
+        """Run `fn` every `interval` seconds until the process exits."""
+        def job():
+            try:
+                fn()
+            finally:
+                self.at(key, time.time() + interval, job)
+        self.at(key, time.time() if run_now else time.time() + interval, job)
+
+    def wake(self) -> None:
+        """Rescan competitions now (called after a competition was edited)."""
+        self.at("rescan-now", time.time(), self._rescan)
+
+    # ── internals ─────────────────────────────────────────────────────────────
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                nxt = self._wheel.next_deadline()
+                timeout = None if nxt is None else max(0.0, nxt - time.time())
+                if timeout is None or timeout > 0:
+                    self._cond.wait(timeout)
+                due = self._wheel.advance(time.time())
+            for cb in due:
+                try:
+                    cb()
+                except Exception:
+                    logger.exception("Scheduled job failed")
+
+    def _renew_lease(self) -> bool:
+        now = time.time()
+        with get_db() as db:
+            db.execute(
+                """INSERT INTO leases (name, holder, expires_at) VALUES (?,?,?)
+                   ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at
+                   WHERE leases.holder=excluded.holder OR leases.expires_at < ?""",
+                (LEASE_NAME, self.holder, now + LEASE_TTL_S, now),
+            )
+            db.commit()
+            row = db.execute("SELECT holder FROM leases WHERE name=?", (LEASE_NAME,)).fetchone()
+        leader = bool(row) and row["holder"] == self.holder
+        if leader != self.is_leader:
+            logger.info("Scheduler %s leadership: %s", self.holder, "acquired" if leader else "lost")
+        self.is_leader = leader
+        return leader
+
+    def _rescan(self) -> None:
+        leader = self._renew_lease()
+        with self._cond:
+            for key in self._comp_keys:
+                self._wheel.cancel(key)
+            self._comp_keys.clear()
+        if not leader:
+            return
+
+        with get_db() as db:
+            rows = db.execute(
+                """SELECT * FROM competitions
+                   WHERE (auto_start=1 AND status='upcoming')
+                      OR (auto_finish=1 AND status IN ('active','paused'))"""
+            ).fetchall()
+        for row in rows:
+            comp = dict(row)
+            start, end = competition_window(comp)
+            if start is None:
+                continue
+            if comp["status"] == "upcoming":
+                key, when, fn = (comp["id"], "start"), start, auto_start
+            else:
+                key, when, fn = (comp["id"], "finish"), end, auto_finish
+            with self._cond:
+                self._comp_keys.add(key)
+            self.at(key, when.timestamp(), lambda cid=comp["id"], fn=fn: self._transition(fn, cid))
+
+    def _transition(self, fn, cid: str) -> None:
+        # A stale leader must not act: re-check the lease right before writing.
+        if not self._renew_lease():
+            return
+        if fn(cid):
+            self.wake()
+
+
+def auto_start(cid: str) -> bool:
+    now_iso = utc_now_iso()
+    with get_db(cid) as db:
+        cur = db.execute(
+            """UPDATE competitions SET status='active',
+                      actual_start_time=COALESCE(actual_start_time, ?)
+               WHERE id=? AND status='upcoming' AND auto_start=1""",
+            (now_iso, cid),
+        )
+        if cur.rowcount:
+            append_event(db, cid, STATUS_CHANGED, payload={"from": "upcoming", "to": "active"},
+                         timestamp=now_iso)
+        db.commit()
+    if cur.rowcount:
+        logger.info("Competition auto-started: %s", cid)
+    return bool(cur.rowcount)
+
+
+def _logged_status(db, cid: str) -> str | None:
+    row = db.execute(
+        "SELECT payload FROM events WHERE competition_id=? AND type=? ORDER BY seq DESC LIMIT 1",
+        (cid, STATUS_CHANGED),
+    ).fetchone()
+    return json.loads(row["payload"])["to"] if row else None
+
+
+def auto_finish(cid: str) -> bool:
+    """
+    A sharded competition's sessions and event log are in its shard, its
+    status in the main database, and a transaction does not commit both files
+    atomically. So the sessions are closed and the change logged first, then
+    the status is flipped, then sessions started in between are closed and
+    the results frozen. Each step checks its own state: a rerun after a crash
+    finishes the rest, a rerun after success does nothing.
+    """
+    now_iso = utc_now_iso()
+    with get_db(cid) as db:
+        comp = db.execute("SELECT status, auto_finish FROM competitions WHERE id=?", (cid,)).fetchone()
+        if not comp or comp["status"] not in ("active", "paused") or not comp["auto_finish"]:
+            return False
+        closed = close_active_sessions(db, cid, now_iso)
+        if _logged_status(db, cid) != "completed":
+            append_event(db, cid, STATUS_CHANGED, payload={"from": comp["status"], "to": "completed"},
+                         timestamp=now_iso)
+        db.commit()
+
+    with get_db() as db:
+        cur = db.execute(
+            """UPDATE competitions SET status='completed',
+                      actual_end_time=COALESCE(actual_end_time, ?)
+               WHERE id=? AND status IN ('active','paused') AND auto_finish=1""",
+            (now_iso, cid),
+        )
+        db.commit()
+    if not cur.rowcount:
+        return False
+
+    with get_db(cid) as db:
+        closed += close_active_sessions(db, cid, now_iso)
+        build_results_snapshot(db, cid)
+        db.commit()
+    logger.info("Competition auto-finished: %s (%d sessions closed)", cid, closed)
+    return True
+
+
+_scheduler = Scheduler()
+
+
+def start_scheduler() -> Scheduler:
+    """Start the process-wide scheduler unless SWIMTRACK_SCHEDULER=0."""
+    if os.environ.get("SWIMTRACK_SCHEDULER", "1") != "0":
+        _scheduler.start()
+    return _scheduler
+
+
+def wake() -> None:
+    if _scheduler._thread is not None:
+        _scheduler.wake()
@@ -35,34 +35,12 @@ CREATE TABLE IF NOT EXISTS competitions (
     actual_start_time    TEXT,
     actual_end_time      TEXT,
     results_pdf          TEXT,              -- base64 data URI
+    archived_at          TEXT,              -- laps/sessions moved to archive/<id>.sqlite
+    sharded              INTEGER NOT NULL DEFAULT 0,  -- operational data in shards/<id>.db
+    timezone             TEXT,              -- IANA name; NULL = UTC for hour buckets
     created_at           TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
 );
 
--- Teams
-CREATE TABLE IF NOT EXISTS teams (
-    id             TEXT PRIMARY KEY,        -- UUID
-    name           TEXT NOT NULL,
-    color          TEXT NOT NULL DEFAULT '#3b82f6',  -- hex color
-    logo           TEXT,                    -- optional URL/base64
-    competition_id TEXT NOT NULL REFERENCES competitions(id) ON DELETE CASCADE,
-    assigned_lane  INTEGER NOT NULL DEFAULT 1,
-    created_at     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
-    UNIQUE(competition_id, color, assigned_lane)  -- same color same lane forbidden
-);
-
--- Swimmers
-CREATE TABLE IF NOT EXISTS swimmers (
-    id             TEXT PRIMARY KEY,        -- UUID
-    name           TEXT NOT NULL,
-    team_id        TEXT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
-    competition_id TEXT NOT NULL REFERENCES competitions(id) ON DELETE CASCADE,
-    is_under_12    INTEGER NOT NULL DEFAULT 0,
-    parent_name    TEXT,
-    parent_contact TEXT,
-    parent_present INTEGER NOT NULL DEFAULT 0,
-    created_at     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
-);
-
 -- Referees (linked to a user account)
 CREATE TABLE IF NOT EXISTS referees (
     id             TEXT PRIMARY KEY,        -- UUID
@@ -74,40 +52,42 @@ CREATE TABLE IF NOT EXISTS referees (
     UNIQUE(competition_id, user_id)
 );
 
--- Swim Sessions (a swimmer actively in the water)
-CREATE TABLE IF NOT EXISTS swim_sessions (
-    id             TEXT PRIMARY KEY,        -- UUID
-    competition_id TEXT NOT NULL REFERENCES competitions(id) ON DELETE CASCADE,
-    swimmer_id     TEXT NOT NULL REFERENCES swimmers(id) ON DELETE CASCADE,
-    team_id        TEXT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
-    lane_number    INTEGER NOT NULL,
-    start_time     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
-    end_time       TEXT,
-    lap_count      INTEGER NOT NULL DEFAULT 0,
-    is_active      INTEGER NOT NULL DEFAULT 1
+-- Frozen results of completed competitions (served instead of recomputing stats)
+CREATE TABLE IF NOT EXISTS results_snapshots (
+    competition_id TEXT PRIMARY KEY REFERENCES competitions(id) ON DELETE CASCADE,
+    version        INTEGER NOT NULL DEFAULT 1,  -- bumped on every regeneration
+    etag           TEXT NOT NULL,
+    payload        TEXT NOT NULL,           -- serialized {"data": ...} response body
+    generated_at   TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
 );
 
--- Lap Counts (immutable event log)
-CREATE TABLE IF NOT EXISTS lap_counts (
-    id             TEXT PRIMARY KEY,        -- UUID
-    competition_id TEXT NOT NULL REFERENCES competitions(id) ON DELETE CASCADE,
-    lane_number    INTEGER NOT NULL,
-    team_id        TEXT NOT NULL REFERENCES teams(id) ON DELETE CASCADE,
-    swimmer_id     TEXT NOT NULL REFERENCES swimmers(id) ON DELETE CASCADE,
-    referee_id     TEXT REFERENCES referees(id) ON DELETE SET NULL,
-    lap_number     INTEGER NOT NULL,
-    timestamp      TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+-- Teams and swimmers of sharded competitions: which shard holds the row, so
+-- routes that only carry a row id open the right file (database.locate_competition)
+CREATE TABLE IF NOT EXISTS shard_rows (
+    id             TEXT PRIMARY KEY,        -- team / swimmer id
+    competition_id TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_shard_rows_competition ON shard_rows(competition_id);
+
+-- Leases (single-leader coordination between worker processes)
+CREATE TABLE IF NOT EXISTS leases (
+    name        TEXT PRIMARY KEY,           -- e.g. 'scheduler'
+    holder      TEXT NOT NULL,              -- host:pid:token of the current owner
+    expires_at  REAL NOT NULL               -- unix epoch seconds
 );
 
 -- Indexes for common query patterns
 CREATE INDEX IF NOT EXISTS idx_competitions_organizer ON competitions(organizer_id);
-CREATE INDEX IF NOT EXISTS idx_teams_competition ON teams(competition_id);
-CREATE INDEX IF NOT EXISTS idx_swimmers_competition ON swimmers(competition_id);
-CREATE INDEX IF NOT EXISTS idx_swimmers_team ON swimmers(team_id);
 CREATE INDEX IF NOT EXISTS idx_referees_competition ON referees(competition_id);
-CREATE INDEX IF NOT EXISTS idx_swim_sessions_competition ON swim_sessions(competition_id);
-CREATE INDEX IF NOT EXISTS idx_swim_sessions_team ON swim_sessions(team_id);
-CREATE INDEX IF NOT EXISTS idx_swim_sessions_active ON swim_sessions(competition_id, is_active);
-CREATE INDEX IF NOT EXISTS idx_lap_counts_competition ON lap_counts(competition_id);
-CREATE INDEX IF NOT EXISTS idx_lap_counts_team ON lap_counts(team_id);
-CREATE INDEX IF NOT EXISTS idx_lap_counts_timestamp ON lap_counts(competition_id, team_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_referees_unique_id ON referees(unique_id);
+
+-- Change feed rows for competition edits (the `changes` table is in competition_schema.sql)
+CREATE TRIGGER IF NOT EXISTS trg_competitions_insert AFTER INSERT ON competitions BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.id, 'competition', NEW.id, 'insert');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_competitions_update AFTER UPDATE ON competitions BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (NEW.id, 'competition', NEW.id, 'update');
+END;
+CREATE TRIGGER IF NOT EXISTS trg_competitions_delete AFTER DELETE ON competitions BEGIN
+    INSERT INTO changes (competition_id, entity, entity_id, op) VALUES (OLD.id, 'competition', OLD.id, 'delete');
+END;
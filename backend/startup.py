@@ -0,0 +1,57 @@
+"""
+startup.py - Startup time budget
+
+create_app() and init_db() time each phase of a start with phase(); the
+phases are logged once the app is built and shown in /metrics as `startup`.
+`python bench.py startup` holds a cold start to STARTUP_BUDGET_MS.
+
+Phases are flat (no nesting), so their sum is the start time.
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+STARTUP_BUDGET_MS = 200
+
+_phases: dict[str, float] = {}
+_info:   dict = {}
+
+
+@contextmanager
+def phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - t0) * 1000)
+
+
+def record(name: str, ms: float) -> None:
+    _phases[name] = _phases.get(name, 0.0) + ms
+
+
+def note(**info) -> None:
+    """Attach facts about this start (e.g. fastStart) to the report."""
+    _info.update(info)
+
+
+def reset() -> None:
+    _phases.clear()
+    _info.clear()
+
+
+def report() -> dict:
+    return {
+        "totalMs": round(sum(_phases.values()), 1),
+        "phases":  {name: round(ms, 1) for name, ms in _phases.items()},
+        **_info,
+    }
+
+
+def log_report() -> None:
+    r = report()
+    logger.info("Started in %.0f ms (%s)", r["totalMs"],
+                ", ".join(f"{name} {ms:.0f}" for name, ms in r["phases"].items()))
@@ -3,45 +3,197 @@ stats.py - Statistics endpoints for the Monitor/leaderboard page
 
 Routes match the frontend API contract:
   GET /competitions/<cid>/stats          — full leaderboard + summary
+                                           (?waitFor=<dataVersion>&timeout=25: long-poll;
+                                            &fields=version answers with the version only)
   GET /competitions/<cid>/team-stats     — per-team only
   GET /competitions/<cid>/swimmer-stats  — per-swimmer only
+  GET /competitions/<cid>/results        — frozen results of a completed competition
+  GET /competitions/<cid>/timeseries     — laps per team per 5m / 1h bucket (?bucket=5m|1h)
+  GET /competitions/<cid>/leaderboard    — ranked page of teams or swimmers
+                                           (?by=team|swimmer&limit=&offset=&sinceMinutes=)
+  GET /competitions/<cid>/forecast       — projected laps / distance per team at end_time
+
+Once a competition is completed its stats are serialized once into
+`results_snapshots` and served from there; the snapshot is only rebuilt when an
+organizer edits the competition's data.
 """
 
+import json
+import math
+import hashlib
 import logging
 from collections import defaultdict
-from datetime import datetime, timezone
-from flask import Blueprint, jsonify
-from database import get_db
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Response, jsonify, request
+from database import get_db, attach_archive
+import changes
+from utils import utc_now_iso, parse_utc, competition_window
 
 stats_bp = Blueprint("stats", __name__)
 logger   = logging.getLogger(__name__)
 
-# RULES.md: early bird = 05:00-06:00, late bird = 00:00-01:00
-_LATE_BIRD_H  = 0
-_EARLY_BIRD_H = 5
+LONG_POLL_DEFAULT_S = 25
+LONG_POLL_MAX_S     = 55     # below common proxy read timeouts (60 s)
 
+# RULES.md: early bird = 05:00-06:00, late bird = 00:00-01:00, in the
+# competition's timezone (lap_counts.local_hour)
+LATE_BIRD_H  = 0
+EARLY_BIRD_H = 5
+
+# Bucket widths kept in `lap_buckets` (incremented on every lap write)
+TIMESERIES_BUCKETS = {"5m": 300, "1h": 3600}
+_MAX_BUCKETS       = 2000
+
+# Leaderboard sources: totals table, id column, lap_counts column
+_LEADERBOARDS = {
+    "team":    ("team_totals",    "team_id",    "team_id"),
+    "swimmer": ("swimmer_totals", "swimmer_id", "swimmer_id"),
+}
+
+# Lap-rate forecast: weight of the newest inter-lap interval, and the clamp
+# applied to it so a double tap or a long break (swimmer change, pause) does
+# not swing the rate.
+FORECAST_ALPHA  = 0.1
+_MIN_INTERVAL_S = 5
+_MAX_INTERVAL_S = 600
+# Laps refolded when a void / reassign rewrites a team's rate; older
+# intervals weigh (1 - FORECAST_ALPHA) ** 64 < 0.2 % by then.
+FORECAST_WINDOW = 64
+
+# Hot reads, shared with the query-plan checks in test_e2e.py
+TEAM_LAPS_SQL = (
+    "SELECT team_id, timestamp FROM lap_counts"
+    " WHERE competition_id=? AND voided_at IS NULL ORDER BY timestamp ASC"
+)
+SWIMMER_LAPS_SQL = (
+    "SELECT swimmer_id, timestamp FROM lap_counts"
+    " WHERE competition_id=? AND voided_at IS NULL ORDER BY timestamp ASC"
+)
+BIRD_LAPS_SQL = (                      # .format(by="team_id" | "swimmer_id")
+    "SELECT {by} AS id, local_hour, COUNT(*) AS laps FROM lap_counts"
+    " WHERE competition_id=? AND voided_at IS NULL AND local_hour IN (?, ?)"
+    " GROUP BY {by}, local_hour"
+)
+SWIMMERS_BY_NAME_SQL = (
+    "SELECT s.*, t.name as team_name, t.color as team_color"
+    " FROM swimmers s JOIN teams t ON s.team_id=t.id"
+    " WHERE s.competition_id=? ORDER BY s.name"
+)
+ACTIVE_SESSION_COUNT_SQL = "SELECT COUNT(*) FROM swim_sessions WHERE competition_id=? AND is_active=1"
+
+
+def bucket_start(ts: str, size: int) -> int:
+    return int(parse_utc(ts).timestamp()) // size * size
+
+
+def update_lap_rate(db, cid: str, team_id: str, timestamp: str) -> None:
+    """
+    Fold one recorded lap into the team's smoothed inter-lap interval
+    (exponentially weighted, seeded by the first interval). A lap older than
+    the last one seen leaves the rate untouched.
+    """
+    row = db.execute(
+        "SELECT last_lap_at, ewma_interval_s FROM team_totals WHERE competition_id=? AND team_id=?",
+        (cid, team_id),
+    ).fetchone()
+    if row is None:
+        return
+    last, now = parse_utc(row["last_lap_at"]), parse_utc(timestamp)
+    if now is None or (last is not None and now <= last):
+        return
+    db.execute(
+        "UPDATE team_totals SET last_lap_at=?, ewma_interval_s=? WHERE competition_id=? AND team_id=?",
+        (timestamp, _fold_interval(row["ewma_interval_s"], last, now), cid, team_id),
+    )
 
-def _parse_utc(ts: str):
-    if not ts:
-        return None
-    try:
-        return datetime.fromisoformat(ts.replace("Z", "+00:00"))
-    except ValueError:
-        return None
 
+def recompute_lap_rate(db, cid: str, team_id: str) -> bool:
+    """
+    Rebuild the team's last_lap_at / smoothed interval from its newest
+    FORECAST_WINDOW counted laps, after one of them was voided or moved to
+    another team (or one was moved in, possibly out of time order). Returns
+    whether the stored values were off by more than the window's rounding
+    (1 %); only then they are rewritten.
+    """
+    laps = [r[0] for r in db.execute(
+        """SELECT timestamp FROM lap_counts WHERE team_id=? AND voided_at IS NULL
+           ORDER BY timestamp DESC LIMIT ?""", (team_id, FORECAST_WINDOW),
+    )][::-1]
+    last, ewma = None, None
+    for ts in laps:
+        now = parse_utc(ts)
+        if now is None or (last is not None and now <= last):
+            continue
+        ewma, last = _fold_interval(ewma, last, now), now
+    last_lap_at = laps[-1] if laps else None
+    row = db.execute(
+        "SELECT last_lap_at, ewma_interval_s FROM team_totals WHERE competition_id=? AND team_id=?",
+        (cid, team_id),
+    ).fetchone()
+    if row is None:
+        return False
+    stored = row["ewma_interval_s"]
+    if row["last_lap_at"] == last_lap_at and (
+        stored == ewma or (stored is not None and ewma is not None and math.isclose(stored, ewma, rel_tol=0.01))
+    ):
+        return False
+    db.execute(
+        "UPDATE team_totals SET last_lap_at=?, ewma_interval_s=? WHERE competition_id=? AND team_id=?",
+        (last_lap_at, ewma, cid, team_id),
+    )
+    return True
 
-def _hour(ts: str):
-    dt = _parse_utc(ts)
-    return dt.hour if dt else None
+
+def _fold_interval(ewma: float | None, last: datetime | None, now: datetime) -> float | None:
+    """Smoothed interval after a lap at `now` following one at `last` (seeded by the first)."""
+    if last is None:
+        return ewma
+    interval = min(max((now - last).total_seconds(), _MIN_INTERVAL_S), _MAX_INTERVAL_S)
+    return interval if ewma is None else FORECAST_ALPHA * interval + (1 - FORECAST_ALPHA) * ewma
+
+
+def _bird_laps(cid: str, db, by: str) -> dict:
+    """
+    {team or swimmer id: [late bird laps, early bird laps]}, counted on the
+    local hour stored with each lap (idx_lap_counts_local_hour).
+    """
+    counts = defaultdict(lambda: [0, 0])
+    for row in db.execute(
+        BIRD_LAPS_SQL.format(by=by), (cid, LATE_BIRD_H, EARLY_BIRD_H)
+    ):
+        counts[row["id"]][row["local_hour"] == EARLY_BIRD_H] += row["laps"]
+    return counts
+
+
+def lap_metrics(laps: int, span_s: float, fastest_s: float | None) -> tuple:
+    """(lapsPerHour, fastestLapSec) from a lap count, first-to-last span and shortest gap."""
+    if laps < 2 or span_s <= 0:
+        return 0.0, None
+    return round((laps - 1) / (span_s / 3600), 2), round(float(fastest_s), 1)
+
+
+def _interval_metrics(laps: list[dict]) -> tuple:
+    """lap_metrics() for laps in timestamp order."""
+    timestamps = [t for t in (parse_utc(l["timestamp"]) for l in laps) if t]
+    if len(timestamps) < 2:
+        return 0.0, None
+    fastest = min((timestamps[i+1] - timestamps[i]).total_seconds() for i in range(len(timestamps)-1))
+    return lap_metrics(len(laps), (timestamps[-1] - timestamps[0]).total_seconds(), fastest)
+
+
+def _lane_length(cid: str, db) -> int:
+    row = db.execute("SELECT lane_length FROM competitions WHERE id=?", (cid,)).fetchone()
+    return (row["lane_length"] if row else None) or 25
 
 
 def _team_stats(cid: str, db) -> list[dict]:
+    lane_length = _lane_length(cid, db)
     teams    = {dict(r)["id"]: dict(r) for r in db.execute(
         "SELECT * FROM teams WHERE competition_id=? ORDER BY assigned_lane, name", (cid,)
     ).fetchall()}
 
     all_laps = [dict(r) for r in db.execute(
-        "SELECT team_id, timestamp FROM lap_counts WHERE competition_id=? ORDER BY timestamp ASC", (cid,)
+        TEAM_LAPS_SQL, (cid,)
     ).fetchall()]
 
     team_laps: dict[str, list] = defaultdict(list)
@@ -59,22 +211,13 @@ def _team_stats(cid: str, db) -> list[dict]:
         r = dict(row)
         active_sessions[r["team_id"]] = r
 
+    birds   = _bird_laps(cid, db, "team_id")
     results = []
     for tid, team in teams.items():
         laps  = team_laps.get(tid, [])
         total = len(laps)
-        late_bird  = sum(1 for l in laps if _hour(l["timestamp"]) == _LATE_BIRD_H)
-        early_bird = sum(1 for l in laps if _hour(l["timestamp"]) == _EARLY_BIRD_H)
-
-        timestamps   = [t for t in (_parse_utc(l["timestamp"]) for l in laps) if t]
-        laps_per_hour = fastest_lap_s = None
-        if len(timestamps) >= 2:
-            span_s = (timestamps[-1] - timestamps[0]).total_seconds()
-            if span_s > 0:
-                laps_per_hour = round((total - 1) / (span_s / 3600), 2)
-                intervals     = [(timestamps[i+1] - timestamps[i]).total_seconds()
-                                 for i in range(len(timestamps)-1)]
-                fastest_lap_s = round(min(intervals), 1) if intervals else None
+        late_bird, early_bird = birds.get(tid, (0, 0))
+        laps_per_hour, fastest_lap_s = _interval_metrics(laps)
 
         active = active_sessions.get(tid)
         results.append({
@@ -83,8 +226,9 @@ def _team_stats(cid: str, db) -> list[dict]:
             "totalLaps":      total,
             "lateBirdLaps":   late_bird,
             "earlyBirdLaps":  early_bird,
-            "lapsPerHour":    laps_per_hour or 0.0,
+            "lapsPerHour":    laps_per_hour,
             "fastestLapSec":  fastest_lap_s,
+            "distanceM":      total * lane_length,
             "activeSwimmer":  {"id": active["swimmer_id"], "name": active["swimmer_name"],
                                "laneNumber": active["lane_number"]} if active else None,
         })
@@ -93,14 +237,11 @@ def _team_stats(cid: str, db) -> list[dict]:
 
 
 def _swimmer_stats(cid: str, db) -> list[dict]:
-    rows = db.execute(
-        """SELECT s.*, t.name as team_name, t.color as team_color
-           FROM swimmers s JOIN teams t ON s.team_id=t.id
-           WHERE s.competition_id=? ORDER BY s.name""", (cid,)
-    ).fetchall()
+    lane_length = _lane_length(cid, db)
+    rows = db.execute(SWIMMERS_BY_NAME_SQL, (cid,)).fetchall()
 
     all_laps   = [dict(r) for r in db.execute(
-        "SELECT swimmer_id, timestamp FROM lap_counts WHERE competition_id=?", (cid,)
+        SWIMMER_LAPS_SQL, (cid,)
     ).fetchall()]
     sw_laps    = defaultdict(list)
     for lap in all_laps:
@@ -113,17 +254,18 @@ def _swimmer_stats(cid: str, db) -> list[dict]:
     sw_water_s = defaultdict(float)
     for s in sessions:
         if s["start_time"] and s["end_time"]:
-            st = _parse_utc(s["start_time"]); en = _parse_utc(s["end_time"])
+            st = parse_utc(s["start_time"]); en = parse_utc(s["end_time"])
             if st and en:
                 sw_water_s[s["swimmer_id"]] += (en - st).total_seconds()
 
+    birds   = _bird_laps(cid, db, "swimmer_id")
     results = []
     for sw in rows:
         s   = dict(sw); sid = s["id"]
         laps = sw_laps.get(sid, [])
         total      = len(laps)
-        late_bird  = sum(1 for l in laps if _hour(l["timestamp"]) == _LATE_BIRD_H)
-        early_bird = sum(1 for l in laps if _hour(l["timestamp"]) == _EARLY_BIRD_H)
+        late_bird, early_bird = birds.get(sid, (0, 0))
+        laps_per_hour, fastest_lap_s = _interval_metrics(laps)
         results.append({
             "swimmer":           {"id": sid, "name": s["name"], "teamId": s["team_id"],
                                   "teamName": s["team_name"], "teamColor": s["team_color"],
@@ -131,60 +273,432 @@ def _swimmer_stats(cid: str, db) -> list[dict]:
             "totalLaps":         total,
             "lateBirdLaps":      late_bird,
             "earlyBirdLaps":     early_bird,
+            "lapsPerHour":       laps_per_hour,
+            "fastestLapSec":     fastest_lap_s,
+            "distanceM":         total * lane_length,
             "totalWaterSeconds": int(sw_water_s.get(sid, 0)),
         })
     results.sort(key=lambda x: x["totalLaps"], reverse=True)
     return results
 
 
+def _hourly_stats(cid: str, db) -> list[dict]:
+    """Laps per UTC hour, overall and per team, in chronological order."""
+    hours: dict[str, dict] = {}
+    for row in db.execute(
+        """SELECT substr(timestamp, 1, 13) AS hour, team_id, COUNT(*) AS laps
+           FROM lap_counts WHERE competition_id=? AND voided_at IS NULL
+           GROUP BY hour, team_id ORDER BY hour""", (cid,)
+    ).fetchall():
+        bucket = hours.setdefault(row["hour"], {"hour": f"{row['hour']}:00:00Z", "totalLaps": 0, "teams": {}})
+        bucket["totalLaps"] += row["laps"]
+        bucket["teams"][row["team_id"]] = row["laps"]
+    return list(hours.values())
+
+
+def _live_model(db, cid: str):
+    """In-memory model of an active/paused competition (see live.py), else None."""
+    import live   # live imports events, which imports this module
+    return live.get(db, cid)
+
+
+def _stats_payload(comp: dict, db) -> dict:
+    cid   = comp["id"]
+    model = _live_model(db, cid) if comp["status"] != "completed" else None
+    if model is not None:
+        total_laps, active_count = model.total_laps(), model.active_sessions()
+        team_stats, swimmer_stats = model.team_stats(), model.swimmer_stats()
+    else:
+        total_laps   = db.execute("SELECT COUNT(*) FROM lap_counts WHERE competition_id=? AND voided_at IS NULL", (cid,)).fetchone()[0]
+        active_count = db.execute(ACTIVE_SESSION_COUNT_SQL, (cid,)).fetchone()[0]
+        team_stats, swimmer_stats = _team_stats(cid, db), _swimmer_stats(cid, db)
+
+    actual_start = parse_utc(comp.get("actual_start_time"))
+    actual_end   = parse_utc(comp.get("actual_end_time")) if comp["status"] == "completed" else None
+    until        = actual_end or datetime.now(timezone.utc)
+    elapsed_s    = int((until - actual_start).total_seconds()) if actual_start else 0
+
+    return {
+        "competition":    {"id": comp["id"], "name": comp["name"], "status": comp["status"],
+                           "numberOfLanes": comp["number_of_lanes"],
+                           "actualStartTime": comp.get("actual_start_time"),
+                           "actualEndTime":   comp.get("actual_end_time")},
+        "totalLaps":      total_laps,
+        "activeSessions": active_count,
+        "elapsedSeconds": elapsed_s,
+        "teamStats":      team_stats,
+        "swimmerStats":   swimmer_stats,
+    }
+
+
+# ── Results snapshots ─────────────────────────────────────────────────────────
+
+def build_results_snapshot(db, cid: str) -> dict | None:
+    """
+    (Re)generate the frozen results of a completed competition.
+    Caller commits. Returns the stored snapshot row, or None if not completed.
+    """
+    comp = db.execute("SELECT * FROM competitions WHERE id=?", (cid,)).fetchone()
+    if not comp or comp["status"] != "completed":
+        return None
+    attach_archive(db, cid)
+    data = _stats_payload(dict(comp), db)
+    data["hourlyStats"] = _hourly_stats(cid, db)
+    prev = db.execute("SELECT version FROM results_snapshots WHERE competition_id=?", (cid,)).fetchone()
+    data["version"]     = (prev["version"] + 1) if prev else 1
+    data["generatedAt"] = utc_now_iso()
+
+    payload = json.dumps({"data": data}, separators=(",", ":"))
+    etag    = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+    db.execute(
+        """INSERT INTO results_snapshots (competition_id, version, etag, payload, generated_at)
+           VALUES (?,?,?,?,?)
+           ON CONFLICT(competition_id) DO UPDATE SET
+               version=excluded.version, etag=excluded.etag,
+               payload=excluded.payload, generated_at=excluded.generated_at""",
+        (cid, data["version"], etag, payload, data["generatedAt"]),
+    )
+    logger.info("Results snapshot v%d generated for competition %s", data["version"], cid)
+    return {"version": data["version"], "etag": etag, "payload": payload}
+
+
+def refresh_results_snapshot(db, cid: str) -> None:
+    """Rebuild an existing snapshot after an organizer edit (no-op otherwise)."""
+    if db.execute("SELECT 1 FROM results_snapshots WHERE competition_id=?", (cid,)).fetchone():
+        if build_results_snapshot(db, cid) is None:
+            db.execute("DELETE FROM results_snapshots WHERE competition_id=?", (cid,))
+
+
+def _load_snapshot(cid: str) -> dict | None:
+    with get_db(cid) as db:
+        row = db.execute(
+            "SELECT version, etag, payload FROM results_snapshots WHERE competition_id=?", (cid,)
+        ).fetchone()
+        if row:
+            return dict(row)
+        # Competitions completed before snapshots existed: build on first request.
+        snap = build_results_snapshot(db, cid)
+        db.commit()
+    return snap
+
+
+def _snapshot_response(snap: dict):
+    etag = f'"{snap["etag"]}"'
+    # A versioned URL (?v=<version>) never changes content: cache it forever.
+    # The bare URL may be regenerated after an organizer edit, so revalidate.
+    if request.args.get("v") == str(snap["version"]):
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=60, must-revalidate"
+
+    if request.if_none_match.contains(snap["etag"]):
+        resp = Response(status=304)
+    else:
+        resp = Response(snap["payload"], status=200, mimetype="application/json")
+    resp.headers["ETag"]          = etag
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+
 def _not_found_comp():
     return jsonify({"error": "Competition not found"}), 404
 
 
+def load_stats(cid: str) -> tuple[str | None, dict | None]:
+    """
+    What /stats serves: ("live", stats payload) while a competition runs,
+    ("snapshot", snapshot row) once it is completed, (None, None) if unknown.
+    """
+    with get_db(cid) as db:
+        comp = db.execute("SELECT * FROM competitions WHERE id=?", (cid,)).fetchone()
+        if not comp:
+            return None, None
+        comp = dict(comp)
+        if comp["status"] != "completed":
+            return "live", _stats_payload(comp, db)
+    return "snapshot", _load_snapshot(cid)
+
+
+def long_poll_timeout(value) -> float:
+    """The ?timeout= of a long-poll, clamped to 0..LONG_POLL_MAX_S."""
+    try:
+        return min(max(float(value), 0.0), LONG_POLL_MAX_S)
+    except (TypeError, ValueError):
+        return LONG_POLL_DEFAULT_S
+
+
 @stats_bp.route("/competitions/<cid>/stats", methods=["GET"])
 def competition_stats(cid):
-    with get_db() as db:
+    """
+    With ?waitFor=<dataVersion> the request is held until the competition's
+    data version (changes.py) passes that value or ?timeout= seconds expire,
+    and the stats carry the version they were read at as `dataVersion`.
+    ?fields=version answers with `dataVersion` alone, for clients that
+    reload from other endpoints anyway.
+    """
+    wait_for = request.args.get("waitFor", type=int)
+    if wait_for is None:
+        kind, body = load_stats(cid)
+        if kind is None:
+            return _not_found_comp()
+        if kind == "live":
+            return jsonify({"data": body}), 200
+        return _snapshot_response(body)
+
+    # The version is read before the stats, so they are never older than it.
+    version = changes.wait_for_version(cid, wait_for, long_poll_timeout(request.args.get("timeout")))
+    if version is None:
+        return _not_found_comp()
+    if request.args.get("fields") == "version":
+        data = {"dataVersion": version}
+    else:
+        kind, body = load_stats(cid)
+        if kind is None:
+            return _not_found_comp()
+        data = body if kind == "live" else json.loads(body["payload"])["data"]
+        data["dataVersion"] = version
+    resp = jsonify({"data": data})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@stats_bp.route("/competitions/<cid>/timeseries", methods=["GET"])
+def competition_timeseries(cid):
+    """
+    Dense per-team lap counts per bucket, from the competition start up to
+    now (or its end), read from the pre-aggregated `lap_buckets` counters.
+    """
+    label = request.args.get("bucket", "1h")
+    size  = TIMESERIES_BUCKETS.get(label)
+    if not size:
+        return jsonify({"error": f"bucket must be one of: {', '.join(TIMESERIES_BUCKETS)}"}), 400
+
+    with get_db(cid) as db:
         comp = db.execute("SELECT * FROM competitions WHERE id=?", (cid,)).fetchone()
         if not comp:
             return _not_found_comp()
-        comp         = dict(comp)
-        team_stats   = _team_stats(cid, db)
-        swimmer_stats = _swimmer_stats(cid, db)
-        total_laps   = db.execute("SELECT COUNT(*) FROM lap_counts WHERE competition_id=?", (cid,)).fetchone()[0]
-        active_count = db.execute("SELECT COUNT(*) FROM swim_sessions WHERE competition_id=? AND is_active=1", (cid,)).fetchone()[0]
-
-    now          = datetime.now(timezone.utc)
-    actual_start = _parse_utc(comp.get("actual_start_time"))
-    elapsed_s    = int((now - actual_start).total_seconds()) if actual_start else 0
-
-    return jsonify({
-        "data": {
-            "competition":    {"id": comp["id"], "name": comp["name"], "status": comp["status"],
-                               "numberOfLanes": comp["number_of_lanes"],
-                               "actualStartTime": comp.get("actual_start_time"),
-                               "actualEndTime":   comp.get("actual_end_time")},
-            "totalLaps":      total_laps,
-            "activeSessions": active_count,
-            "elapsedSeconds": elapsed_s,
-            "teamStats":      team_stats,
-            "swimmerStats":   swimmer_stats,
-        }
-    }), 200
+        comp  = dict(comp)
+        teams = [dict(r) for r in db.execute(
+            "SELECT id, name, color, assigned_lane FROM teams WHERE competition_id=? ORDER BY assigned_lane, name",
+            (cid,),
+        ).fetchall()]
+        rows = db.execute(
+            "SELECT team_id, bucket, laps FROM lap_buckets WHERE competition_id=? AND size=? ORDER BY bucket",
+            (cid, size),
+        ).fetchall()
+
+    planned_start, planned_end = competition_window(comp)
+    start = parse_utc(comp.get("actual_start_time")) or planned_start
+    end   = parse_utc(comp.get("actual_end_time")) if comp["status"] == "completed" else None
+    if end is None and planned_end:
+        end = min(datetime.now(timezone.utc), planned_end)
+
+    edges = [r["bucket"] for r in rows]
+    if start and end and end >= start:
+        edges += [int(start.timestamp()) // size * size, int(end.timestamp()) // size * size]
+    if not edges:
+        first, count = 0, 0
+    else:
+        # Keep the most recent buckets if the span is implausibly long.
+        last  = max(edges)
+        first = max(min(edges), last - (_MAX_BUCKETS - 1) * size)
+        count = (last - first) // size + 1
+
+    series = {t["id"]: [0] * count for t in teams}
+    total  = [0] * count
+    for r in rows:
+        i = (r["bucket"] - first) // size
+        if 0 <= i < count and r["team_id"] in series:
+            series[r["team_id"]][i] = r["laps"]
+            total[i] += r["laps"]
+
+    return jsonify({"data": {
+        "bucket":        label,
+        "bucketSeconds": size,
+        "buckets":       [datetime.fromtimestamp(first + i * size, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                          for i in range(count)],
+        "teams":         [{"team": {"id": t["id"], "name": t["name"], "color": t["color"],
+                                    "assignedLane": t["assigned_lane"]},
+                           "laps": series[t["id"]]} for t in teams],
+        "total":         total,
+    }}), 200
+
+
+def _leaderboard(db, cid: str, by: str, limit: int, offset: int, since_minutes: int) -> dict:
+    """
+    One page of the ranking, read in order from the (competition_id, laps DESC)
+    index on the materialized totals. Ranks are competition ranks (ties share
+    a rank). rankDelta compares with the ranking `since_minutes` ago, derived
+    from the laps recorded since then (a range scan on lap time).
+    """
+    table, key, lap_col = _LEADERBOARDS[by]
+    page = [dict(r) for r in db.execute(
+        f"SELECT {key} AS id, laps FROM {table} WHERE competition_id=? ORDER BY laps DESC, {key} LIMIT ? OFFSET ?",
+        (cid, limit, offset),
+    ).fetchall()]
+    total = db.execute(f"SELECT COUNT(*) FROM {table} WHERE competition_id=?", (cid,)).fetchone()[0]
+
+    def count_above(laps: int) -> int:
+        return db.execute(
+            f"SELECT COUNT(*) FROM {table} WHERE competition_id=? AND laps > ?", (cid, laps)
+        ).fetchone()[0]
+
+    # Current ranks: one index count for the page head, the rest follow from order.
+    for i, entry in enumerate(page):
+        if i == 0:
+            entry["rank"] = count_above(entry["laps"]) + 1
+        elif entry["laps"] == page[i - 1]["laps"]:
+            entry["rank"] = page[i - 1]["rank"]
+        else:
+            entry["rank"] = offset + i + 1
+
+    # Ranks `since_minutes` ago: only entries with recent laps moved.
+    since  = (datetime.now(timezone.utc) - timedelta(minutes=since_minutes)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    recent = {r[0]: r[1] for r in db.execute(
+        f"""SELECT {lap_col}, COUNT(*) FROM lap_counts
+            WHERE competition_id=? AND timestamp > ? AND voided_at IS NULL GROUP BY {lap_col}""",
+        (cid, since),
+    ).fetchall()}
+    moved = {}
+    if recent:
+        placeholders = ",".join("?" * len(recent))
+        moved = {r[0]: r[1] for r in db.execute(
+            f"SELECT {key}, laps FROM {table} WHERE competition_id=? AND {key} IN ({placeholders})",
+            (cid, *recent),
+        ).fetchall()}
+    past_moved = [laps - recent[i] for i, laps in moved.items()]
+    for entry in page:
+        past = entry["laps"] - recent.get(entry["id"], 0)
+        # entries above `past` now, minus movers that were not above it then
+        above_then = (count_above(past)
+                      - sum(1 for laps in moved.values() if laps > past)
+                      + sum(1 for laps in past_moved if laps > past))
+        entry["rankDelta"] = (above_then + 1) - entry["rank"]
+
+    ids = [e["id"] for e in page]
+    if ids:
+        placeholders = ",".join("?" * len(ids))
+        if by == "team":
+            info = {r["id"]: {"id": r["id"], "name": r["name"], "color": r["color"],
+                              "assignedLane": r["assigned_lane"]}
+                    for r in db.execute(f"SELECT * FROM teams WHERE id IN ({placeholders})", ids)}
+        else:
+            info = {r["id"]: {"id": r["id"], "name": r["name"], "teamId": r["team_id"],
+                              "teamName": r["team_name"], "teamColor": r["team_color"]}
+                    for r in db.execute(
+                        f"""SELECT s.id, s.name, s.team_id, t.name AS team_name, t.color AS team_color
+                            FROM swimmers s JOIN teams t ON t.id = s.team_id
+                            WHERE s.id IN ({placeholders})""", ids)}
+    return {
+        "by":           by,
+        "total":        total,
+        "limit":        limit,
+        "offset":       offset,
+        "sinceMinutes": since_minutes,
+        "entries":      [{"rank": e["rank"], "rankDelta": e["rankDelta"], "totalLaps": e["laps"],
+                          by: info.get(e["id"])} for e in page],
+    }
+
+
+@stats_bp.route("/competitions/<cid>/leaderboard", methods=["GET"])
+def competition_leaderboard(cid):
+    by = request.args.get("by", "team")
+    if by not in _LEADERBOARDS:
+        return jsonify({"error": "by must be 'team' or 'swimmer'"}), 400
+    limit         = max(1, min(request.args.get("limit", 10, type=int), 500))
+    offset        = max(0, request.args.get("offset", 0, type=int))
+    since_minutes = max(1, request.args.get("sinceMinutes", 15, type=int))
+
+    with get_db(cid) as db:
+        if not db.execute("SELECT 1 FROM competitions WHERE id=?", (cid,)).fetchone():
+            return _not_found_comp()
+        data = _leaderboard(db, cid, by, limit, offset, since_minutes)
+    return jsonify({"data": data}), 200
+
+
+def _forecast(db, comp: dict) -> dict:
+    """
+    Projected totals at the competition end: current laps plus the remaining
+    time at each team's smoothed lap rate. Reads one totals row per team.
+    """
+    _, end = competition_window(comp)
+    if comp["status"] == "completed":
+        remaining = 0.0
+    elif end is None:
+        remaining = None
+    else:
+        remaining = max(0.0, (end - datetime.now(timezone.utc)).total_seconds())
+    lane_length = comp.get("lane_length") or 25
+
+    teams = []
+    for r in db.execute(
+        """SELECT t.id, t.name, t.color, t.assigned_lane, tt.laps, tt.last_lap_at, tt.ewma_interval_s
+           FROM team_totals tt JOIN teams t ON t.id = tt.team_id
+           WHERE tt.competition_id=? ORDER BY tt.laps DESC, t.name""",
+        (comp["id"],),
+    ):
+        ewma      = r["ewma_interval_s"]
+        projected = r["laps"] + (remaining / ewma if ewma and remaining else 0)
+        teams.append({
+            "team":               {"id": r["id"], "name": r["name"], "color": r["color"],
+                                   "assignedLane": r["assigned_lane"]},
+            "totalLaps":          r["laps"],
+            "lastLapAt":          r["last_lap_at"],
+            "lapsPerHour":        round(3600 / ewma, 2) if ewma else None,
+            "projectedLaps":      int(projected),
+            "projectedDistanceM": int(projected) * lane_length,
+        })
+    return {
+        "endTime":          end.strftime("%Y-%m-%dT%H:%M:%SZ") if end else None,
+        "remainingSeconds": int(remaining) if remaining is not None else None,
+        "laneLength":       lane_length,
+        "teams":            teams,
+    }
+
+
+@stats_bp.route("/competitions/<cid>/forecast", methods=["GET"])
+def competition_forecast(cid):
+    with get_db(cid) as db:
+        comp = db.execute("SELECT * FROM competitions WHERE id=?", (cid,)).fetchone()
+        if not comp:
+            return _not_found_comp()
+        data = _forecast(db, dict(comp))
+    return jsonify({"data": data}), 200
+
+
+@stats_bp.route("/competitions/<cid>/results", methods=["GET"])
+def competition_results(cid):
+    snap = None
+    with get_db() as db:
+        comp = db.execute("SELECT status FROM competitions WHERE id=?", (cid,)).fetchone()
+    if comp and comp["status"] == "completed":
+        snap = _load_snapshot(cid)
+        if snap is None:
+            # Deleted or reopened since the status check: answer for its state now.
+            with get_db() as db:
+                comp = db.execute("SELECT status FROM competitions WHERE id=?", (cid,)).fetchone()
+    if not comp:
+        return _not_found_comp()
+    if snap is None:
+        return jsonify({"error": "Results are available once the competition is completed"}), 409
+    return _snapshot_response(snap)
 
 
 @stats_bp.route("/competitions/<cid>/team-stats", methods=["GET"])
 def team_stats(cid):
-    with get_db() as db:
+    with get_db(cid) as db:
         if not db.execute("SELECT id FROM competitions WHERE id=?", (cid,)).fetchone():
             return _not_found_comp()
-        data = _team_stats(cid, db)
+        model = _live_model(db, cid)
+        data  = model.team_stats() if model else _team_stats(cid, db)
     return jsonify({"data": data}), 200
 
 
 @stats_bp.route("/competitions/<cid>/swimmer-stats", methods=["GET"])
 def swimmer_stats(cid):
-    with get_db() as db:
+    with get_db(cid) as db:
         if not db.execute("SELECT id FROM competitions WHERE id=?", (cid,)).fetchone():
             return _not_found_comp()
-        data = _swimmer_stats(cid, db)
+        model = _live_model(db, cid)
+        data  = model.swimmer_stats() if model else _swimmer_stats(cid, db)
     return jsonify({"data": data}), 200
@@ -2,46 +2,46 @@
 swim_sessions.py - Swim session endpoints
 GET  /swim-sessions
 POST /swim-sessions
+POST /swim-sessions/handover
 PUT  /swim-sessions/<id>
 """
 
 import logging
+import sqlite3
 from flask import Blueprint, request
-from database import get_db
+from database import get_db, begin_write, locate_competition
+import live
+import repository
+from events import append_event, SESSION_STARTED, SESSION_ENDED
+from stats import refresh_results_snapshot
 from utils import (
     new_uuid, ok, created, error, not_found, conflict,
-    serialize_session,
+    serialize_session, utc_now_iso,
 )
 
 sessions_bp = Blueprint("swim_sessions", __name__)
 logger      = logging.getLogger(__name__)
 
+ACTIVE_SESSION_SQL = "SELECT * FROM swim_sessions WHERE competition_id = ? AND team_id = ? AND is_active = 1"
+
+
+def _is_active_conflict(exc: sqlite3.IntegrityError) -> bool:
+    """True when the insert/update hit idx_swim_sessions_one_active."""
+    return "swim_sessions.competition_id, swim_sessions.team_id" in str(exc)
+
 
 @sessions_bp.route("/swim-sessions", methods=["GET"])
 def list_sessions():
     competition_id = request.args.get("competitionId")
     team_id        = request.args.get("teamId")
     is_active_str  = request.args.get("isActive")
+    is_active      = None if is_active_str is None else is_active_str.lower() in ("true", "1")
 
-    query  = "SELECT * FROM swim_sessions WHERE 1=1"
-    params = []
-
-    if competition_id:
-        query += " AND competition_id = ?"
-        params.append(competition_id)
-    if team_id:
-        query += " AND team_id = ?"
-        params.append(team_id)
-    if is_active_str is not None:
-        query += " AND is_active = ?"
-        params.append(1 if is_active_str.lower() in ("true", "1") else 0)
-
-    query += " ORDER BY start_time DESC"
+    cid = competition_id or (team_id and locate_competition("teams", team_id))
+    with get_db(cid) as db:
+        rows = repository.list_swim_sessions(db, competition_id or None, team_id or None, is_active)
 
-    with get_db() as db:
-        rows = db.execute(query, params).fetchall()
-
-    return ok([serialize_session(dict(r)) for r in rows])
+    return ok(rows)
 
 
 @sessions_bp.route("/swim-sessions", methods=["POST"])
@@ -63,7 +63,7 @@ def create_session():
     lane_number    = int(data["laneNumber"])
 
     # Validate competition is active
-    with get_db() as db:
+    with get_db(competition_id) as db:
         comp = db.execute(
             "SELECT status FROM competitions WHERE id = ?", (competition_id,)
         ).fetchone()
@@ -72,18 +72,8 @@ def create_session():
     if dict(comp)["status"] != "active":
         return error(f"Competition is not active (status: {dict(comp)['status']})")
 
-    # RULES: one swimmer per team in water at a time
-    with get_db() as db:
-        active = db.execute(
-            """SELECT id FROM swim_sessions
-               WHERE competition_id = ? AND team_id = ? AND is_active = 1""",
-            (competition_id, team_id),
-        ).fetchone()
-    if active:
-        return conflict("Team already has an active swimmer")
-
     # Validate swimmer exists and belongs to team
-    with get_db() as db:
+    with get_db(competition_id) as db:
         swimmer = db.execute(
             "SELECT id FROM swimmers WHERE id = ? AND team_id = ?",
             (swimmer_id, team_id),
@@ -92,24 +82,123 @@ def create_session():
         return error("Swimmer not found or does not belong to this team", 404)
 
     sess_id = new_uuid()
-    with get_db() as db:
-        db.execute(
-            """INSERT INTO swim_sessions
-               (id, competition_id, swimmer_id, team_id, lane_number, lap_count, is_active)
-               VALUES (?,?,?,?,?,0,1)""",
-            (sess_id, competition_id, swimmer_id, team_id, lane_number),
-        )
-        db.commit()
+    with get_db(competition_id) as db:
+        # RULES: one swimmer per team in water at a time — enforced by the
+        # partial unique index, so concurrent starts cannot both succeed.
+        try:
+            db.execute(
+                """INSERT INTO swim_sessions
+                   (id, competition_id, swimmer_id, team_id, lane_number, lap_count, is_active)
+                   VALUES (?,?,?,?,?,0,1)""",
+                (sess_id, competition_id, swimmer_id, team_id, lane_number),
+            )
+        except sqlite3.IntegrityError as exc:
+            if not _is_active_conflict(exc):
+                raise
+            return conflict("Team already has an active swimmer")
         row = db.execute("SELECT * FROM swim_sessions WHERE id = ?", (sess_id,)).fetchone()
+        append_event(db, competition_id, SESSION_STARTED, entity_id=sess_id, team_id=team_id,
+                     swimmer_id=swimmer_id, lane_number=lane_number, timestamp=row["start_time"])
+        db.commit()
+        live.catch_up(db, competition_id)
 
     logger.info("Session started: swimmer %s team %s lane %d", swimmer_id, team_id, lane_number)
     return created(serialize_session(dict(row)))
 
 
+@sessions_bp.route("/swim-sessions/handover", methods=["POST"])
+def handover_session():
+    """
+    Relay swap: end the team's active session and start the next swimmer's in
+    one transaction, so the team is never without (or with two) swimmers in
+    the water. Both timestamps are the server's clock.
+    Optional `fromSessionId` guards against swapping out the wrong swimmer.
+    """
+    data = request.get_json(silent=True) or {}
+
+    required = ["competitionId", "teamId", "swimmerId"]
+    missing  = [f for f in required if not data.get(f)]
+    if missing:
+        return error(f"Missing required fields: {', '.join(missing)}")
+
+    competition_id = data["competitionId"]
+    team_id        = data["teamId"]
+    swimmer_id     = data["swimmerId"]
+
+    with get_db(competition_id) as db:
+        # Take the write lock (of the shard only, for sharded competitions)
+        # before reading, so a concurrent start or handover for the same team
+        # cannot slip in between check and insert.
+        begin_write(db)
+        try:
+            comp = db.execute(
+                "SELECT status FROM competitions WHERE id = ?", (competition_id,)
+            ).fetchone()
+            if not comp:
+                return error("Competition not found", 404)
+            if comp["status"] != "active":
+                return error(f"Competition is not active (status: {comp['status']})")
+
+            team = db.execute(
+                "SELECT assigned_lane FROM teams WHERE id = ? AND competition_id = ?",
+                (team_id, competition_id),
+            ).fetchone()
+            swimmer = db.execute(
+                "SELECT id FROM swimmers WHERE id = ? AND team_id = ?", (swimmer_id, team_id)
+            ).fetchone()
+            if not team or not swimmer:
+                return error("Swimmer not found or does not belong to this team", 404)
+
+            current = db.execute(ACTIVE_SESSION_SQL, (competition_id, team_id)).fetchone()
+            if data.get("fromSessionId") and (not current or current["id"] != data["fromSessionId"]):
+                return conflict("Session to hand over from is no longer active")
+            if current and current["swimmer_id"] == swimmer_id:
+                return conflict("Swimmer is already in the water")
+
+            lane_number = int(data.get("laneNumber")
+                              or (current["lane_number"] if current else team["assigned_lane"]))
+            now = utc_now_iso()
+            if current:
+                db.execute("UPDATE swim_sessions SET is_active=0, end_time=? WHERE id=?", (now, current["id"]))
+                append_event(db, competition_id, SESSION_ENDED, entity_id=current["id"], team_id=team_id,
+                             swimmer_id=current["swimmer_id"], lane_number=current["lane_number"],
+                             timestamp=now)
+
+            sess_id = new_uuid()
+            db.execute(
+                """INSERT INTO swim_sessions
+                   (id, competition_id, swimmer_id, team_id, lane_number, start_time, lap_count, is_active)
+                   VALUES (?,?,?,?,?,?,0,1)""",
+                (sess_id, competition_id, swimmer_id, team_id, lane_number, now),
+            )
+            append_event(db, competition_id, SESSION_STARTED, entity_id=sess_id, team_id=team_id,
+                         swimmer_id=swimmer_id, lane_number=lane_number, timestamp=now)
+            db.commit()
+            live.catch_up(db, competition_id)
+        finally:
+            if db.in_transaction:
+                db.rollback()
+
+        ended   = (db.execute("SELECT * FROM swim_sessions WHERE id = ?", (current["id"],)).fetchone()
+                   if current else None)
+        started = db.execute("SELECT * FROM swim_sessions WHERE id = ?", (sess_id,)).fetchone()
+
+    logger.info("Handover: team %s lane %d %s -> %s", team_id, lane_number,
+                current["swimmer_id"] if current else "-", swimmer_id)
+    return created({
+        "ended":   serialize_session(dict(ended)) if ended else None,
+        "started": serialize_session(dict(started)),
+    })
+
+
 @sessions_bp.route("/swim-sessions/<sess_id>", methods=["PUT"])
 def update_session(sess_id):
-    """Update a swim session — primarily used to end it."""
-    with get_db() as db:
+    """
+    Update a swim session — primarily used to end it. Sessions of sharded
+    competitions need `competitionId` (query string or body).
+    """
+    cid = request.args.get("competitionId") or (request.get_json(silent=True) or {}).get("competitionId")
+    with get_db(cid) as db:
         existing = db.execute(
             "SELECT * FROM swim_sessions WHERE id = ?", (sess_id,)
         ).fetchone()
@@ -123,13 +212,41 @@ def update_session(sess_id):
     lap_count = data.get("lapCount", ex["lap_count"])
     is_active = data.get("isActive", bool(ex["is_active"]))
 
-    with get_db() as db:
-        db.execute(
-            "UPDATE swim_sessions SET end_time=?, lap_count=?, is_active=? WHERE id=?",
-            (end_time, int(lap_count), int(is_active), sess_id),
-        )
+    with get_db(cid) as db:
+        try:
+            db.execute(
+                "UPDATE swim_sessions SET end_time=?, lap_count=?, is_active=? WHERE id=?",
+                (end_time, int(lap_count), int(is_active), sess_id),
+            )
+        except sqlite3.IntegrityError as exc:
+            if not _is_active_conflict(exc):
+                raise
+            return conflict("Team already has an active swimmer")
+        if bool(ex["is_active"]) != bool(is_active):
+            append_event(db, ex["competition_id"], SESSION_STARTED if is_active else SESSION_ENDED,
+                         entity_id=sess_id, team_id=ex["team_id"], swimmer_id=ex["swimmer_id"],
+                         lane_number=ex["lane_number"], timestamp=None if is_active else end_time)
+        refresh_results_snapshot(db, ex["competition_id"])
         db.commit()
+        live.catch_up(db, ex["competition_id"])
         row = db.execute("SELECT * FROM swim_sessions WHERE id = ?", (sess_id,)).fetchone()
 
     logger.info("Session updated: %s active=%s", sess_id, is_active)
     return ok(serialize_session(dict(row)))
+
+
+def close_active_sessions(db, competition_id: str, end_time: str,
+                          team_id: str | None = None, swimmer_id: str | None = None) -> int:
+    """End every open session of a competition (or of one team / swimmer in it)."""
+    query  = "SELECT * FROM swim_sessions WHERE competition_id=? AND is_active=1"
+    params = [competition_id]
+    if team_id:
+        query += " AND team_id=?"; params.append(team_id)
+    if swimmer_id:
+        query += " AND swimmer_id=?"; params.append(swimmer_id)
+    open_sessions = db.execute(query, params).fetchall()
+    for s in open_sessions:
+        db.execute("UPDATE swim_sessions SET is_active=0, end_time=? WHERE id=?", (end_time, s["id"]))
+        append_event(db, competition_id, SESSION_ENDED, entity_id=s["id"], team_id=s["team_id"],
+                     swimmer_id=s["swimmer_id"], lane_number=s["lane_number"], timestamp=end_time)
+    return len(open_sessions)
@@ -8,8 +8,13 @@ DELETE /swimmers/<id>
 
 import logging
 from flask import Blueprint, request
-from database import get_db
-from utils import new_uuid, ok, created, success, error, not_found, serialize_swimmer
+from database import get_db, locate_competition, register_shard_rows, forget_shard_rows
+import live
+import repository
+from stats import refresh_results_snapshot, recompute_lap_rate
+from lap_counts import void_laps
+from swim_sessions import close_active_sessions
+from utils import new_uuid, ok, created, success, error, not_found, serialize_swimmer, utc_now_iso
 
 swimmers_bp = Blueprint("swimmers", __name__)
 logger      = logging.getLogger(__name__)
@@ -20,17 +25,10 @@ def list_swimmers():
     competition_id = request.args.get("competitionId")
     team_id        = request.args.get("teamId")
 
-    query  = "SELECT * FROM swimmers WHERE 1=1"
-    params = []
-    if competition_id:
-        query += " AND competition_id = ?"; params.append(competition_id)
-    if team_id:
-        query += " AND team_id = ?";        params.append(team_id)
-    query += " ORDER BY name"
-
-    with get_db() as db:
-        rows = db.execute(query, params).fetchall()
-    return ok([serialize_swimmer(dict(r)) for r in rows])
+    cid = competition_id or (team_id and locate_competition("teams", team_id))
+    with get_db(cid) as db:
+        rows = repository.list_swimmers(db, competition_id or None, team_id or None)
+    return ok(rows)
 
 
 @swimmers_bp.route("/swimmers", methods=["POST"])
@@ -52,7 +50,7 @@ def create_swimmer():
     if is_under_12 and not parent_contact:
         return error("parentContact is required for swimmers under 12")
 
-    with get_db() as db:
+    with get_db(data["competitionId"]) as db:
         team = db.execute("SELECT id, competition_id FROM teams WHERE id=?", (data["teamId"],)).fetchone()
     if not team:
         return error("Team not found", 404)
@@ -60,7 +58,7 @@ def create_swimmer():
         return error("Team does not belong to this competition")
 
     sid = new_uuid()
-    with get_db() as db:
+    with get_db(data["competitionId"]) as db:
         db.execute(
             """INSERT INTO swimmers
                (id, name, team_id, competition_id, is_under_12, parent_name, parent_contact, parent_present)
@@ -69,16 +67,23 @@ def create_swimmer():
              int(is_under_12), parent_name, parent_contact,
              int(bool(data.get("parentPresent", False)))),
         )
+        db.execute(
+            "INSERT INTO swimmer_totals (competition_id, swimmer_id, team_id, laps) VALUES (?,?,?,0)",
+            (data["competitionId"], sid, data["teamId"]),
+        )
+        register_shard_rows(db, data["competitionId"], sid)
         db.commit()
         row = db.execute("SELECT * FROM swimmers WHERE id=?", (sid,)).fetchone()
 
+    live.invalidate(data["competitionId"])
     logger.info("Swimmer created: %s", data["name"])
     return created(serialize_swimmer(dict(row)))
 
 
 @swimmers_bp.route("/swimmers/<sid>", methods=["PUT"])
 def update_swimmer(sid):
-    with get_db() as db:
+    cid = locate_competition("swimmers", sid)
+    with get_db(cid) as db:
         existing = db.execute("SELECT * FROM swimmers WHERE id=?", (sid,)).fetchone()
     if not existing:
         return not_found("Swimmer")
@@ -95,30 +100,38 @@ def update_swimmer(sid):
     if is_under_12 and not parent_contact:
         return error("parentContact is required for swimmers under 12")
 
-    with get_db() as db:
+    with get_db(cid) as db:
         db.execute(
             "UPDATE swimmers SET name=?, is_under_12=?, parent_name=?, parent_contact=?, parent_present=? WHERE id=?",
             (data.get("name", ex["name"]), int(is_under_12), parent_name, parent_contact,
              int(bool(data.get("parentPresent", bool(ex.get("parent_present", 0))))), sid),
         )
         row = db.execute("SELECT * FROM swimmers WHERE id=?", (sid,)).fetchone()
+        refresh_results_snapshot(db, ex["competition_id"])
 
+    live.invalidate(ex["competition_id"])
     return ok(serialize_swimmer(dict(row)))
 
 
 @swimmers_bp.route("/swimmers/<sid>", methods=["DELETE"])
 def delete_swimmer(sid):
-    with get_db() as db:
-        if not db.execute("SELECT id FROM swimmers WHERE id=?", (sid,)).fetchone():
+    cid = locate_competition("swimmers", sid)
+    with get_db(cid) as db:
+        swimmer = db.execute("SELECT competition_id, team_id FROM swimmers WHERE id=?", (sid,)).fetchone()
+        if not swimmer:
             return not_found("Swimmer")
         # End any active sessions for this swimmer before cascade-deleting
-        db.execute(
-            "UPDATE swim_sessions SET is_active=0, end_time=datetime('now') WHERE swimmer_id=? AND is_active=1",
-            (sid,)
-        )
-        # lap_counts.swimmer_id → swimmers.id is CASCADE, so this is safe
+        close_active_sessions(db, swimmer["competition_id"], utc_now_iso(), swimmer_id=sid)
+        # lap_counts.swimmer_id → swimmers.id is CASCADE, so this is safe;
+        # take the laps out of the team totals and the event log first, and
+        # rebuild the team's lap rate once they are gone.
+        void_laps(db, swimmer["competition_id"], "swimmer deleted", swimmer_id=sid)
+        forget_shard_rows(db, swimmer["competition_id"], sid)
         db.execute("DELETE FROM swimmers WHERE id=?", (sid,))
+        recompute_lap_rate(db, swimmer["competition_id"], swimmer["team_id"])
+        refresh_results_snapshot(db, swimmer["competition_id"])
         db.commit()
 
+    live.invalidate(swimmer["competition_id"])
     logger.info("Swimmer deleted: %s", sid)
     return success()
@@ -8,8 +8,13 @@ DELETE /teams/<id>
 
 import logging
 from flask import Blueprint, request
-from database import get_db
-from utils import new_uuid, ok, created, success, error, not_found, serialize_team
+from database import get_db, locate_competition, register_shard_rows, forget_shard_rows
+import live
+import repository
+from lap_counts import void_laps
+from stats import refresh_results_snapshot
+from swim_sessions import close_active_sessions
+from utils import new_uuid, ok, created, success, error, not_found, serialize_team, utc_now_iso
 
 teams_bp = Blueprint("teams", __name__)
 logger   = logging.getLogger(__name__)
@@ -20,17 +25,9 @@ def list_teams():
     competition_id = request.args.get("competitionId")
     lane_number    = request.args.get("laneNumber", type=int)
 
-    query  = "SELECT * FROM teams WHERE 1=1"
-    params = []
-    if competition_id:
-        query += " AND competition_id = ?"; params.append(competition_id)
-    if lane_number is not None:
-        query += " AND assigned_lane = ?";  params.append(lane_number)
-    query += " ORDER BY assigned_lane, name"
-
-    with get_db() as db:
-        rows = db.execute(query, params).fetchall()
-    return ok([serialize_team(dict(r)) for r in rows])
+    with get_db(competition_id) as db:
+        rows = repository.list_teams(db, competition_id or None, lane_number)
+    return ok(rows)
 
 
 @teams_bp.route("/teams", methods=["POST"])
@@ -46,7 +43,7 @@ def create_team():
     color          = data["color"]
     lane           = int(data["assignedLane"])
 
-    with get_db() as db:
+    with get_db(competition_id) as db:
         if not db.execute("SELECT id FROM competitions WHERE id=?", (competition_id,)).fetchone():
             return error("Competition not found", 404)
         # RULES: same color on same lane is forbidden (different lanes allowed)
@@ -57,21 +54,26 @@ def create_team():
             return error("A team with the same color already exists on this lane")
 
     tid = new_uuid()
-    with get_db() as db:
+    with get_db(competition_id) as db:
         db.execute(
             "INSERT INTO teams (id, name, color, logo, competition_id, assigned_lane) VALUES (?,?,?,?,?,?)",
             (tid, data["name"], color, data.get("logo"), competition_id, lane),
         )
+        # Zero row so the team is on the leaderboard index before its first lap
+        db.execute("INSERT INTO team_totals (competition_id, team_id, laps) VALUES (?,?,0)", (competition_id, tid))
+        register_shard_rows(db, competition_id, tid)
         row = db.execute("SELECT * FROM teams WHERE id=?", (tid,)).fetchone()
         db.commit()
 
+    live.invalidate(competition_id)
     logger.info("Team created: %s on lane %d", data["name"], lane)
     return created(serialize_team(dict(row)))
 
 
 @teams_bp.route("/teams/<tid>", methods=["PUT"])
 def update_team(tid):
-    with get_db() as db:
+    cid = locate_competition("teams", tid)
+    with get_db(cid) as db:
         existing = db.execute("SELECT * FROM teams WHERE id=?", (tid,)).fetchone()
     if not existing:
         return not_found("Team")
@@ -83,35 +85,45 @@ def update_team(tid):
 
     # Conflict check excluding self
     if new_color != ex["color"] or new_lane != ex["assigned_lane"]:
-        with get_db() as db:
+        with get_db(cid) as db:
             if db.execute(
                 "SELECT id FROM teams WHERE competition_id=? AND color=? AND assigned_lane=? AND id!=?",
                 (ex["competition_id"], new_color, new_lane, tid)
             ).fetchone():
                 return error("A team with the same color already exists on this lane")
 
-    with get_db() as db:
+    with get_db(cid) as db:
         db.execute(
             "UPDATE teams SET name=?, color=?, logo=?, assigned_lane=? WHERE id=?",
             (data.get("name", ex["name"]), new_color, data.get("logo", ex.get("logo")), new_lane, tid),
         )
         row = db.execute("SELECT * FROM teams WHERE id=?", (tid,)).fetchone()
+        refresh_results_snapshot(db, ex["competition_id"])
         db.commit()
 
+    live.invalidate(ex["competition_id"])
     return ok(serialize_team(dict(row)))
 
 
 @teams_bp.route("/teams/<tid>", methods=["DELETE"])
 def delete_team(tid):
-    with get_db() as db:
-        if not db.execute("SELECT id FROM teams WHERE id=?", (tid,)).fetchone():
+    cid = locate_competition("teams", tid)
+    with get_db(cid) as db:
+        team = db.execute("SELECT competition_id FROM teams WHERE id=?", (tid,)).fetchone()
+        if not team:
             return not_found("Team")
         # lap_counts.team_id → teams.id is CASCADE, so deleting team cascades.
         # swim_sessions.team_id → teams.id is CASCADE too.
-        # But we must first close any active sessions (good practice).
-        db.execute("UPDATE swim_sessions SET is_active=0, end_time=datetime('now') WHERE team_id=? AND is_active=1", (tid,))
+        # But we must first close any active sessions (good practice) and take
+        # the laps out of the log, so a replay agrees with the deletion.
+        close_active_sessions(db, team["competition_id"], utc_now_iso(), team_id=tid)
+        void_laps(db, team["competition_id"], "team deleted", team_id=tid)
+        swimmer_ids = [r[0] for r in db.execute("SELECT id FROM swimmers WHERE team_id=?", (tid,))]
+        forget_shard_rows(db, team["competition_id"], tid, *swimmer_ids)
         db.execute("DELETE FROM teams WHERE id=?", (tid,))
+        refresh_results_snapshot(db, team["competition_id"])
         db.commit()
 
+    live.invalidate(team["competition_id"])
     logger.info("Team deleted: %s", tid)
     return success()
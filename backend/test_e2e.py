@@ -312,8 +312,9 @@ for team, sw, lane in [(T2ID, SW2ID, 2), (T3ID, SW3ID, 3)]:
 # T2 second lap (wait timeout)
 print("  [waiting 6s for T2 double-count timeout...]")
 time.sleep(6)
-r = client.post("/lap-counts", json={"competitionId":CID,"laneNumber":2,"teamId":T2ID,"swimmerId":SW2ID,"refereeId":REFID,"lapNumber":2})
+r = client.post("/lap-counts", json={"competitionId":CID,"laneNumber":2,"teamId":T2ID,"swimmerId":SW2ID,"refereeId":REFID,"lapNumber":99})
 check("T2 lap 2 → 201",                 s(r) == 201, s(r))
+check("client lapNumber ignored",       j(r)["data"]["lapNumber"] == 2, j(r)["data"].get("lapNumber"))
 
 # Total: T1(2) + T2(2) + T3(1) = 5
 r = client.get("/lap-counts", query_string={"competitionId":CID})
@@ -400,6 +401,61 @@ r = client.put(f"/competitions/{CID}", json={"status":"completed","actualEndTime
 check("→ completed → 200",              s(r) == 200)
 check("actualEndTime stored",           j(r)["data"]["actualEndTime"] == "2026-07-02T10:00:00Z")
 
+section("Results Snapshot")
+r = client.get(f"/competitions/{CID}/results")
+check("GET /results → 200",             s(r) == 200, s(r))
+RES = j(r)["data"]
+check("snapshot version = 1",           RES["version"] == 1, RES.get("version"))
+check("snapshot has hourlyStats",       sum(h["totalLaps"] for h in RES["hourlyStats"]) == RES["totalLaps"])
+check("snapshot has leaderboard",       len(RES["teamStats"]) == 3)
+check("ETag header",                    bool(r.headers.get("ETag")))
+check("bare URL revalidates",           "immutable" not in r.headers.get("Cache-Control", ""))
+r = client.get(f"/competitions/{CID}/results", query_string={"v": 1})
+check("versioned URL immutable",        "immutable" in r.headers.get("Cache-Control", ""))
+r2 = client.get(f"/competitions/{CID}/results", headers={"If-None-Match": r.headers["ETag"]})
+check("If-None-Match → 304",            s(r2) == 304, s(r2))
+r = client.get(f"/competitions/{CID}/stats")
+check("stats served from snapshot",     j(r)["data"].get("version") == 1 and j(r)["data"]["activeSessions"] == 0)
+client.put(f"/teams/{T3ID}", json={"name":"Red Wave Final"})
+RES = j(client.get(f"/competitions/{CID}/results"))["data"]
+check("organizer edit regenerates",     RES["version"] == 2 and any(t["team"]["name"] == "Red Wave Final" for t in RES["teamStats"]))
+
+section("Archive: Cold Storage")
+import database
+PRE_LAPS = len(j(client.get("/lap-counts", query_string={"competitionId":CID}))["data"])
+PRE_SESS = len(j(client.get("/swim-sessions", query_string={"competitionId":CID}))["data"])
+PRE_TOTAL = j(client.get(f"/competitions/{CID}/team-stats"))["data"]
+PRE_EVENTS = j(client.get(f"/competitions/{CID}/events"))["data"]
+check("unarchived flag cached",         database._archived_cache.get(CID) is False, database._archived_cache.get(CID))
+r = client.post(f"/competitions/{CID}/archive")
+check("POST archive → 200",             s(r) == 200, s(r))
+check("archive marks the cache",        database._archived_cache.get(CID) is True)
+# Another worker archiving: its competitions update reaches us through the feed.
+import changes
+database._archived_cache["other-worker"] = False
+database._on_competition_change(changes.Change("main", 1, "other-worker", "competition", "other-worker", "update"))
+check("feed drops a stale flag",        "other-worker" not in database._archived_cache)
+check("archived lap count",             j(r)["data"]["archived"]["lapCounts"] == PRE_LAPS, j(r)["data"])
+check("archived session count",         j(r)["data"]["archived"]["swimSessions"] == PRE_SESS)
+check("archive file exists",            os.path.isfile(database.archive_path(CID)))
+with database.get_db() as _main:
+    live = _main.execute("SELECT COUNT(*) FROM lap_counts WHERE competition_id=?", (CID,)).fetchone()[0]
+check("live lap rows moved out",        live == 0, live)
+with database.get_db() as _main:
+    live = _main.execute("SELECT COUNT(*) FROM events WHERE competition_id=?", (CID,)).fetchone()[0]
+check("live event rows moved out",      live == 0 and j(r)["data"]["archived"]["events"] == len(PRE_EVENTS), live)
+check("event log reads archive",        j(client.get(f"/competitions/{CID}/events"))["data"] == PRE_EVENTS)
+check("archivedAt set",                 bool(j(client.get(f"/competitions/{CID}"))["data"]["archivedAt"]))
+check("lap export reads archive",       len(j(client.get("/lap-counts", query_string={"competitionId":CID}))["data"]) == PRE_LAPS)
+check("session export reads archive",   len(j(client.get("/swim-sessions", query_string={"competitionId":CID}))["data"]) == PRE_SESS)
+check("team stats read archive",        j(client.get(f"/competitions/{CID}/team-stats"))["data"] == PRE_TOTAL)
+client.put(f"/teams/{T3ID}", json={"name":"Red Wave Archived"})
+RES = j(client.get(f"/competitions/{CID}/results"))["data"]
+check("snapshot rebuilt from archive",  RES["version"] == 3 and RES["totalLaps"] == PRE_LAPS, RES["totalLaps"])
+check("archive again → 409",            s(client.post(f"/competitions/{CID}/archive")) == 409)
+check("archive unknown → 404",          s(client.post("/competitions/nope/archive")) == 404)
+check("rebuild archived → 409",         s(client.post(f"/competitions/{CID}/rebuild")) == 409)
+
 r = client.delete(f"/competitions/{CID}")
 check("DELETE comp → 200",              s(r) == 200, s(r))
 d = j(r).get("deleted", {})
@@ -413,6 +469,1125 @@ check("teams gone",                     len(j(client.get("/teams", query_string=
 check("swimmers gone",                  len(j(client.get("/swimmers", query_string={"competitionId":CID}))["data"]) == 0)
 check("laps gone",                      len(j(client.get("/lap-counts", query_string={"competitionId":CID}))["data"]) == 0)
 check("delete again → 404",             s(client.delete(f"/competitions/{CID}")) == 404)
+check("archive file removed",           not os.path.exists(database.archive_path(CID)))
+
+# ═════════════════════════════════════════════════════════════════════════════
+section("Scheduler: Auto Start / Auto Finish")
+import scheduler
+from datetime import datetime, timedelta
+
+w = scheduler.TimerWheel(tick=1.0, slots=8, now=1000.0)
+fired = []
+w.schedule("a", 1003.5, lambda: fired.append("a"))
+w.schedule("b", 1020.0, lambda: fired.append("b"))   # beyond one revolution
+check("wheel: nothing due early",       w.advance(1002.0) == [])
+for cb in w.advance(1004.0): cb()
+check("wheel: due timer fires",         fired == ["a"], fired)
+check("wheel: far timer waits",         w.advance(1012.5) == [] and len(w) == 1)
+for cb in w.advance(1020.5): cb()
+check("wheel: far timer fires",         fired == ["a", "b"], fired)
+w.schedule("c", 1030.0, lambda: None)
+check("wheel: cancel",                  w.cancel("c") and w.next_deadline() is None)
+
+_t0 = datetime.now() - timedelta(minutes=2)
+r = client.post("/competitions", json={
+    "name":"Auto 24h","date":_t0.strftime("%Y-%m-%d"),"startTime":_t0.strftime("%H:%M"),
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+AUTO_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{AUTO_CID}", json={"autoStart":True,"autoFinish":True})
+for _ in range(50):
+    AUTO = j(client.get(f"/competitions/{AUTO_CID}"))["data"]
+    if AUTO["status"] == "active":
+        break
+    time.sleep(0.1)
+check("auto_start → active",            AUTO["status"] == "active", AUTO["status"])
+check("actualStartTime stamped",        bool(AUTO["actualStartTime"]))
+
+AT = j(client.post("/teams", json={"name":"Auto","color":"#000000","competitionId":AUTO_CID,"assignedLane":1}))["data"]["id"]
+ASW = j(client.post("/swimmers", json={"name":"Ann","teamId":AT,"competitionId":AUTO_CID}))["data"]["id"]
+client.post("/swim-sessions", json={"competitionId":AUTO_CID,"swimmerId":ASW,"teamId":AT,"laneNumber":1})
+
+check("archive active comp → 422",      s(client.post(f"/competitions/{AUTO_CID}/archive")) == 422)
+check("auto_finish transitions",        scheduler.auto_finish(AUTO_CID))
+check("auto_finish freezes results",    s(client.get(f"/competitions/{AUTO_CID}/results")) == 200)
+import stats
+_load_snapshot = stats._load_snapshot
+def _reopened_meanwhile(cid):
+    with database.get_db() as db:
+        db.execute("UPDATE competitions SET status='active' WHERE id=?", (cid,))
+    return None
+stats._load_snapshot = _reopened_meanwhile
+r = client.get(f"/competitions/{AUTO_CID}/results")
+stats._load_snapshot = _load_snapshot
+with database.get_db() as db:
+    db.execute("UPDATE competitions SET status='completed' WHERE id=?", (AUTO_CID,))
+check("reopened during results → 409",  s(r) == 409, s(r))
+AUTO = j(client.get(f"/competitions/{AUTO_CID}"))["data"]
+check("status = completed",             AUTO["status"] == "completed", AUTO["status"])
+check("actualEndTime stamped",          bool(AUTO["actualEndTime"]))
+r = client.get("/swim-sessions", query_string={"competitionId":AUTO_CID,"isActive":"true"})
+check("open sessions closed",           len(j(r)["data"]) == 0, len(j(r)["data"]))
+check("auto_finish is idempotent",      not scheduler.auto_finish(AUTO_CID))
+check("scheduler holds lease",          scheduler._scheduler.is_leader)
+client.delete(f"/competitions/{AUTO_CID}")
+
+# ═════════════════════════════════════════════════════════════════════════════
+section("Sharding: Per-Competition Database")
+os.environ["SWIMTRACK_SHARDING"] = "1"
+r = client.post("/competitions", json={
+    "name":"Shard 24h","date":"2025-08-01","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":2,"doubleCountTimeout":0,
+})
+os.environ.pop("SWIMTRACK_SHARDING")
+SH_CID = j(r)["data"]["id"]
+check("shard file created",             os.path.isfile(database.shard_path(SH_CID)))
+client.put(f"/competitions/{SH_CID}", json={"status":"active"})
+
+SHT = j(client.post("/teams", json={"name":"Shard","color":"#123456","competitionId":SH_CID,"assignedLane":1}))["data"]["id"]
+SHSW = j(client.post("/swimmers", json={"name":"Sam","teamId":SHT,"competitionId":SH_CID}))["data"]["id"]
+r = client.post("/swim-sessions", json={"competitionId":SH_CID,"swimmerId":SHSW,"teamId":SHT,"laneNumber":1})
+check("session in shard → 201",         s(r) == 201, s(r))
+SHREF = j(client.post("/referees", json={"competitionId":SH_CID}))["data"]["id"]
+for n in (1, 2):
+    r = client.post("/lap-counts", json={"competitionId":SH_CID,"laneNumber":1,
+                                         "teamId":SHT,"swimmerId":SHSW,"refereeId":SHREF})
+check("laps in shard → 201",            s(r) == 201 and j(r)["data"]["lapNumber"] == 2, j(r))
+
+with database.get_db() as _main:
+    _n = _main.execute("SELECT COUNT(*) FROM teams WHERE competition_id=?", (SH_CID,)).fetchone()[0]
+check("main DB holds no shard rows",    _n == 0, _n)
+r = client.get(f"/competitions/{SH_CID}/stats")
+check("stats read shard",               j(r)["data"]["totalLaps"] == 2, j(r))
+check("lap list by teamId",             len(j(client.get("/lap-counts", query_string={"teamId":SHT}))["data"]) == 2)
+r = client.put(f"/teams/{SHT}", json={"name":"Shard Renamed"})
+check("PUT team by id → 200",           s(r) == 200 and j(r)["data"]["name"] == "Shard Renamed", s(r))
+check("PUT swimmer by id → 200",        s(client.put(f"/swimmers/{SHSW}", json={"name":"Samuel"})) == 200)
+SHSW2 = j(client.post("/swimmers", json={"name":"Sue","teamId":SHT,"competitionId":SH_CID}))["data"]["id"]
+SHLAP = j(client.get("/lap-counts", query_string={"competitionId":SH_CID}))["data"][0]["id"]
+r = client.post(f"/lap-counts/{SHLAP}/reassign", json={"swimmerId":SHSW2})
+check("reassign shard lap via swimmer", s(r) == 200 and j(r)["data"]["swimmerId"] == SHSW2, j(r))
+r = client.post(f"/lap-counts/{SHLAP}/reassign", json={"swimmerId":SHSW})
+_opened = database.pool_status()["opened"]
+r = client.get("/swimmers", query_string={"teamId":SHT})
+check("team located via catalog",       len(j(r)["data"]) == 2 and database.pool_status()["opened"] == _opened, j(r))
+check("DELETE swimmer by id → 200",     s(client.delete(f"/swimmers/{SHSW2}")) == 200)
+with database.get_db() as _main:
+    _n = _main.execute("SELECT COUNT(*) FROM shard_rows WHERE competition_id=?", (SH_CID,)).fetchone()[0]
+check("catalog lists team + swimmer",   _n == 2, _n)
+r = client.post("/lap-counts", json={"competitionId":SH_CID,"laneNumber":1,"teamId":SHT,"swimmerId":SHSW,"refereeId":SHREF})
+SHLAP3 = j(r)["data"]["id"]
+check("void shard lap needs compId",    s(client.delete(f"/lap-counts/{SHLAP3}")) == 404)
+check("void shard lap with compId",     s(client.delete(f"/lap-counts/{SHLAP3}", query_string={"competitionId":SH_CID})) == 200)
+SHSESS = j(client.get("/swim-sessions", query_string={"competitionId":SH_CID}))["data"][0]["id"]
+r = client.put(f"/swim-sessions/{SHSESS}", json={"competitionId":SH_CID,"isActive":False})
+check("PUT shard session with compId",  s(r) == 200 and j(r)["data"]["isActive"] is False, j(r))
+import sqlite3
+_main_writer = sqlite3.connect(database._db_path(), isolation_level=None, timeout=0)
+_main_writer.execute("BEGIN IMMEDIATE")        # another competition's write in progress on main
+try:
+    _t0 = time.monotonic()
+    r_ho  = client.post("/swim-sessions/handover", json={"competitionId":SH_CID,"teamId":SHT,"swimmerId":SHSW})
+    r_lap = client.post("/lap-counts", json={"competitionId":SH_CID,"laneNumber":1,"teamId":SHT,
+                                             "swimmerId":SHSW,"refereeId":SHREF})
+    _elapsed = time.monotonic() - _t0
+finally:
+    _main_writer.rollback()
+    _main_writer.close()
+check("shard handover while main locked", s(r_ho) == 201, j(r_ho))
+check("shard lap batch while main locked", s(r_lap) == 201 and _elapsed < 2, (s(r_lap), _elapsed))
+client.delete(f"/lap-counts/{j(r_lap)['data']['id']}", query_string={"competitionId":SH_CID})
+check("delete shard referee → 200",     s(client.delete(f"/referees/{SHREF}")) == 200)
+laps = j(client.get("/lap-counts", query_string={"competitionId":SH_CID}))["data"]
+check("shard laps keep, referee cleared", len(laps) == 2 and all(l["refereeId"] is None for l in laps), laps)
+# auto_finish of a shard: a crash after the shard commit, before the main one
+with database.get_db() as _main:       # a far end keeps the running scheduler away
+    _main.execute("UPDATE competitions SET auto_finish=1, date='2999-01-01' WHERE id=?", (SH_CID,))
+_real_get_db = scheduler.get_db
+def _main_fails(cid=None):
+    if cid is None:
+        raise sqlite3.OperationalError("disk I/O error")
+    return _real_get_db(cid)
+scheduler.get_db = _main_fails
+try:
+    scheduler.auto_finish(SH_CID)
+except sqlite3.OperationalError:
+    pass
+finally:
+    scheduler.get_db = _real_get_db
+def sh_finished_events():
+    return [e for e in j(client.get(f"/competitions/{SH_CID}/events", query_string={"limit":500}))["data"]
+            if e["type"] == "status_changed" and e["payload"]["to"] == "completed"]
+check("crash leaves status, closes sessions",
+      j(client.get(f"/competitions/{SH_CID}"))["data"]["status"] == "active"
+      and not j(client.get("/swim-sessions", query_string={"competitionId":SH_CID,"isActive":"true"}))["data"]
+      and len(sh_finished_events()) == 1)
+check("auto_finish rerun completes",    scheduler.auto_finish(SH_CID)
+                                        and j(client.get(f"/competitions/{SH_CID}"))["data"]["status"] == "completed")
+check("rerun logs no second change",    len(sh_finished_events()) == 1 and not scheduler.auto_finish(SH_CID))
+r = client.put(f"/competitions/{SH_CID}", json={"status":"completed"})
+check("complete sharded comp → 200",    s(r) == 200, s(r))
+check("sharded results snapshot",       j(client.get(f"/competitions/{SH_CID}/results"))["data"]["totalLaps"] == 2)
+r = client.delete(f"/competitions/{SH_CID}")
+check("delete counts shard rows",       s(r) == 200 and j(r)["deleted"]["lapCounts"] == 4, j(r))  # incl. the voided ones
+check("shard file removed",             not os.path.exists(database.shard_path(SH_CID)))
+with database.get_db() as _main:
+    _n = _main.execute("SELECT COUNT(*) FROM shard_rows WHERE competition_id=?", (SH_CID,)).fetchone()[0]
+check("catalog rows removed",           _n == 0, _n)
+
+# ═════════════════════════════════════════════════════════════════════════════
+section("Maintenance: WAL Checkpoints & Backups")
+import maintenance, sqlite3, threading, tempfile as _tf
+os.environ["SWIMTRACK_BACKUP_DIR"] = _tf.mkdtemp()
+os.environ["SWIMTRACK_BACKUP_KEEP"] = "1"
+
+res = maintenance.checkpoint_all(force=True)
+check("checkpoint ran on main",         "main" in res and not res["main"]["busy"], res)
+check("passive checkpoint drains WAL",  res["main"]["checkpointedFrames"] == res["main"]["walFrames"], res["main"])
+check("not due right after",            not maintenance.checkpoint_due("main", os.environ["SWIMTRACK_DB"]))
+check("backup not due at start",        not maintenance.backup_due())
+
+BK = maintenance.run_backup()
+bk_path = os.path.join(database.backup_dir(), BK["set"], os.path.basename(os.environ["SWIMTRACK_DB"]))
+check("backup file written",            os.path.isfile(bk_path), bk_path)
+check("backup page count reported",     BK["files"]["main"]["pages"] >= 1, BK["files"]["main"])
+_bk = sqlite3.connect(bk_path)
+check("backup integrity ok",            _bk.execute("PRAGMA integrity_check").fetchone()[0] == "ok")
+with database.get_db() as _main:
+    _users = _main.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+check("backup is consistent copy",      _bk.execute("SELECT COUNT(*) FROM users").fetchone()[0] == _users)
+_bk.close()
+time.sleep(1.1)
+maintenance.run_backup()
+check("old backup sets pruned",         len(os.listdir(database.backup_dir())) == 1)
+
+r = client.get("/metrics")
+check("GET /metrics → 200",             s(r) == 200, s(r))
+MAIN = next(d for d in j(r)["data"]["databases"] if d["name"] == "main")
+check("metrics report WAL size",        isinstance(MAIN["walBytes"], int) and MAIN["sizeBytes"] > 0, MAIN)
+check("metrics report last checkpoint", MAIN["lastCheckpoint"] is not None and "monotonic" not in MAIN["lastCheckpoint"])
+check("metrics report last backup",     j(r)["data"]["lastBackup"]["set"] != BK["set"])
+
+# A backup finishes while another connection keeps writing, and runs off the caller's thread.
+bk_stop = threading.Event()
+def bk_writer():
+    with database.get_db() as _w:
+        while not bk_stop.is_set():
+            _w.execute("INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES ('bk-test', 'x', ?)",
+                       (time.time(),))
+            _w.commit()
+bk_thread = threading.Thread(target=bk_writer); bk_thread.start()
+time.sleep(1.1)
+bk_before = j(client.get("/metrics"))["data"]["lastBackup"]["set"]
+check("backup starts in background",    maintenance.start_backup())
+maintenance._backup_thread.join(10)
+bk_stop.set(); bk_thread.join()
+check("backup completes under writes",  j(client.get("/metrics"))["data"]["lastBackup"]["set"] != bk_before)
+with database.get_db() as _main:
+    _main.execute("DELETE FROM leases WHERE name='bk-test'")
+
+# ═════════════════════════════════════════════════════════════════════════════
+section("Event Log: Replay & Point-in-Time Standings")
+import events, stats
+r = client.post("/competitions", json={
+    "name":"Events 24h","date":"2025-09-01","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":2,"doubleCountTimeout":0,
+})
+EV_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{EV_CID}", json={"status":"active"})
+EVT = j(client.post("/teams", json={"name":"Ev","color":"#aa0000","competitionId":EV_CID,"assignedLane":1}))["data"]["id"]
+EVSW = j(client.post("/swimmers", json={"name":"Eve","teamId":EVT,"competitionId":EV_CID}))["data"]["id"]
+EVSS = j(client.post("/swim-sessions", json={"competitionId":EV_CID,"swimmerId":EVSW,"teamId":EVT,"laneNumber":1}))["data"]["id"]
+EVREF = j(client.post("/referees", json={"competitionId":EV_CID}))["data"]["id"]
+for _ in range(3):
+    client.post("/lap-counts", json={"competitionId":EV_CID,"laneNumber":1,"teamId":EVT,"swimmerId":EVSW,"refereeId":EVREF})
+
+evs = j(client.get(f"/competitions/{EV_CID}/events"))["data"]
+check("events logged in order",         [e["type"] for e in evs] == ["status_changed","status_changed","session_started"] + ["lap_recorded"]*3,
+                                        [e["type"] for e in evs])
+check("seq strictly increasing",        all(a["seq"] < b["seq"] for a, b in zip(evs, evs[1:])))
+check("lap event names its session",    evs[-1]["payload"]["sessionId"] == EVSS)
+check("events ?after= tails the log",   len(j(client.get(f"/competitions/{EV_CID}/events", query_string={"after":evs[-2]["seq"]}))["data"]) == 1)
+r = client.get(f"/competitions/{EV_CID}/standings")
+check("standings from replay",          j(r)["data"]["teams"][0]["totalLaps"] == 3 and j(r)["data"]["status"] == "active", j(r))
+check("standings bad 'at' → 400",       s(client.get(f"/competitions/{EV_CID}/standings", query_string={"at":"yesterday"})) == 400)
+check("standings unknown comp → 404",   s(client.get("/competitions/nope/standings")) == 404)
+
+client.put(f"/swim-sessions/{EVSS}", json={"lapCount":99})
+r = client.post(f"/competitions/{EV_CID}/rebuild")
+check("rebuild corrects drifted counter", s(r) == 200 and j(r)["data"]["corrected"]["sessions"] == 1, j(r))
+sess = j(client.get("/swim-sessions", query_string={"competitionId":EV_CID}))["data"][0]
+check("session lap_count restored",     sess["lapCount"] == 3, sess["lapCount"])
+with database.get_db(EV_CID) as db:
+    ev_rate = dict(db.execute("SELECT last_lap_at, ewma_interval_s FROM team_totals WHERE team_id=?", (EVT,)).fetchone())
+    db.execute("UPDATE lap_buckets SET laps = laps + 5 WHERE team_id=? AND size=300", (EVT,))
+    db.execute("DELETE FROM lap_buckets WHERE team_id=? AND size=3600", (EVT,))
+    db.execute("UPDATE team_totals SET last_lap_at=NULL, ewma_interval_s=999 WHERE team_id=?", (EVT,))
+    db.commit()
+r = j(client.post(f"/competitions/{EV_CID}/rebuild"))["data"]["corrected"]
+check("rebuild corrects buckets and rate", r["buckets"] >= 2 and r["lapRates"] == 1, r)
+with database.get_db(EV_CID) as db:
+    ev_buckets = dict(db.execute("SELECT size, SUM(laps) FROM lap_buckets WHERE team_id=? GROUP BY size", (EVT,)).fetchall())
+    ev_rate2 = dict(db.execute("SELECT last_lap_at, ewma_interval_s FROM team_totals WHERE team_id=?", (EVT,)).fetchone())
+check("buckets restored",               ev_buckets == {300: 3, 3600: 3}, ev_buckets)
+check("lap rate restored",              ev_rate2 == ev_rate, (ev_rate, ev_rate2))
+
+# Synthetic log with explicit timestamps: checkpoints + point-in-time replay
+events.CHECKPOINT_EVERY, _cp_every = 4, events.CHECKPOINT_EVERY
+with database.get_db() as _db2:
+    events.append_event(_db2, "replay-test", events.SESSION_STARTED, entity_id="s1", team_id="t1",
+                        swimmer_id="w1", lane_number=1, timestamp="2025-01-01T10:00:00Z")
+    for m in range(1, 11):
+        events.append_event(_db2, "replay-test", events.LAP_RECORDED, entity_id=f"l{m}", team_id="t1",
+                            swimmer_id="w1", lane_number=1, payload={"sessionId":"s1"},
+                            timestamp=f"2025-01-01T10:{m:02d}:00Z")
+    events.append_event(_db2, "replay-test", events.LAP_VOIDED, entity_id="l3", team_id="t1",
+                        swimmer_id="w1", lane_number=1, payload={"sessionId":"s1"},
+                        timestamp="2025-01-01T10:10:30Z")
+    n_cp = _db2.execute("SELECT COUNT(*) FROM event_checkpoints WHERE competition_id='replay-test'").fetchone()[0]
+    at_430 = events.replay(_db2, "replay-test", "2025-01-01T10:04:30Z")
+    at_end = events.replay(_db2, "replay-test")
+    scratch = events.fold(_db2.execute("SELECT * FROM events WHERE competition_id='replay-test' ORDER BY seq"))
+    # Timestamps out of seq order: the 10:20 lap lands in the checkpoint
+    # written at the 10:03 lap, which must not be used for 10:05.
+    for m in (1, 2, 20, 3):
+        events.append_event(_db2, "replay-late", events.LAP_RECORDED, entity_id=f"l{m}", team_id="t1",
+                            swimmer_id="w1", lane_number=1, timestamp=f"2025-01-01T10:{m:02d}:00Z")
+    at_late = events.replay(_db2, "replay-late", "2025-01-01T10:05:00Z")
+    _db2.execute("DELETE FROM events WHERE competition_id IN ('replay-test', 'replay-late')")
+    _db2.execute("DELETE FROM event_checkpoints WHERE competition_id IN ('replay-test', 'replay-late')")
+    _db2.commit()
+events.CHECKPOINT_EVERY = _cp_every
+check("checkpoints written",            n_cp == 3, n_cp)
+check("replay as of 10:04:30",          at_430["teams"]["t1"] == 4 and at_430["sessions"]["s1"]["laps"] == 4, at_430)
+check("void folds in",                  at_end["teams"]["t1"] == 9 and at_end["swimmers"]["w1"] == 9, at_end)
+check("checkpointed replay = full fold", at_end == scratch)
+check("checkpoint past 'at' skipped",   at_late["teams"]["t1"] == 3, at_late)
+client.delete(f"/competitions/{EV_CID}")
+with database.get_db() as _db2:
+    _left = _db2.execute("SELECT COUNT(*) FROM events WHERE competition_id=?", (EV_CID,)).fetchone()[0]
+check("delete removes events",          _left == 0, _left)
+
+# ═════════════════════════════════════════════════════════════════════════════
+section("Lap Counting: Void & Reassign")
+r = client.post("/competitions", json={
+    "name":"Void 24h","date":"2025-09-02","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":2,"doubleCountTimeout":0,
+})
+VD_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{VD_CID}", json={"status":"active"})
+VTA = j(client.post("/teams", json={"name":"VA","color":"#00aa00","competitionId":VD_CID,"assignedLane":1}))["data"]["id"]
+VTB = j(client.post("/teams", json={"name":"VB","color":"#0000aa","competitionId":VD_CID,"assignedLane":2}))["data"]["id"]
+VSA  = j(client.post("/swimmers", json={"name":"Val","teamId":VTA,"competitionId":VD_CID}))["data"]["id"]
+VSA2 = j(client.post("/swimmers", json={"name":"Vic","teamId":VTA,"competitionId":VD_CID}))["data"]["id"]
+VSB  = j(client.post("/swimmers", json={"name":"Vera","teamId":VTB,"competitionId":VD_CID}))["data"]["id"]
+VSSA = j(client.post("/swim-sessions", json={"competitionId":VD_CID,"swimmerId":VSA,"teamId":VTA,"laneNumber":1}))["data"]["id"]
+VSSB = j(client.post("/swim-sessions", json={"competitionId":VD_CID,"swimmerId":VSB,"teamId":VTB,"laneNumber":2}))["data"]["id"]
+VREF = j(client.post("/referees", json={"competitionId":VD_CID}))["data"]["id"]
+client.post("/lap-counts", json={"competitionId":VD_CID,"laneNumber":2,"teamId":VTB,"swimmerId":VSB,"refereeId":VREF})
+VLAPS = [j(client.post("/lap-counts", json={"competitionId":VD_CID,"laneNumber":1,"teamId":VTA,
+                                            "swimmerId":VSA,"refereeId":VREF}))["data"] for _ in range(4)]
+check("lap records its session",        VLAPS[0]["sessionId"] == VSSA and VLAPS[0]["voidedAt"] is None)
+
+def vd_totals():
+    with database.get_db(VD_CID) as db:
+        return {r["team_id"]: r["laps"] for r in db.execute(
+            "SELECT team_id, laps FROM team_totals WHERE competition_id=?", (VD_CID,))}
+check("materialized totals",            vd_totals() == {VTA: 4, VTB: 1}, vd_totals())
+
+r = client.delete(f"/lap-counts/{VLAPS[1]['id']}", json={"reason":"double tap","voidedBy":ADMIN_ID})
+check("void lap → 200",                 s(r) == 200 and j(r)["data"]["voidedAt"] and j(r)["data"]["voidReason"] == "double tap", j(r))
+check("void again → 409",               s(client.delete(f"/lap-counts/{VLAPS[1]['id']}")) == 409)
+check("void unknown → 404",             s(client.delete("/lap-counts/nope")) == 404)
+laps = j(client.get("/lap-counts", query_string={"teamId":VTA}))["data"]
+check("voided lap hidden from list",    len(laps) == 3, len(laps))
+check("later lap numbers shifted",      [l["lapNumber"] for l in laps] == [1, 2, 3], [l["lapNumber"] for l in laps])
+check("includeVoided keeps audit row",  len(j(client.get("/lap-counts", query_string={"teamId":VTA,"includeVoided":"1"}))["data"]) == 4)
+check("team total decremented",         vd_totals()[VTA] == 3, vd_totals())
+sess = next(x for x in j(client.get("/swim-sessions", query_string={"competitionId":VD_CID}))["data"] if x["id"] == VSSA)
+check("session lap count decremented",  sess["lapCount"] == 3, sess["lapCount"])
+check("stats exclude voided laps",      j(client.get(f"/competitions/{VD_CID}/stats"))["data"]["totalLaps"] == 4)
+r = client.post("/lap-counts", json={"competitionId":VD_CID,"laneNumber":1,"teamId":VTA,"swimmerId":VSA,"refereeId":VREF})
+check("next lap number follows void",   j(r)["data"]["lapNumber"] == 4, j(r)["data"]["lapNumber"])
+VLAST = j(r)["data"]["id"]
+
+r = client.post(f"/lap-counts/{VLAST}/reassign", json={"swimmerId":VSB})
+check("reassign to other team → 200",   s(r) == 200 and j(r)["data"]["teamId"] == VTB and j(r)["data"]["lapNumber"] == 2, j(r))
+check("reassign credits new session",   j(r)["data"]["sessionId"] == VSSB)
+check("totals moved",                   vd_totals() == {VTA: 3, VTB: 2}, vd_totals())
+# Same-second taps: the reassigned lap is placed by (timestamp, id), numbers stay unique.
+with database.get_db(VD_CID) as db:
+    vd_times = db.execute("SELECT id, timestamp FROM lap_counts WHERE competition_id=?", (VD_CID,)).fetchall()
+    db.execute("UPDATE lap_counts SET timestamp=? WHERE competition_id=?", ("2025-09-02T10:00:00Z", VD_CID))
+r = client.post(f"/lap-counts/{VLAPS[3]['id']}/reassign", json={"swimmerId":VSB})
+vd_nums = sorted(l["lapNumber"] for l in j(client.get("/lap-counts", query_string={"teamId":VTB}))["data"])
+check("equal timestamps: unique numbers", s(r) == 200 and vd_nums == [1, 2, 3], vd_nums)
+client.post(f"/lap-counts/{VLAPS[3]['id']}/reassign", json={"swimmerId":VSA})
+vd_nums = sorted(l["lapNumber"] for l in j(client.get("/lap-counts", query_string={"teamId":VTA}))["data"])
+check("and back again",                 vd_nums == [1, 2, 3], vd_nums)
+with database.get_db(VD_CID) as db:
+    db.executemany("UPDATE lap_counts SET timestamp=? WHERE id=?", [(t, i) for i, t in vd_times])
+    for _tid in (VTA, VTB):
+        stats.recompute_lap_rate(db, VD_CID, _tid)
+r = client.post(f"/lap-counts/{VLAPS[0]['id']}/reassign", json={"swimmerId":VSA2})
+check("reassign within team keeps number", s(r) == 200 and j(r)["data"]["lapNumber"] == 1 and j(r)["data"]["sessionId"] is None, j(r))
+check("reassign wrong team → 400",      s(client.post(f"/lap-counts/{VLAST}/reassign", json={"swimmerId":VSA,"teamId":VTB})) == 400)
+check("reassign unknown swimmer → 404", s(client.post(f"/lap-counts/{VLAST}/reassign", json={"swimmerId":"nope"})) == 404)
+check("reassign voided lap → 409",      s(client.post(f"/lap-counts/{VLAPS[1]['id']}/reassign", json={"swimmerId":VSB})) == 409)
+
+evs = [e["type"] for e in j(client.get(f"/competitions/{VD_CID}/events"))["data"]]
+check("void/reassign logged",           evs.count("lap_voided") == 1 and evs.count("lap_reassigned") == 4, evs)
+r = client.post(f"/competitions/{VD_CID}/rebuild")
+check("incremental counters = replay",  not any(j(r)["data"]["corrected"].values()), j(r))
+sw = {x["swimmer"]["id"]: x["totalLaps"] for x in j(client.get(f"/competitions/{VD_CID}/standings"))["data"]["swimmers"]}
+check("standings follow reassign",      sw == {VSA: 2, VSA2: 1, VSB: 2}, sw)
+
+client.delete(f"/swimmers/{VSB}")
+check("deleting swimmer drops their laps from totals", vd_totals().get(VTB) == 0, vd_totals())
+r = client.post(f"/competitions/{VD_CID}/rebuild")
+check("log agrees after swimmer delete", not any(j(r)["data"]["corrected"].values()), j(r))
+
+section("Stats: Timeseries Buckets")
+for label, width in (("5m", 300), ("1h", 3600)):
+    r = client.get(f"/competitions/{VD_CID}/timeseries", query_string={"bucket":label})
+    TS = j(r)["data"]
+    check(f"timeseries {label} → 200",    s(r) == 200 and TS["bucketSeconds"] == width, s(r))
+    check(f"{label} arrays are dense",     all(len(t["laps"]) == len(TS["buckets"]) for t in TS["teams"]) and len(TS["total"]) == len(TS["buckets"]))
+    per_team = {t["team"]["id"]: sum(t["laps"]) for t in TS["teams"]}
+    check(f"{label} buckets match totals", per_team == vd_totals() and sum(TS["total"]) == sum(vd_totals().values()), (per_team, vd_totals()))
+check("buckets aligned to width",       all(ts.endswith(":00:00Z") for ts in j(client.get(f"/competitions/{VD_CID}/timeseries"))["data"]["buckets"]))
+check("unknown bucket → 400",           s(client.get(f"/competitions/{VD_CID}/timeseries", query_string={"bucket":"7m"})) == 400)
+check("timeseries unknown comp → 404",  s(client.get("/competitions/nope/timeseries")) == 404)
+
+client.delete(f"/teams/{VTA}")
+evs = j(client.get(f"/competitions/{VD_CID}/events"))["data"]
+check("team delete voids its laps in the log",
+      sum(e["type"] == "lap_voided" and e["payload"].get("reason") == "team deleted" for e in evs) == 3, [e["type"] for e in evs[-5:]])
+r = client.post(f"/competitions/{VD_CID}/rebuild")
+check("log agrees after team delete",   not any(j(r)["data"]["corrected"].values()), j(r))
+check("replay drops the team's laps",   j(client.get(f"/competitions/{VD_CID}/standings"))["data"]["totalLaps"] == sum(vd_totals().values()))
+
+section("Stats: Ranked Leaderboard")
+r = client.post("/competitions", json={
+    "name":"Rank 24h","date":"2025-09-03","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":3,"doubleCountTimeout":0,
+})
+RK_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{RK_CID}", json={"status":"active"})
+RKREF = j(client.post("/referees", json={"competitionId":RK_CID}))["data"]["id"]
+RKT, RKS = [], []
+for lane in (1, 2, 3):
+    t = j(client.post("/teams", json={"name":f"R{lane}","color":"#111111","competitionId":RK_CID,"assignedLane":lane}))["data"]["id"]
+    sw = j(client.post("/swimmers", json={"name":f"Rs{lane}","teamId":t,"competitionId":RK_CID}))["data"]["id"]
+    client.post("/swim-sessions", json={"competitionId":RK_CID,"swimmerId":sw,"teamId":t,"laneNumber":lane})
+    RKT.append(t); RKS.append(sw)
+
+def rk_lap(i):
+    return j(client.post("/lap-counts", json={"competitionId":RK_CID,"laneNumber":i+1,"teamId":RKT[i],
+                                              "swimmerId":RKS[i],"refereeId":RKREF}))["data"]["id"]
+old = [rk_lap(0) for _ in range(3)] + [rk_lap(1) for _ in range(2)]
+for _ in range(2): rk_lap(1)
+with database.get_db(RK_CID) as db:   # first five laps happened an hour ago
+    db.executemany("UPDATE lap_counts SET timestamp='2020-01-01T00:00:00Z' WHERE id=?", [(i,) for i in old])
+    db.commit()
+
+r = client.get(f"/competitions/{RK_CID}/leaderboard", query_string={"sinceMinutes":30})
+LB = j(r)["data"]
+check("leaderboard → 200",              s(r) == 200 and LB["total"] == 3, j(r))
+check("ordered by laps",                [e["team"]["id"] for e in LB["entries"]] == [RKT[1], RKT[0], RKT[2]], LB["entries"])
+check("ranks",                          [e["rank"] for e in LB["entries"]] == [1, 2, 3])
+check("rank deltas since 30 min",       [e["rankDelta"] for e in LB["entries"]] == [1, -1, 0], [e["rankDelta"] for e in LB["entries"]])
+check("zero-lap team listed",           LB["entries"][2]["totalLaps"] == 0)
+r = client.get(f"/competitions/{RK_CID}/leaderboard", query_string={"limit":1,"offset":1})
+check("limit/offset page",              [(e["rank"], e["team"]["id"]) for e in j(r)["data"]["entries"]] == [(2, RKT[0])], j(r))
+r = client.get(f"/competitions/{RK_CID}/leaderboard", query_string={"by":"swimmer","limit":2})
+check("swimmer leaderboard",            [e["swimmer"]["id"] for e in j(r)["data"]["entries"]] == [RKS[1], RKS[0]], j(r))
+rk_lap(0)   # tie on 4 laps
+r = client.get(f"/competitions/{RK_CID}/leaderboard", query_string={"limit":1,"offset":1})
+check("ties share rank across pages",   j(r)["data"]["entries"][0]["rank"] == 1, j(r))
+check("bad 'by' → 400",                 s(client.get(f"/competitions/{RK_CID}/leaderboard", query_string={"by":"lane"})) == 400)
+check("leaderboard unknown comp → 404", s(client.get("/competitions/nope/leaderboard")) == 404)
+client.delete(f"/competitions/{RK_CID}")
+client.delete(f"/competitions/{VD_CID}")
+
+section("Stats: Forecast")
+import stats, utils
+fc_day = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d")
+r = client.post("/competitions", json={
+    "name":"Forecast 24h","date":fc_day,"startTime":"10:00","endTime":"12:00","laneLength":50,
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+FC_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{FC_CID}", json={"status":"active"})
+FCREF = j(client.post("/referees", json={"competitionId":FC_CID}))["data"]["id"]
+FCT   = j(client.post("/teams", json={"name":"F1","color":"#222222","competitionId":FC_CID,"assignedLane":1}))["data"]["id"]
+FCS   = j(client.post("/swimmers", json={"name":"Fs1","teamId":FCT,"competitionId":FC_CID}))["data"]["id"]
+client.post("/swim-sessions", json={"competitionId":FC_CID,"swimmerId":FCS,"teamId":FCT,"laneNumber":1})
+r = client.get(f"/competitions/{FC_CID}/forecast")
+check("forecast without laps → no rate", s(r) == 200 and j(r)["data"]["teams"][0]["lapsPerHour"] is None, j(r))
+client.post("/lap-counts", json={"competitionId":FC_CID,"laneNumber":1,"teamId":FCT,"swimmerId":FCS,"refereeId":FCREF})
+with database.get_db(FC_CID) as db:
+    fc_last = utils.parse_utc(db.execute("SELECT last_lap_at FROM team_totals WHERE team_id=?", (FCT,)).fetchone()[0])
+    check("lap write stamps last_lap_at", fc_last is not None)
+    # intervals 60, 60, 120 → 60, 60, 0.1*120 + 0.9*60 = 66
+    for dt in (60, 120, 240, 200):   # the last one is out of order and ignored
+        stats.update_lap_rate(db, FC_CID, FCT, (fc_last + timedelta(seconds=dt)).strftime("%Y-%m-%dT%H:%M:%SZ"))
+    db.commit()
+r  = client.get(f"/competitions/{FC_CID}/forecast")
+FC = j(r)["data"]
+ft = FC["teams"][0]
+check("forecast → 200",                 s(r) == 200 and FC["laneLength"] == 50 and FC["remainingSeconds"] > 86400, FC)
+check("EWMA lap rate",                  ft["lapsPerHour"] == round(3600 / 66, 2), ft)
+check("projected laps at end",          abs(ft["projectedLaps"] - (1 + FC["remainingSeconds"] / 66)) <= 1, ft)
+check("projected distance",             ft["projectedDistanceM"] == ft["projectedLaps"] * 50, ft)
+check("forecast unknown comp → 404",    s(client.get("/competitions/nope/forecast")) == 404)
+import lap_counts, utils
+FCT2 = j(client.post("/teams", json={"name":"F2","color":"#333333","competitionId":FC_CID,"assignedLane":1}))["data"]["id"]
+FCT3 = j(client.post("/teams", json={"name":"F3","color":"#444444","competitionId":FC_CID,"assignedLane":1}))["data"]["id"]
+FCS2 = j(client.post("/swimmers", json={"name":"Fs2","teamId":FCT2,"competitionId":FC_CID}))["data"]["id"]
+FCS3 = j(client.post("/swimmers", json={"name":"Fs3","teamId":FCT3,"competitionId":FC_CID}))["data"]["id"]
+def fc_rate(team):
+    with database.get_db(FC_CID) as db:
+        return tuple(db.execute("SELECT last_lap_at, ewma_interval_s FROM team_totals WHERE team_id=?", (team,)).fetchone())
+with database.get_db(FC_CID) as db:
+    # intervals 60, 60, 120 → 66, as above
+    fc_laps = [lap_counts.insert_lap(db, FC_CID, 1, FCT2, FCS2, FCREF, n, None, f"2025-09-06T10:{m:02d}:00Z",
+                                     utils.zone(None)) for n, m in enumerate((0, 1, 2, 4), 1)]
+    db.commit()
+check("lap writes fold the rate",       fc_rate(FCT2) == ("2025-09-06T10:04:00Z", 66.0), fc_rate(FCT2))
+r = client.delete(f"/lap-counts/{fc_laps[3]}", query_string={"competitionId":FC_CID})
+check("void recomputes the lap rate",   s(r) == 200 and fc_rate(FCT2) == ("2025-09-06T10:02:00Z", 60.0), fc_rate(FCT2))
+r = client.post(f"/lap-counts/{fc_laps[0]}/reassign", json={"swimmerId":FCS3,"competitionId":FC_CID})
+check("reassign recomputes both rates", s(r) == 200 and fc_rate(FCT2) == ("2025-09-06T10:02:00Z", 60.0)
+                                        and fc_rate(FCT3) == ("2025-09-06T10:00:00Z", None), (fc_rate(FCT2), fc_rate(FCT3)))
+r = client.post(f"/lap-counts/{fc_laps[2]}/reassign", json={"swimmerId":FCS3,"competitionId":FC_CID})
+check("lap moved in out of order",      s(r) == 200 and fc_rate(FCT2) == ("2025-09-06T10:01:00Z", None)
+                                        and fc_rate(FCT3) == ("2025-09-06T10:02:00Z", 120.0), (fc_rate(FCT2), fc_rate(FCT3)))
+client.delete(f"/swimmers/{FCS3}")
+check("swimmer delete recomputes rate", fc_rate(FCT3) == (None, None), fc_rate(FCT3))
+client.delete(f"/competitions/{FC_CID}")
+
+section("Lane State")
+r = client.post("/competitions", json={
+    "name":"Lane 24h","date":"2025-09-04","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":2,"doubleCountTimeout":30,
+})
+LS_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{LS_CID}", json={"status":"active"})
+LSREF = j(client.post("/referees", json={"competitionId":LS_CID}))["data"]["id"]
+LSA = j(client.post("/teams", json={"name":"LA","color":"#333333","competitionId":LS_CID,"assignedLane":1}))["data"]["id"]
+LSB = j(client.post("/teams", json={"name":"LB","color":"#444444","competitionId":LS_CID,"assignedLane":1}))["data"]["id"]
+LSC = j(client.post("/teams", json={"name":"LC","color":"#555555","competitionId":LS_CID,"assignedLane":2}))["data"]["id"]
+LSS = [j(client.post("/swimmers", json={"name":n,"teamId":LSA,"competitionId":LS_CID}))["data"]["id"] for n in ("La1","La2")]
+client.post("/swim-sessions", json={"competitionId":LS_CID,"swimmerId":LSS[0],"teamId":LSA,"laneNumber":1})
+client.post("/lap-counts", json={"competitionId":LS_CID,"laneNumber":1,"teamId":LSA,"swimmerId":LSS[0],"refereeId":LSREF})
+
+r  = client.get(f"/competitions/{LS_CID}/lanes/1/state")
+LS = j(r)["data"]
+la = next(t for t in LS["teams"] if t["id"] == LSA)
+lb = next(t for t in LS["teams"] if t["id"] == LSB)
+check("lane state → 200",               s(r) == 200 and {t["id"] for t in LS["teams"]} == {LSA, LSB}, j(r))
+check("roster",                         [sw["id"] for sw in la["swimmers"]] == LSS, la)
+check("active session",                 la["activeSession"]["swimmerId"] == LSS[0] and lb["activeSession"] is None, la)
+check("lap total",                      la["totalLaps"] == 1 and lb["totalLaps"] == 0)
+check("cooldown remaining",             0 < la["cooldownRemaining"] <= 31 and lb["cooldownRemaining"] == 0, la)
+etag = r.headers.get("ETag")
+check("ETag header",                    bool(etag))
+r = client.get(f"/competitions/{LS_CID}/lanes/2/state")
+check("other lane",                     [t["id"] for t in j(r)["data"]["teams"]] == [LSC], j(r))
+client.put(f"/competitions/{LS_CID}", json={"doubleCountTimeout":0})
+r = client.get(f"/competitions/{LS_CID}/lanes/1/state")
+etag = r.headers.get("ETag")
+r = client.get(f"/competitions/{LS_CID}/lanes/1/state", headers={"If-None-Match": etag})
+check("unchanged lane → 304",           s(r) == 304)
+client.post("/lap-counts", json={"competitionId":LS_CID,"laneNumber":1,"teamId":LSA,"swimmerId":LSS[0],"refereeId":LSREF})
+r = client.get(f"/competitions/{LS_CID}/lanes/1/state", headers={"If-None-Match": etag})
+check("new lap → 200 with new ETag",    s(r) == 200 and r.headers.get("ETag") != etag)
+check("lane out of range → 404",        s(client.get(f"/competitions/{LS_CID}/lanes/3/state")) == 404)
+check("lane state unknown comp → 404",  s(client.get("/competitions/nope/lanes/1/state")) == 404)
+
+section("Swim Sessions: Handover")
+LS_FROM = la["activeSession"]["id"]
+r = client.post("/swim-sessions/handover", json={"competitionId":LS_CID,"teamId":LSA,"swimmerId":LSS[1],
+                                                 "fromSessionId":LS_FROM})
+HO = j(r)["data"]
+check("handover → 201",                 s(r) == 201, j(r))
+check("previous session ended",         HO["ended"]["id"] == LS_FROM and not HO["ended"]["isActive"], HO)
+check("next session started on lane",   HO["started"]["swimmerId"] == LSS[1] and HO["started"]["laneNumber"] == 1, HO)
+check("server timestamps line up",      HO["ended"]["endTime"] == HO["started"]["startTime"], HO)
+r = client.get("/swim-sessions", query_string={"competitionId":LS_CID,"teamId":LSA,"isActive":"true"})
+check("exactly one active swimmer",     [x["swimmerId"] for x in j(r)["data"]] == [LSS[1]], j(r))
+r = client.post("/swim-sessions/handover", json={"competitionId":LS_CID,"teamId":LSA,"swimmerId":LSS[0],
+                                                 "fromSessionId":LS_FROM})
+check("stale fromSessionId → 409",      s(r) == 409, j(r))
+r = client.post("/swim-sessions/handover", json={"competitionId":LS_CID,"teamId":LSA,"swimmerId":LSS[1]})
+check("same swimmer → 409",             s(r) == 409, j(r))
+r = client.post("/swim-sessions/handover", json={"competitionId":LS_CID,"teamId":LSB,"swimmerId":LSS[0]})
+check("swimmer of other team → 404",    s(r) == 404, j(r))
+r = client.post("/swim-sessions/handover", json={"competitionId":LS_CID,"teamId":LSA})
+check("missing swimmerId → 400",        s(r) == 400)
+r = client.post("/lap-counts", json={"competitionId":LS_CID,"laneNumber":1,"teamId":LSA,"swimmerId":LSS[1],"refereeId":LSREF})
+check("new swimmer can count",          s(r) == 201, j(r))
+with database.get_db(LS_CID) as db:
+    ho_events = [e["type"] for e in db.execute(
+        "SELECT type FROM events WHERE competition_id=? AND type LIKE 'session_%' ORDER BY seq", (LS_CID,))]
+check("handover logged as end + start", ho_events[-2:] == ["session_ended", "session_started"], ho_events)
+
+section("Swim Sessions: One Active per Team")
+r = client.put(f"/swim-sessions/{LS_FROM}", json={"isActive": True, "endTime": None})
+check("reactivating 2nd session → 409", s(r) == 409, j(r))
+with database.get_db(LS_CID) as db:
+    try:
+        db.execute("""INSERT INTO swim_sessions (id, competition_id, swimmer_id, team_id, lane_number)
+                      VALUES ('dup', ?, ?, ?, 1)""", (LS_CID, LSS[0], LSA))
+        dup_blocked = False
+    except sqlite3.IntegrityError:
+        dup_blocked = True
+check("unique index blocks 2nd active", dup_blocked)
+_legacy = sqlite3.connect(":memory:")
+_legacy.execute("""CREATE TABLE swim_sessions (id, competition_id, team_id, swimmer_id, lane_number,
+                                               start_time, end_time, is_active)""")
+_legacy.executemany("INSERT INTO swim_sessions VALUES (?,?,?,'s',1,?,NULL,1)", [
+    ("a", "c", "t", "2025-01-01T10:00:00Z"), ("b", "c", "t", "2025-01-01T11:00:00Z"),
+    ("x", "c", "u", "2025-01-01T10:00:00Z"),
+    ("p", "d", "v", "2025-01-01T10:00:00Z"), ("q", "d", "v", "2025-01-01T11:00:00Z")])
+_legacy.execute("""CREATE TABLE events (seq INTEGER PRIMARY KEY AUTOINCREMENT, competition_id, type, entity_id,
+                                        team_id, swimmer_id, lane_number, payload, timestamp)""")
+_legacy.execute("CREATE TABLE event_checkpoints (competition_id, seq, timestamp, state)")
+_legacy.execute("INSERT INTO events (competition_id, type, entity_id) VALUES ('c', 'session_started', 'a')")
+database._close_duplicate_active_sessions(_legacy)
+check("legacy duplicates closed, newest kept",
+      [r[0] for r in _legacy.execute("SELECT id FROM swim_sessions WHERE is_active=1 ORDER BY id")] == ["b", "q", "x"])
+_legacy_ended = _legacy.execute(
+    "SELECT e.competition_id, e.entity_id, e.timestamp = s.end_time FROM events e JOIN swim_sessions s ON s.id = e.entity_id"
+    " WHERE e.type='session_ended'").fetchall()
+check("closed duplicate logged as session_ended", _legacy_ended == [("c", "a", 1)], _legacy_ended)
+client.delete(f"/competitions/{LS_CID}")
+
+section("Live Model")
+import live, lap_counts, stats, utils
+r = client.post("/competitions", json={
+    "name":"Live 24h","date":"2025-09-05","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":2,"doubleCountTimeout":0,
+})
+LV_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{LV_CID}", json={"status":"active"})
+LVREF = j(client.post("/referees", json={"competitionId":LV_CID}))["data"]["id"]
+LVT, LVS = [], []
+for lane in (1, 2):
+    t = j(client.post("/teams", json={"name":f"V{lane}","color":"#666666","competitionId":LV_CID,"assignedLane":lane}))["data"]["id"]
+    LVS.append([j(client.post("/swimmers", json={"name":f"Vs{lane}{k}","teamId":t,"competitionId":LV_CID}))["data"]["id"]
+                for k in "ab"])
+    client.post("/swim-sessions", json={"competitionId":LV_CID,"swimmerId":LVS[-1][0],"teamId":t,"laneNumber":lane})
+    LVT.append(t)
+
+def lv_lap(i, k=0):
+    return client.post("/lap-counts", json={"competitionId":LV_CID,"laneNumber":i+1,"teamId":LVT[i],
+                                            "swimmerId":LVS[i][k],"refereeId":LVREF})
+
+def lv_matches_sql():
+    data = j(client.get(f"/competitions/{LV_CID}/stats"))["data"]
+    with database.get_db(LV_CID) as db:
+        return (data["teamStats"] == stats._team_stats(LV_CID, db)
+                and data["swimmerStats"] == stats._swimmer_stats(LV_CID, db))
+
+for _ in range(3): lv_lap(0)
+lv_lap(1)
+check("live model loaded for active comp", LV_CID in live.footprints())
+check("live stats == SQL stats",         lv_matches_sql())
+lv_model = live._models[LV_CID]
+client.post("/swim-sessions/handover", json={"competitionId":LV_CID,"teamId":LVT[0],"swimmerId":LVS[0][1]})
+r = lv_lap(0, 1)
+check("handover + lap written through",  s(r) == 201 and live._models.get(LV_CID) is lv_model
+                                         and j(r)["data"]["lapNumber"] == 4, j(r))
+check("stale session rejected by model", s(lv_lap(0, 0)) == 422)
+check("after handover == SQL",           lv_matches_sql())
+with database.get_db(LV_CID) as db:      # a write from another worker, not via this process
+    sess = db.execute("SELECT id FROM swim_sessions WHERE team_id=? AND is_active=1", (LVT[1],)).fetchone()[0]
+    lap_counts.insert_lap(db, LV_CID, 2, LVT[1], LVS[1][0], LVREF, 2, sess, utils.utc_now_iso(), utils.zone(None))
+    db.commit()
+check("foreign write folded in on read", lv_matches_sql() and live._models.get(LV_CID) is lv_model)
+lv_void = j(client.get("/lap-counts", query_string={"competitionId":LV_CID,"teamId":LVT[0]}))["data"][0]["id"]
+client.delete(f"/lap-counts/{lv_void}")
+check("void → reload, still == SQL",     lv_matches_sql() and live._models.get(LV_CID) is not lv_model)
+client.put(f"/competitions/{LV_CID}", json={"doubleCountTimeout":60})
+r = lv_lap(1)
+check("timeout edit invalidates → 429",  s(r) == 429, j(r))
+check("verify consistent",               live.verify(LV_CID) == [])
+with live._models[LV_CID].lock:
+    live._models[LV_CID].teams[LVT[0]].laps += 1
+check("verify detects drift and drops",  live.verify(LV_CID) == ["teamStats"] and LV_CID not in live.footprints())
+lv_matches_sql()
+r = client.get("/metrics")
+lv_fp = next((m for m in j(r)["data"]["liveModels"] if m["competitionId"] == LV_CID), None)
+check("/metrics reports live footprint", lv_fp is not None and lv_fp["teams"] == 2 and lv_fp["swimmers"] == 4
+                                         and lv_fp["bytes"] > 0, lv_fp)
+client.put(f"/competitions/{LV_CID}", json={"status":"completed"})
+j(client.get(f"/competitions/{LV_CID}/stats"))
+check("completed comp has no live model", LV_CID not in live.footprints())
+client.delete(f"/competitions/{LV_CID}")
+
+section("Stats: Swimmer Metrics")
+r = client.post("/competitions", json={
+    "name":"Metrics 24h","date":"2025-09-07","startTime":"10:00","laneLength":50,
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+SM_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{SM_CID}", json={"status":"active"})
+SMREF = j(client.post("/referees", json={"competitionId":SM_CID}))["data"]["id"]
+SMT   = j(client.post("/teams", json={"name":"M1","color":"#333333","competitionId":SM_CID,"assignedLane":1}))["data"]["id"]
+SMS   = [j(client.post("/swimmers", json={"name":f"Ms{k}","teamId":SMT,"competitionId":SM_CID}))["data"]["id"] for k in "ab"]
+SMSESS = j(client.post("/swim-sessions", json={"competitionId":SM_CID,"swimmerId":SMS[0],"teamId":SMT,"laneNumber":1}))["data"]["id"]
+j(client.get(f"/competitions/{SM_CID}/swimmer-stats"))          # live model loaded before the laps
+with database.get_db(SM_CID) as db:
+    for n, (sw, ts) in enumerate([(0, "10:00:00"), (1, "10:01:00"), (0, "10:05:00")], 1):
+        lap_counts.insert_lap(db, SM_CID, 1, SMT, SMS[sw], SMREF, n, SMSESS, f"2025-09-07T{ts}Z", utils.zone(None))
+    db.commit()
+sm_sw   = {d["swimmer"]["id"]: d for d in j(client.get(f"/competitions/{SM_CID}/swimmer-stats"))["data"]}
+sm_team = j(client.get(f"/competitions/{SM_CID}/team-stats"))["data"][0]
+check("swimmer lapsPerHour / fastest",  sm_sw[SMS[0]]["lapsPerHour"] == 12.0 and sm_sw[SMS[0]]["fastestLapSec"] == 300.0, sm_sw[SMS[0]])
+check("single lap → no rate",           sm_sw[SMS[1]]["lapsPerHour"] == 0.0 and sm_sw[SMS[1]]["fastestLapSec"] is None, sm_sw[SMS[1]])
+check("swimmer distance from laneLength", sm_sw[SMS[0]]["distanceM"] == 100 and sm_sw[SMS[1]]["distanceM"] == 50)
+check("team metrics",                   sm_team["lapsPerHour"] == 24.0 and sm_team["fastestLapSec"] == 60.0
+                                        and sm_team["distanceM"] == 150, sm_team)
+with database.get_db(SM_CID) as db:
+    check("live metrics == SQL metrics", list(sm_sw.values()) == stats._swimmer_stats(SM_CID, db)
+                                        and sm_team == stats._team_stats(SM_CID, db)[0])
+client.delete(f"/competitions/{SM_CID}")
+
+section("Stats: Competition Timezone")
+r = client.post("/competitions", json={
+    "name":"TZ 24h","date":"2025-09-06","startTime":"10:00","timezone":"Mars/Olympus",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+check("unknown timezone → 400",         s(r) == 400, j(r))
+r = client.post("/competitions", json={
+    "name":"TZ 24h","date":"2025-09-06","startTime":"10:00","timezone":"Europe/Berlin",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+TZ_CID = j(r)["data"]["id"]
+check("timezone serialized",            j(r)["data"]["timezone"] == "Europe/Berlin", j(r))
+check("window in competition timezone", utils.competition_window(
+    {"date":"2025-09-06","start_time":"10:00","timezone":"Europe/Berlin"})[0].strftime("%H:%M") == "08:00")
+client.put(f"/competitions/{TZ_CID}", json={"status":"active"})
+TZREF = j(client.post("/referees", json={"competitionId":TZ_CID}))["data"]["id"]
+TZT   = j(client.post("/teams", json={"name":"Z1","color":"#444444","competitionId":TZ_CID,"assignedLane":1}))["data"]["id"]
+TZS   = j(client.post("/swimmers", json={"name":"Zs","teamId":TZT,"competitionId":TZ_CID}))["data"]["id"]
+TZSESS = j(client.post("/swim-sessions", json={"competitionId":TZ_CID,"swimmerId":TZS,"teamId":TZT,"laneNumber":1}))["data"]["id"]
+j(client.get(f"/competitions/{TZ_CID}/team-stats"))              # live model loaded before the laps
+with database.get_db(TZ_CID) as db:
+    # CEST = UTC+2: 00:20Z is 02:20 local, 03:10Z is 05:10 (early), 22:30Z is 00:30 next day (late)
+    for n, ts in enumerate(["2025-09-06T00:20:00Z", "2025-09-06T03:10:00Z", "2025-09-06T22:30:00Z"], 1):
+        lap_counts.insert_lap(db, TZ_CID, 1, TZT, TZS, TZREF, n, TZSESS, ts, utils.zone("Europe/Berlin"))
+    db.commit()
+    tz_rows = [tuple(r) for r in db.execute(
+        "SELECT local_hour FROM lap_counts WHERE competition_id=? ORDER BY timestamp", (TZ_CID,))]
+check("local hour stored at insert",    tz_rows == [(2,), (5,), (0,)], tz_rows)
+tz_team = j(client.get(f"/competitions/{TZ_CID}/team-stats"))["data"][0]
+tz_sw   = j(client.get(f"/competitions/{TZ_CID}/swimmer-stats"))["data"][0]
+check("birds in local time (live)",     (tz_team["lateBirdLaps"], tz_team["earlyBirdLaps"]) == (1, 1)
+                                        and (tz_sw["lateBirdLaps"], tz_sw["earlyBirdLaps"]) == (1, 1), tz_team)
+with database.get_db(TZ_CID) as db:
+    check("birds in local time (SQL)",  stats._team_stats(TZ_CID, db)[0] == tz_team
+                                        and stats._swimmer_stats(TZ_CID, db)[0] == tz_sw)
+    tz_plan = " ".join(r[3] for r in db.execute(
+        """EXPLAIN QUERY PLAN SELECT team_id AS id, local_hour, COUNT(*) AS laps FROM lap_counts
+           WHERE competition_id=? AND voided_at IS NULL AND local_hour IN (?, ?)
+           GROUP BY team_id, local_hour""", (TZ_CID, 0, 5)))
+check("bird counts use the local-hour index", "idx_lap_counts_local_hour" in tz_plan, tz_plan)
+with database.get_db(TZ_CID) as db:
+    tz_seq = db.execute("SELECT MAX(seq) FROM changes").fetchone()[0]
+r = client.put(f"/competitions/{TZ_CID}", json={"timezone":"UTC"})
+tz_team = j(client.get(f"/competitions/{TZ_CID}/team-stats"))["data"][0]
+check("timezone change re-buckets laps", s(r) == 200 and (tz_team["lateBirdLaps"], tz_team["earlyBirdLaps"]) == (1, 0), tz_team)
+with database.get_db(TZ_CID) as db:
+    tz_changes = [r[0] for r in db.execute("SELECT entity FROM changes WHERE seq>? AND competition_id=?", (tz_seq, TZ_CID))]
+    tz_trigger = db.execute("SELECT 1 FROM sqlite_master WHERE name='trg_lap_counts_update'").fetchone()
+check("re-localizing logs no lap changes", "lap" not in tz_changes and "competition" in tz_changes, tz_changes)
+check("lap update trigger restored",    tz_trigger is not None)
+
+# A file that already has the change triggers gains a backfilled column: no row per lap.
+_mig = database._connect(os.path.join(_tf.mkdtemp(), "legacy.db"))
+_mig.executescript(database._shard_schema())
+_mig.execute("PRAGMA foreign_keys = OFF")
+_mig.execute("ALTER TABLE lap_counts DROP COLUMN local_hour")
+database._create_change_triggers(_mig)
+_mig.executemany("INSERT INTO lap_counts (id, competition_id, lane_number, team_id, swimmer_id, lap_number, timestamp) VALUES (?,?,?,?,?,?,?)",
+                 [(f"l{n}", "legacy", 1, "t", "s", n, f"2025-01-01T0{n}:00:00Z") for n in range(1, 4)])
+_mig.commit()
+_mig_seq = _mig.execute("SELECT MAX(seq) FROM changes").fetchone()[0]
+database._migrate_added_columns(_mig)
+_mig.commit()
+check("backfill logs no change rows",   _mig.execute("SELECT MAX(seq) FROM changes").fetchone()[0] == _mig_seq)
+check("backfill filled local_hour",     [r[0] for r in _mig.execute("SELECT local_hour FROM lap_counts ORDER BY id")] == [1, 2, 3])
+check("trigger kept after backfill",    _mig.execute("SELECT 1 FROM sqlite_master WHERE name='trg_lap_counts_update'").fetchone() is not None)
+_mig.close()
+r = client.put(f"/competitions/{TZ_CID}", json={"timezone":"Nowhere/Land"})
+check("update with unknown timezone → 400", s(r) == 400)
+client.delete(f"/competitions/{TZ_CID}")
+
+section("Query Plans")
+# Query templates of the hot read paths, as the blueprints build them. None of
+# them may scan a whole table or sort in a temp B-tree.
+import repository, referees, swim_sessions, changes
+HOT_QUERIES = {
+    "lap list by competition": repository.LAP_COUNTS.sql(counted=True, competition_id="x")[0],
+    "lap list by team":        repository.LAP_COUNTS.sql(counted=True, team_id="x")[0],
+    "lap list by swimmer":     repository.LAP_COUNTS.sql(counted=True, swimmer_id="x")[0],
+    "lap list incl. voided":   repository.LAP_COUNTS.sql(competition_id="x")[0],
+    "team stats laps":         stats.TEAM_LAPS_SQL,
+    "swimmer stats laps":      stats.SWIMMER_LAPS_SQL,
+    "live model laps":         live.LIVE_LAPS_SQL,
+    "bird counts":             stats.BIRD_LAPS_SQL.format(by="team_id"),
+    "team active session":     swim_sessions.ACTIVE_SESSION_SQL,
+    "session list":            repository.SWIM_SESSIONS.sql(competition_id="x")[0],
+    "session list by team":    repository.SWIM_SESSIONS.sql(team_id="x")[0],
+    "active session count":    stats.ACTIVE_SESSION_COUNT_SQL,
+    "referee id taken":        referees.UNIQUE_ID_TAKEN_SQL,
+    "teams by lane":           repository.TEAMS.sql(competition_id="x")[0],
+    "swimmers list":           repository.SWIMMERS.sql(competition_id="x")[0],
+    "swimmers by name":        stats.SWIMMERS_BY_NAME_SQL,
+    "events since":            live.EVENTS_SINCE_SQL,
+    "change feed":             changes.CHANGES_SINCE_SQL,
+    "data version":            changes.DATA_VERSION_SQL.format(schema="main"),
+}
+with database.get_db() as db:
+    qp_bad = {}
+    for name, sql in HOT_QUERIES.items():
+        plan = [r[3] for r in db.execute("EXPLAIN QUERY PLAN " + sql, ["x"] * sql.count("?"))]
+        if any(step.startswith("SCAN ") or "TEMP B-TREE" in step for step in plan):
+            qp_bad[name] = plan
+check("no hot query scans or sorts",    not qp_bad, qp_bad)
+with database.get_db() as db:
+    qp_plan = " ".join(r[3] for r in db.execute("EXPLAIN QUERY PLAN " + HOT_QUERIES["team stats laps"], ["x"]))
+check("stats laps from covering index", "COVERING INDEX idx_lap_counts_counted" in qp_plan, qp_plan)
+with database.get_db() as db:
+    qp_idx = db.execute("SELECT name FROM sqlite_master WHERE name='idx_lap_counts_timestamp'").fetchone()
+check("duplicate team/time index dropped", qp_idx is None)
+
+section("Connection Pool")
+database.drain_pool()
+with database.get_db() as db:
+    cp_first = db
+    db.execute("SELECT 1")
+with database.get_db() as db:
+    cp_second = db
+check("connection reused after with block",  cp_first is cp_second)
+with database.get_db() as db:
+    with database.get_db() as db2:
+        cp_nested = db2
+check("nested checkout gets its own conn",   cp_nested is not db)
+db = database.get_db()                   # close() without commit, mid-transaction
+db.execute("INSERT INTO competitions (id, name, date, start_time, location, organizer_id) VALUES ('pool-x','x','2025-01-01','10:00','x',?)", (ADMIN_ID,))
+db.close()
+with database.get_db() as db:
+    check("released connection not in txn", not db.in_transaction)
+    check("uncommitted row not kept",        db.execute("SELECT 1 FROM competitions WHERE id='pool-x'").fetchone() is None)
+cp_sql = repository.LAP_COUNTS.sql(counted=True, competition_id="a")[0]
+check("same filters → identical SQL",        cp_sql == repository.LAP_COUNTS.sql(counted=True, competition_id="b")[0])
+check("filter params in order",              repository.REFEREES.sql(competition_id="c", user_id="u")[1] == ["c", "u", "u"])
+check("isActive=0 still filters",            "is_active" in repository.SWIM_SESSIONS.sql(is_active=0)[0])
+r = client.get("/metrics")
+check("/metrics reports pool reuse",         j(r)["data"]["connectionPool"]["reused"] > 0, j(r)["data"].get("connectionPool"))
+
+section("List Serialization")
+import utils
+r = client.post("/competitions", json={
+    "name":"Shapes 24h","date":"2025-09-07","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+LS2_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{LS2_CID}", json={"status":"active"})
+LS2REF = j(client.post("/referees", json={"competitionId":LS2_CID}))["data"]["id"]
+LS2T   = j(client.post("/teams", json={"name":"S1","color":"#444444","competitionId":LS2_CID,"assignedLane":1}))["data"]["id"]
+LS2S   = j(client.post("/swimmers", json={"name":"Kid","teamId":LS2T,"competitionId":LS2_CID,
+                                          "isUnder12":True,"parentName":"P","parentContact":"0151","parentPresent":True}))["data"]["id"]
+client.post("/swim-sessions", json={"competitionId":LS2_CID,"swimmerId":LS2S,"teamId":LS2T,"laneNumber":1})
+for _ in range(2):
+    LS2LAP = j(client.post("/lap-counts", json={"competitionId":LS2_CID,"laneNumber":1,"teamId":LS2T,
+                                                 "swimmerId":LS2S,"refereeId":LS2REF}))["data"]["id"]
+client.delete(f"/lap-counts/{LS2LAP}")
+LS_SHAPES = {
+    "teams":         (repository.TEAMS,         "SELECT * FROM teams WHERE competition_id=?",         utils.serialize_team),
+    "swimmers":      (repository.SWIMMERS,      "SELECT * FROM swimmers WHERE competition_id=?",      utils.serialize_swimmer),
+    "swim_sessions": (repository.SWIM_SESSIONS, "SELECT * FROM swim_sessions WHERE competition_id=?", utils.serialize_session),
+    "lap_counts":    (repository.LAP_COUNTS,    "SELECT * FROM lap_counts WHERE competition_id=?",    utils.serialize_lap_count),
+    "referees":      (repository.REFEREES,      "SELECT r.*, u.email as user_email FROM referees r JOIN users u "
+                                                "ON r.user_id = u.id WHERE r.competition_id=?",      utils.serialize_referee),
+}
+with database.get_db(LS2_CID) as db:
+    for name, (query, old_sql, serialize) in LS_SHAPES.items():
+        ls_old = sorted((serialize(dict(r)) for r in db.execute(old_sql, (LS2_CID,))), key=lambda o: o["id"])
+        ls_new = sorted(query.fetch(db, competition_id=LS2_CID), key=lambda o: o["id"])
+        check(f"{name} shape = serializer output", ls_new == ls_old and len(ls_new) > 0,
+              next((f"{a} != {b}" for a, b in zip(ls_new, ls_old) if a != b), f"{len(ls_new)} rows"))
+r = client.get(f"/lap-counts?competitionId={LS2_CID}&includeVoided=1")
+check("voided lap listed with reason",  sum(1 for x in j(r)["data"] if x["voidedAt"]) == 1, j(r)["data"])
+r = client.get(f"/swimmers?competitionId={LS2_CID}")
+check("bool fields are JSON bools",     j(r)["data"][0]["isUnder12"] is True and j(r)["data"][0]["parentPresent"] is True,
+      j(r)["data"])
+client.delete(f"/competitions/{LS2_CID}")
+
+section("Lap Write Queue")
+from concurrent.futures import ThreadPoolExecutor
+r = client.post("/competitions", json={
+    "name":"Burst 24h","date":"2025-09-07","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":4,"doubleCountTimeout":0,
+})
+WQ_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{WQ_CID}", json={"status":"active"})
+WQREF = j(client.post("/referees", json={"competitionId":WQ_CID}))["data"]["id"]
+wq_lanes = []
+for lane in range(1, 5):
+    t  = j(client.post("/teams", json={"name":f"B{lane}","color":"#555555","competitionId":WQ_CID,"assignedLane":lane}))["data"]["id"]
+    sw = j(client.post("/swimmers", json={"name":f"Bs{lane}","teamId":t,"competitionId":WQ_CID}))["data"]["id"]
+    client.post("/swim-sessions", json={"competitionId":WQ_CID,"swimmerId":sw,"teamId":t,"laneNumber":lane})
+    wq_lanes.append((lane, t, sw))
+wq_before = lap_counts.lap_writes.status()["batches"]
+def wq_tap(n):
+    lane, t, sw = wq_lanes[n % 4]
+    return client.post("/lap-counts", json={"competitionId":WQ_CID,"laneNumber":lane,"teamId":t,"swimmerId":sw,"refereeId":WQREF})
+with ThreadPoolExecutor(16) as pool:
+    wq_res = list(pool.map(wq_tap, range(80)))
+check("burst of taps → all 201",          all(s(x) == 201 for x in wq_res), sorted({s(x) for x in wq_res}))
+wq_numbers = {}
+for x in wq_res:
+    wq_numbers.setdefault(j(x)["data"]["teamId"], []).append(j(x)["data"]["lapNumber"])
+check("lap numbers unique per team",      all(sorted(v) == list(range(1, 21)) for v in wq_numbers.values()), wq_numbers)
+check("taps were group-committed",        lap_counts.lap_writes.status()["batches"] - wq_before < 80, lap_counts.lap_writes.status())
+r = client.get(f"/competitions/{WQ_CID}/team-stats")
+check("live totals match",                sorted(d["totalLaps"] for d in j(r)["data"]) == [20] * 4, j(r)["data"])
+
+lane, t, sw = wq_lanes[0]
+wq_sess = j(client.get(f"/swim-sessions?competitionId={WQ_CID}&teamId={t}&isActive=1"))["data"][0]["id"]
+wq_pending = lap_counts.PendingLap(WQ_CID, lane, t, sw, WQREF, wq_sess, utils.utc_now_iso(), 30, utils.zone(None))
+wq_futures = [lap_counts.lap_writes.submit(WQ_CID, wq_pending) for _ in range(2)]
+wq_bad = lap_counts.lap_writes.submit(WQ_CID, wq_pending._replace(team_id="no-such-team", double_count_timeout=0))
+wq_errors = [type(f.exception(timeout=5)).__name__ for f in wq_futures + [wq_bad]]
+check("writer repeats double-count check", wq_errors[:2] == ["DoubleCount", "DoubleCount"], wq_errors)
+check("failed item does not fail batch",  wq_errors[2] == "IntegrityError", wq_errors)
+wq_ok = lap_counts.lap_writes.submit(WQ_CID, wq_pending._replace(double_count_timeout=0)).result(timeout=5)
+check("future completes with lap number", wq_ok.lap_number == 21, wq_ok)
+r = client.get("/metrics")
+check("/metrics reports lap queue",       j(r)["data"]["lapQueue"]["items"] >= 81, j(r)["data"].get("lapQueue"))
+
+import write_queue, threading
+wq_started, wq_release, wq_seen = threading.Event(), threading.Event(), []
+def wq_apply(db, item):
+    wq_started.set()
+    wq_release.wait(5)
+    wq_seen.append(item)
+    return item
+def wq_after(db, cid):
+    raise RuntimeError("after_commit failed")
+wq_probe = write_queue.WriteQueue("probe", wq_apply, after_commit=wq_after)
+wq_first  = wq_probe.submit(WQ_CID, "first")
+wq_second = wq_probe.submit(WQ_CID, "second")
+wq_started.wait(5)
+check("running item cannot be cancelled", not wq_first.cancel())
+check("queued item can be cancelled",     wq_second.cancel())
+wq_release.set()
+check("after_commit error not propagated", wq_first.result(timeout=5) == "first")
+check("cancelled item is not written",    wq_seen == ["first"], wq_seen)
+client.delete(f"/competitions/{WQ_CID}")
+
+section("Stats: Long Poll")
+r = client.post("/competitions", json={
+    "name":"Long Poll 24h","date":"2025-09-07","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+LP_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{LP_CID}", json={"status":"active"})
+LPREF = j(client.post("/referees", json={"competitionId":LP_CID}))["data"]["id"]
+LPT   = j(client.post("/teams", json={"name":"P1","color":"#777777","competitionId":LP_CID,"assignedLane":1}))["data"]["id"]
+LPS   = j(client.post("/swimmers", json={"name":"Ps","teamId":LPT,"competitionId":LP_CID}))["data"]["id"]
+client.post("/swim-sessions", json={"competitionId":LP_CID,"swimmerId":LPS,"teamId":LPT,"laneNumber":1})
+LP_LAP = {"competitionId":LP_CID,"laneNumber":1,"teamId":LPT,"swimmerId":LPS,"refereeId":LPREF}
+r = client.get(f"/competitions/{LP_CID}/stats?waitFor=0")
+lp_v = j(r)["data"].get("dataVersion", 0)
+check("waitFor=0 → immediate, versioned", s(r) == 200 and lp_v > 0 and r.headers.get("Cache-Control") == "no-store", j(r))
+check("plain stats carry no version",     "dataVersion" not in j(client.get(f"/competitions/{LP_CID}/stats"))["data"])
+t0 = time.time()
+r = client.get(f"/competitions/{LP_CID}/stats?waitFor={lp_v}&timeout=0.3")
+check("no change → same version at timeout", j(r)["data"]["dataVersion"] == lp_v and 0.25 <= time.time() - t0 < 2,
+          round(time.time() - t0, 2))
+threading.Timer(0.2, lambda: app.test_client().post("/lap-counts", json=LP_LAP)).start()
+t0 = time.time()
+r = client.get(f"/competitions/{LP_CID}/stats?waitFor={lp_v}&timeout=10")
+check("lap wakes the long-poll",          j(r)["data"]["dataVersion"] > lp_v and j(r)["data"]["totalLaps"] == 1
+                                          and time.time() - t0 < 5, round(time.time() - t0, 2))
+lp_v = j(r)["data"]["dataVersion"]
+r = client.get(f"/competitions/{LP_CID}/stats?waitFor=0&fields=version")
+check("fields=version → version only",    j(r)["data"] == {"dataVersion": lp_v}, j(r))
+check("unknown competition → 404",        s(client.get("/competitions/nope/stats?waitFor=0")) == 404)
+check("timeout is capped",                stats.long_poll_timeout("9999") == stats.LONG_POLL_MAX_S
+                                          and stats.long_poll_timeout("x") == stats.LONG_POLL_DEFAULT_S)
+
+client.delete(f"/competitions/{LP_CID}")
+
+section("Startup")
+import startup, sqlite3
+su_metrics = j(client.get("/metrics"))["data"]["startup"]
+check("/metrics startup phases",          su_metrics["totalMs"] > 0 and "blueprints" in su_metrics["phases"]
+                                          and "imports" in su_metrics["phases"], su_metrics)
+def su_version(path=None):
+    conn = sqlite3.connect(path or database._db_path())
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+SU_FP = database.schema_fingerprint()
+check("main file stamped",                su_version() == SU_FP, (su_version(), SU_FP))
+os.environ["SWIMTRACK_SHARDING"] = "1"
+r = client.post("/competitions", json={
+    "name":"Startup 24h","date":"2025-09-07","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+os.environ.pop("SWIMTRACK_SHARDING")
+SU_CID = j(r)["data"]["id"]
+check("new shard stamped",                su_version(database.shard_path(SU_CID)) == SU_FP)
+startup.reset()
+database.init_db()
+su_rep = startup.report()
+check("stamped files skip init",          su_rep["fastStart"] is True and "schema" not in su_rep["phases"]
+                                          and "migrations" not in su_rep["phases"], su_rep)
+with database.get_db() as db:
+    db.execute("PRAGMA user_version = 0")
+startup.reset()
+database.init_db()
+su_rep = startup.report()
+check("unstamped file runs full init",    su_rep["fastStart"] is False and "migrations" in su_rep["phases"]
+                                          and su_version() == SU_FP, su_rep)
+os.environ["SWIMTRACK_FAST_START"] = "0"
+startup.reset()
+database.init_db()
+os.environ.pop("SWIMTRACK_FAST_START")
+check("SWIMTRACK_FAST_START=0 forces it", startup.report()["fastStart"] is False)
+_fp_rev = database.SCHEMA_REVISION
+database.SCHEMA_REVISION += 1
+check("revision bump changes fingerprint", database.schema_fingerprint() != SU_FP)
+database.SCHEMA_REVISION = _fp_rev
+client.delete(f"/competitions/{SU_CID}")
+
+section("Write Contention")
+r = client.post("/competitions", json={
+    "name":"Contention 24h","date":"2025-09-07","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+WC_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{WC_CID}", json={"status":"active"})
+WCREF = j(client.post("/referees", json={"competitionId":WC_CID}))["data"]["id"]
+WCT   = j(client.post("/teams", json={"name":"C1","color":"#888888","competitionId":WC_CID,"assignedLane":1}))["data"]["id"]
+WCS   = j(client.post("/swimmers", json={"name":"Cs","teamId":WCT,"competitionId":WC_CID}))["data"]["id"]
+client.post("/swim-sessions", json={"competitionId":WC_CID,"swimmerId":WCS,"teamId":WCT,"laneNumber":1})
+
+def wc_hold(seconds):
+    """Take the main file's write lock from another connection for `seconds`."""
+    conn = sqlite3.connect(database._db_path(), timeout=0, check_same_thread=False)
+    conn.execute("BEGIN IMMEDIATE")
+    threading.Timer(seconds, lambda: (conn.rollback(), conn.close())).start()
+def wc_site(site):
+    return database.contention_status()["sites"].get(site, {"busy":0, "retries":0, "failed":0})
+
+try:
+    sqlite3.connect(":memory:").execute("SELECT * FROM nope")
+except sqlite3.OperationalError as exc:
+    check("missing table is not busy",      not database.is_busy(exc))
+wc_hold(0.3)
+t0 = time.time()
+r = client.put(f"/teams/{WCT}", json={"name":"C1b"})
+check("edit waits out a held lock",       s(r) == 200 and time.time() - t0 >= 0.25, (s(r), round(time.time() - t0, 2)))
+check("retry counted for the route",      wc_site("PUT /teams/<tid>")["retries"] >= 1, database.contention_status())
+wc_hold(0.3)
+r = client.post("/lap-counts", json={"competitionId":WC_CID,"laneNumber":1,"teamId":WCT,"swimmerId":WCS,"refereeId":WCREF})
+check("lap writer retries its batch",     s(r) == 201 and wc_site("swimtrack-laps-writer")["retries"] >= 1, j(r))
+os.environ["SWIMTRACK_WRITE_BUDGET_MS"] = "150"
+wc_hold(1.0)
+t0 = time.time()
+r = client.put(f"/teams/{WCT}", json={"name":"C1c"})
+wc_elapsed = time.time() - t0
+os.environ.pop("SWIMTRACK_WRITE_BUDGET_MS")
+check("over budget → 503 Retry-After",    s(r) == 503 and r.headers.get("Retry-After") == "1" and wc_elapsed < 0.8,
+          (s(r), round(wc_elapsed, 2)))
+check("failure counted for the route",    wc_site("PUT /teams/<tid>")["failed"] >= 1)
+time.sleep(0.8)
+check("edit after release → 200",         s(client.put(f"/teams/{WCT}", json={"name":"C1d"})) == 200)
+def wc_busy_timeout():
+    with database.get_db() as db:
+        return db.execute("PRAGMA busy_timeout").fetchone()[0]
+os.environ["SWIMTRACK_WRITE_BUDGET_MS"] = "0"
+wc_off = wc_busy_timeout()
+os.environ.pop("SWIMTRACK_WRITE_BUDGET_MS")
+check("retries off: 5 s busy timeout",    wc_off == 5000 and wc_busy_timeout() == 50, (wc_off, wc_busy_timeout()))
+r = client.get("/metrics")
+check("/metrics contention",              j(r)["data"]["contention"]["retries"] >= 2
+                                          and "PUT /teams/<tid>" in j(r)["data"]["contention"]["sites"], j(r)["data"]["contention"])
+client.delete(f"/competitions/{WC_CID}")
+
+section("Change Feed")
+import changes, threading
+cf = changes.ChangeFeed()
+cf_seen = []
+cf.subscribe(cf_seen.append)
+cf.poll_once()                           # opens every file at its newest change
+r = client.post("/competitions", json={
+    "name":"Feed 24h","date":"2025-09-06","startTime":"10:00",
+    "location":"Pool","organizerId":ADMIN_ID,"numberOfLanes":1,"doubleCountTimeout":0,
+})
+CF_CID = j(r)["data"]["id"]
+client.put(f"/competitions/{CF_CID}", json={"status":"active"})
+CF_T = j(client.post("/teams", json={"name":"F1","color":"#777777","competitionId":CF_CID,"assignedLane":1}))["data"]["id"]
+CF_S = j(client.post("/swimmers", json={"name":"Fs","teamId":CF_T,"competitionId":CF_CID}))["data"]["id"]
+CF_REF = j(client.post("/referees", json={"competitionId":CF_CID}))["data"]["id"]
+client.post("/swim-sessions", json={"competitionId":CF_CID,"swimmerId":CF_S,"teamId":CF_T,"laneNumber":1})
+client.post("/lap-counts", json={"competitionId":CF_CID,"laneNumber":1,"teamId":CF_T,"swimmerId":CF_S,"refereeId":CF_REF})
+check("poll delivers committed changes", cf.poll_once() > 0)
+cf_mine = [(c.entity, c.op) for c in cf_seen if c.competition_id == CF_CID]
+check("competition/team/swimmer/session/lap rows",
+      ("competition","insert") in cf_mine and ("competition","update") in cf_mine
+      and ("team","insert") in cf_mine and ("swimmer","insert") in cf_mine
+      and ("session","insert") in cf_mine and ("lap","insert") in cf_mine, cf_mine)
+check("changes are in seq order",       [c.seq for c in cf_seen] == sorted(c.seq for c in cf_seen))
+check("idle poll delivers nothing",     cf.poll_once() == 0)
+
+feed = changes.feed()
+cf_hit = threading.Event()
+def cf_watch(c):
+    if c.entity == "team" and c.entity_id == CF_T and c.op == "update":
+        cf_hit.set()
+feed.subscribe(cf_watch)
+check("process feed is running",        feed.running)
+t0 = time.perf_counter()
+with database.get_db(CF_CID) as db:     # a write from another worker, not via this process
+    db.execute("UPDATE teams SET color='#111111' WHERE id=?", (CF_T,))
+    db.commit()
+cf_delay = time.perf_counter() - t0 if cf_hit.wait(1) else None
+feed.unsubscribe(cf_watch)
+check("foreign write seen within 100 ms", cf_delay is not None and cf_delay < 0.1, cf_delay)
+
+j(client.get(f"/competitions/{CF_CID}/stats"))
+cf_model = live._models.get(CF_CID)
+with database.get_db(CF_CID) as db:
+    db.execute("UPDATE competitions SET double_count_timeout=60 WHERE id=?", (CF_CID,))
+    db.commit()
+cf.subscribe(live.on_change)
+cf.poll_once()
+cf.unsubscribe(live.on_change)
+check("foreign edit drops live model",  cf_model is not None and CF_CID not in live.footprints())
+r = client.post("/lap-counts", json={"competitionId":CF_CID,"laneNumber":1,"teamId":CF_T,"swimmerId":CF_S,"refereeId":CF_REF})
+check("reloaded model sees new timeout", s(r) == 429, j(r))
+with database.get_db() as db:
+    for _ in range(2):
+        db.execute("INSERT INTO changes (competition_id, entity, entity_id, op, at) VALUES ('x','team','x','update','2000-01-01T00:00:00Z')")
+    db.commit()
+check("prune drops expired rows",       changes.prune_all() >= 1)
+with database.get_db() as db:
+    check("prune keeps newest per competition", db.execute("SELECT COUNT(*) FROM changes WHERE competition_id='x'").fetchone()[0] == 1)
+with database.get_db() as db:
+    check("prune keeps recent rows",    db.execute("SELECT COUNT(*) FROM changes WHERE competition_id=?", (CF_CID,)).fetchone()[0] > 0)
+r = client.get("/metrics")
+check("/metrics reports change feed",   j(r)["data"]["changeFeed"]["running"] is True, j(r)["data"].get("changeFeed"))
+client.delete(f"/competitions/{CF_CID}")
 
 # ═════════════════════════════════════════════════════════════════════════════
 total = passed + len(failures)
@@ -2,11 +2,15 @@
 utils.py - Shared utilities: response helpers, password generation, validation, serialisation
 """
 
+import os
 import uuid
 import random
 import re
 import logging
 import hashlib
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from flask import jsonify
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -44,6 +48,74 @@ def new_uuid() -> str:
     return str(uuid.uuid4())
 
 
+def utc_now_iso() -> str:
+    """Current UTC time in the ISO-8601 'Z' format used by every timestamp column."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_utc(ts: str):
+    if not ts:
+        return None
+    try:
+        return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=64)
+def zone(name: str | None):
+    """tzinfo for a competition's IANA timezone; competitions without one use UTC."""
+    return ZoneInfo(name) if name else timezone.utc
+
+
+def is_valid_timezone(name) -> bool:
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return False
+
+
+def local_hour(ts: str, tz) -> int | None:
+    """Hour of a UTC timestamp in the competition's timezone (a zone() tzinfo)."""
+    dt = parse_utc(ts)
+    return None if dt is None else dt.astimezone(tz).hour
+
+
+def competition_window(comp: dict) -> tuple:
+    """
+    Planned (start, end) of a competition as aware UTC datetimes.
+
+    `date` + `start_time` / `end_time` are wall-clock values entered by the
+    organizer and are interpreted in the competition's timezone, or the
+    server's local timezone if it has none. An end time at or before the start
+    rolls over to the next day; without an end time the event runs 24h from
+    its actual (or planned) start.
+    """
+    tz = zone(comp["timezone"]) if comp.get("timezone") else None
+
+    def wall_clock(hhmm: str) -> datetime:
+        dt = datetime.strptime(f"{comp['date']} {hhmm}", "%Y-%m-%d %H:%M")
+        return (dt.replace(tzinfo=tz) if tz else dt).astimezone(timezone.utc)
+
+    try:
+        start = wall_clock(comp["start_time"])
+    except (KeyError, TypeError, ValueError):
+        return None, None
+
+    end = None
+    if comp.get("end_time"):
+        try:
+            end = wall_clock(comp["end_time"])
+        except ValueError:
+            end = None
+        if end is not None and end <= start:
+            end += timedelta(days=1)
+    if end is None:
+        end = (parse_utc(comp.get("actual_start_time")) or start) + timedelta(hours=24)
+    return start, end
+
+
 def sha256_hex(value: str) -> str:
     return hashlib.sha256((value or "").encode("utf-8")).hexdigest()
 
@@ -116,6 +188,17 @@ def conflict(message: str):
     return jsonify({"error": message}), 409
 
 
+def cors_headers(origin: str) -> dict:
+    """CORS headers for a request from `origin` (CORS_ORIGINS, comma-separated)."""
+    allowed = os.environ.get("CORS_ORIGINS", "http://localhost:8080,https://24swim.de").split(",")
+    return {
+        "Access-Control-Allow-Origin":      origin if origin in allowed or "*" in allowed else allowed[0],
+        "Access-Control-Allow-Methods":     "GET, POST, PUT, DELETE, OPTIONS",
+        "Access-Control-Allow-Headers":     "Content-Type, Authorization, X-API-Key",
+        "Access-Control-Allow-Credentials": "true",
+    }
+
+
 def too_many_requests(message: str, retry_after: int):
     resp = jsonify({"error": message, "retryAfter": retry_after})
     resp.status_code = 429
@@ -150,6 +233,7 @@ def serialize_competition(row: dict) -> dict:
         "location":           row["location"],
         "numberOfLanes":      row["number_of_lanes"],
         "laneLength":         row.get("lane_length", 25),
+        "timezone":           row.get("timezone"),
         "doubleCountTimeout": row["double_count_timeout"],
         "organizerId":        row["organizer_id"],
         "status":             row["status"],
@@ -158,6 +242,7 @@ def serialize_competition(row: dict) -> dict:
         "actualStartTime":    row.get("actual_start_time"),
         "actualEndTime":      row.get("actual_end_time"),
         "resultsPdf":         row.get("results_pdf"),
+        "archivedAt":         row.get("archived_at"),
         "createdAt":          row["created_at"],
     }
 
@@ -223,6 +308,10 @@ def serialize_lap_count(row: dict) -> dict:
         "refereeId":     row["referee_id"],
         "lapNumber":     row["lap_number"],
         "timestamp":     row["timestamp"],
+        "sessionId":     row.get("session_id"),
+        "voidedAt":      row.get("voided_at"),
+        "voidedBy":      row.get("voided_by"),
+        "voidReason":    row.get("void_reason"),
     }
 
 
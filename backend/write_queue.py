@@ -0,0 +1,162 @@
+"""
+write_queue.py - Group commit for hot write paths
+
+A WriteQueue owns one writer thread per worker. Request threads submit()
+items and wait on the returned Future; the writer takes the first queued item,
+keeps collecting for SWIMTRACK_WRITE_BATCH_MS (default 5 ms) or until
+WRITE_BATCH_MAX items, and then writes each competition's items in one
+transaction on one connection: one commit (and fsync) per batch instead of
+one per request, and request threads never contend for SQLite's write lock
+with each other. The batch locks only the competition's own file
+(database.begin_write): shards never wait on the main database's lock.
+
+Each item is applied inside its own SAVEPOINT, so an item that raises (a
+rejected lap, a constraint violation) is rolled back alone and its Future
+gets the exception; the rest of the batch still commits. If the transaction
+itself fails (e.g. the database stays locked by another worker), every Future
+of that batch gets the sqlite3 error. A request that stops waiting cancels
+its Future; the writer skips cancelled items, and an item it has started on
+is always answered with its real outcome. `after_commit` runs after the
+Futures are resolved, and its errors are only logged.
+
+SWIMTRACK_WRITE_BATCH_MS=0 applies each item in the submitting thread
+instead, with the same transaction handling.
+"""
+
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future
+from database import get_db, begin_write
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_MAX = 64
+
+
+def batch_window_s() -> float:
+    """0 disables batching."""
+    try:
+        return float(os.environ.get("SWIMTRACK_WRITE_BATCH_MS", 5)) / 1000
+    except ValueError:
+        return 0.005
+
+
+class WriteQueue:
+    """
+    `apply(db, item)` writes one item and returns its result; it runs inside
+    the batch transaction and must not commit. `after_commit(db, cid)` runs
+    once per competition after its batch committed.
+    """
+
+    def __init__(self, name: str, apply, after_commit=None):
+        self.name         = name
+        self.apply        = apply
+        self.after_commit = after_commit
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches   = 0
+        self.items     = 0
+        self.max_batch = 0
+
+    def submit(self, competition_id: str, item) -> Future:
+        future = Future()
+        window = batch_window_s()
+        if window <= 0:
+            self._commit(competition_id, [(item, future)])
+            return future
+        self._ensure_started()
+        self._queue.put((competition_id, item, future, window))
+        return future
+
+    def status(self) -> dict:
+        return {
+            "running":   self._thread is not None and self._thread.is_alive(),
+            "batches":   self.batches,
+            "items":     self.items,
+            "maxBatch":  self.max_batch,
+            "avgBatch":  round(self.items / self.batches, 2) if self.batches else None,
+        }
+
+    # ── writer ────────────────────────────────────────────────────────────────
+    def _ensure_started(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"swimtrack-{self.name}-writer",
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            deadline = time.monotonic() + first[3]
+            while len(batch) < WRITE_BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            by_competition: dict[str, list] = {}
+            for cid, item, future, _ in batch:
+                by_competition.setdefault(cid, []).append((item, future))
+            for cid, entries in by_competition.items():
+                try:
+                    self._commit(cid, entries)
+                except Exception as exc:             # keep the writer alive
+                    logger.exception("%s batch failed", self.name)
+                    for _, future in entries:
+                        if not future.done():
+                            future.set_exception(exc)
+
+    def _commit(self, competition_id: str, entries: list) -> None:
+        results = []
+        with get_db(competition_id) as db:
+            try:
+                begin_write(db)
+                for item, future in entries:
+                    # A request that gave up waiting cancelled its Future; once
+                    # running, the item is written and the request waits for it.
+                    if not future.set_running_or_notify_cancel():
+                        results.append(None)
+                        continue
+                    db.execute("SAVEPOINT item")
+                    try:
+                        results.append((True, self.apply(db, item)))
+                    except Exception as exc:
+                        db.execute("ROLLBACK TO item")
+                        results.append((False, exc))
+                    db.execute("RELEASE item")
+                db.commit()
+            except sqlite3.Error as exc:
+                if db.in_transaction:
+                    db.rollback()
+                logger.warning("%s batch of %d not written: %s", self.name, len(entries), exc)
+                for _, future in entries:
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+            self.batches  += 1
+            self.items    += len(entries)
+            self.max_batch = max(self.max_batch, len(entries))
+            for (_, future), result in zip(entries, results):
+                if result is None:
+                    continue
+                done, value = result
+                if done:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            # The batch is committed and answered; a failure here must not
+            # turn recorded items into errors.
+            if self.after_commit:
+                try:
+                    self.after_commit(db, competition_id)
+                except Exception:
+                    logger.exception("%s after_commit failed for %s", self.name, competition_id)
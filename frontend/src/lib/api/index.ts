@@ -23,8 +23,10 @@ export { RemoteDataApi, RemoteAuthApi, RemoteApiError } from './remoteApi';
 export { setSessionToken, getSessionToken, clearSessionToken, hasSessionToken } from './sessionManager';
 
 import { DataApi, AuthApi, AdminApi, StorageConfig } from './types';
+import type { Team, Swimmer } from '@/types';
 import { LocalStorageDataApi, LocalStorageAuthApi, LocalStorageAdminApi } from './localStorage';
 import { RemoteDataApi, RemoteAuthApi } from './remoteApi';
+import { lapsPerHourBetween } from '@/lib/utils/lapRate';
 import { 
   getStorageConfig, 
   isRemoteMode,
@@ -92,7 +94,7 @@ class DynamicDataApi implements DataApi {
   async getLapCountsBySwimmer(swimmerId: string) { return this.getApi().getLapCountsBySwimmer(swimmerId); }
   async getLastLapBySwimmer(swimmerId: string) { return this.getApi().getLastLapBySwimmer(swimmerId); }
   async addLapCount(lapCount: any) { return this.getApi().addLapCount(lapCount); }
-  async deleteLapCount(id: string) { return this.getApi().deleteLapCount(id); }
+  async deleteLapCount(id: string, competitionId: string) { return this.getApi().deleteLapCount(id, competitionId); }
   async getSwimSessions() { return this.getApi().getSwimSessions(); }
   async getSwimSessionsByCompetition(competitionId: string) { return this.getApi().getSwimSessionsByCompetition(competitionId); }
   async getActiveSwimSessions(competitionId: string) { return this.getApi().getActiveSwimSessions(competitionId); }
@@ -143,7 +145,25 @@ export async function canCountLap(swimmerId: string, minIntervalSeconds: number
   return (now - lastTime) >= minIntervalSeconds * 1000;
 }
 
+// In remote mode the backend computes the stats; only the local store needs the lap log.
+function remoteStatsApi(): RemoteDataApi | null {
+  return isRemoteMode() ? new RemoteDataApi(getStorageConfig()) : null;
+}
+
 export async function getTeamStats(competitionId: string) {
+  const remote = remoteStatsApi();
+  if (remote) {
+    const stats = await remote.getTeamStats(competitionId);
+    return stats.map(s => ({
+      team: { ...s.team, competitionId, createdAt: '' } as Team,
+      totalLaps: s.totalLaps,
+      lapsPerHour: s.lapsPerHour,
+      fastestLap: s.fastestLapSec === null ? null : s.fastestLapSec * 1000,
+      lateBirdLaps: s.lateBirdLaps,
+      earlyBirdLaps: s.earlyBirdLaps,
+    }));
+  }
+
   const [teams, lapCounts] = await Promise.all([
     dataApi.getTeamsByCompetition(competitionId),
     dataApi.getLapCountsByCompetition(competitionId),
@@ -171,8 +191,7 @@ export async function getTeamStats(competitionId: string) {
 
     const firstLap = new Date(sortedLaps[0].timestamp).getTime();
     const lastLap = new Date(sortedLaps[sortedLaps.length - 1].timestamp).getTime();
-    const durationHours = (lastLap - firstLap) / (1000 * 60 * 60);
-    const lapsPerHour = durationHours > 0 ? totalLaps / durationHours : 0;
+    const lapsPerHour = lapsPerHourBetween(totalLaps, firstLap, lastLap);
 
     const lateBirdLaps = teamLaps.filter(lc => {
       const hour = new Date(lc.timestamp).getHours();
@@ -188,7 +207,33 @@ export async function getTeamStats(competitionId: string) {
   }).sort((a, b) => b.totalLaps - a.totalLaps);
 }
 
+// Remote mode only: resolves with the backend's data version once it differs from `version`
+// (or the long-poll timed out and it is unchanged).
+export async function waitForStatsChange(competitionId: string, version: number): Promise<number> {
+  const remote = remoteStatsApi();
+  if (!remote) throw new Error('Waiting for stats changes needs remote mode');
+  const { dataVersion } = await remote.waitForStats(competitionId, version);
+  return dataVersion;
+}
+
 export async function getSwimmerStats(competitionId: string) {
+  const remote = remoteStatsApi();
+  if (remote) {
+    const stats = await remote.getSwimmerStats(competitionId);
+    return stats.map(s => {
+      const { teamName, teamColor, ...swimmer } = s.swimmer;
+      return {
+        swimmer: { ...swimmer, competitionId, createdAt: '' } as Swimmer,
+        team: { id: swimmer.teamId, name: teamName, color: teamColor, competitionId } as Team | undefined,
+        totalLaps: s.totalLaps,
+        lapsPerHour: s.lapsPerHour,
+        fastestLap: s.fastestLapSec === null ? null : s.fastestLapSec * 1000,
+        lateBirdLaps: s.lateBirdLaps,
+        earlyBirdLaps: s.earlyBirdLaps,
+      };
+    });
+  }
+
   const [swimmers, teams, lapCounts] = await Promise.all([
     dataApi.getSwimmersByCompetition(competitionId),
     dataApi.getTeamsByCompetition(competitionId),
@@ -218,8 +263,7 @@ export async function getSwimmerStats(competitionId: string) {
 
     const firstLap = new Date(sortedLaps[0].timestamp).getTime();
     const lastLap = new Date(sortedLaps[sortedLaps.length - 1].timestamp).getTime();
-    const durationHours = (lastLap - firstLap) / (1000 * 60 * 60);
-    const lapsPerHour = durationHours > 0 ? totalLaps / durationHours : 0;
+    const lapsPerHour = lapsPerHourBetween(totalLaps, firstLap, lastLap);
 
     const lateBirdLaps = swimmerLaps.filter(lc => {
       const hour = new Date(lc.timestamp).getHours();
@@ -13,6 +13,7 @@ import {
 } from './types';
 import { loadSiteConfig, toAdminConfig, SiteConfigFile } from '@/lib/config/siteConfig';
 import { hashPassword, verifyPassword } from '@/lib/utils/password';
+import { lapsPerHourBetween } from '@/lib/utils/lapRate';
 
 const KEYS = {
   competitions: 'swimtrack_competitions',
@@ -599,8 +600,7 @@ export async function getTeamStats(competitionId: string) {
     // Calculate laps per hour
     const firstLap = new Date(sortedLaps[0].timestamp).getTime();
     const lastLap = new Date(sortedLaps[sortedLaps.length - 1].timestamp).getTime();
-    const durationHours = (lastLap - firstLap) / (1000 * 60 * 60);
-    const lapsPerHour = durationHours > 0 ? totalLaps / durationHours : 0;
+    const lapsPerHour = lapsPerHourBetween(totalLaps, firstLap, lastLap);
     
     // Late Bird (midnight to 1AM) and Early Bird (5AM to 6AM)
     const lateBirdLaps = teamLaps.filter(lc => {
@@ -647,8 +647,7 @@ export async function getSwimmerStats(competitionId: string) {
     
     const firstLap = new Date(sortedLaps[0].timestamp).getTime();
     const lastLap = new Date(sortedLaps[sortedLaps.length - 1].timestamp).getTime();
-    const durationHours = (lastLap - firstLap) / (1000 * 60 * 60);
-    const lapsPerHour = durationHours > 0 ? totalLaps / durationHours : 0;
+    const lapsPerHour = lapsPerHourBetween(totalLaps, firstLap, lastLap);
     
     const lateBirdLaps = swimmerLaps.filter(lc => {
       const hour = new Date(lc.timestamp).getHours();
@@ -25,6 +25,24 @@ export class RemoteApiError extends Error {
 
 type HttpMethod = 'GET' | 'POST' | 'PUT' | 'DELETE';
 
+interface ServerLapMetrics {
+  totalLaps: number;
+  lateBirdLaps: number;
+  earlyBirdLaps: number;
+  lapsPerHour: number;
+  fastestLapSec: number | null;
+  distanceM: number;
+}
+
+export interface ServerTeamStat extends ServerLapMetrics {
+  team: { id: string; name: string; color: string; assignedLane: number };
+}
+
+export interface ServerSwimmerStat extends ServerLapMetrics {
+  swimmer: { id: string; name: string; teamId: string; teamName: string; teamColor: string; isUnder12: boolean };
+  totalWaterSeconds: number;
+}
+
 async function saveWithUpsert(
   config: StorageConfig,
   endpoint: string,
@@ -276,8 +294,12 @@ export class RemoteDataApi implements DataApi {
     await makeRequest(this.config, this.config.endpoints.lapCounts, 'POST', { body: lapCount });
   }
 
-  async deleteLapCount(): Promise<void> {
-    throw new RemoteApiError('Delete lap count not supported in remote mode');
+  // Sharded competitions locate the lap by competitionId
+  async deleteLapCount(id: string, competitionId: string): Promise<void> {
+    await makeRequest(this.config, this.config.endpoints.lapCounts, 'DELETE', {
+      pathId: id,
+      queryParams: { competitionId }
+    });
   }
 
   // Swim Sessions
@@ -339,6 +361,28 @@ export class RemoteDataApi implements DataApi {
   async deleteSwimSession(): Promise<void> {
     throw new RemoteApiError('Delete swim session not supported in remote mode');
   }
+
+  // Stats (computed by the backend, no raw lap log)
+  async getTeamStats(competitionId: string): Promise<ServerTeamStat[]> {
+    return makeRequest<ServerTeamStat[]>(this.config, this.config.endpoints.competitions, 'GET', {
+      pathId: `${competitionId}/team-stats`
+    });
+  }
+
+  async getSwimmerStats(competitionId: string): Promise<ServerSwimmerStat[]> {
+    return makeRequest<ServerSwimmerStat[]>(this.config, this.config.endpoints.competitions, 'GET', {
+      pathId: `${competitionId}/swimmer-stats`
+    });
+  }
+
+  // Long-poll: answers once the competition's data version passes `version`, or after timeoutS.
+  // Only the version is returned; the caller reloads what it shows.
+  async waitForStats(competitionId: string, version: number, timeoutS: number = 25): Promise<{ dataVersion: number }> {
+    return makeRequest<{ dataVersion: number }>(this.config, this.config.endpoints.competitions, 'GET', {
+      pathId: `${competitionId}/stats`,
+      queryParams: { waitFor: version.toString(), timeout: timeoutS.toString(), fields: 'version' }
+    });
+  }
 }
 
 // Remote Auth API implementation
@@ -131,7 +131,7 @@ export interface DataApi {
   getLapCountsBySwimmer(swimmerId: string): Promise<LapCount[]>;
   getLastLapBySwimmer(swimmerId: string): Promise<LapCount | undefined>;
   addLapCount(lapCount: LapCount): Promise<void>;
-  deleteLapCount(id: string): Promise<void>;
+  deleteLapCount(id: string, competitionId: string): Promise<void>;
 
   // Swim Sessions
   getSwimSessions(): Promise<SwimSession[]>;
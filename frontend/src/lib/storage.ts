@@ -4,6 +4,7 @@
 
 import { Competition, Team, Swimmer, Referee, SwimSession } from '@/types';
 import {getSiteConfig} from '@/lib/config/siteConfig'
+import { lapsPerHourBetween } from '@/lib/utils/lapRate';
 
 // Re-export types that are defined in this file
 export type { LaneAssignment, LapCount };
@@ -293,8 +294,7 @@ export function getTeamStats(competitionId: string) {
     // Calculate laps per hour
     const firstLap = new Date(sortedLaps[0].timestamp).getTime();
     const lastLap = new Date(sortedLaps[sortedLaps.length - 1].timestamp).getTime();
-    const durationHours = (lastLap - firstLap) / (1000 * 60 * 60);
-    const lapsPerHour = durationHours > 0 ? totalLaps / durationHours : 0;
+    const lapsPerHour = lapsPerHourBetween(totalLaps, firstLap, lastLap);
     
     // Late Bird (midnight to 1AM) and Early Bird (5AM to 6AM)
     const lateBirdLaps = teamLaps.filter(lc => {
@@ -343,8 +343,7 @@ export function getSwimmerStats(competitionId: string) {
     
     const firstLap = new Date(sortedLaps[0].timestamp).getTime();
     const lastLap = new Date(sortedLaps[sortedLaps.length - 1].timestamp).getTime();
-    const durationHours = (lastLap - firstLap) / (1000 * 60 * 60);
-    const lapsPerHour = durationHours > 0 ? totalLaps / durationHours : 0;
+    const lapsPerHour = lapsPerHourBetween(totalLaps, firstLap, lastLap);
     
     const lateBirdLaps = swimmerLaps.filter(lc => {
       const hour = new Date(lc.timestamp).getHours();
@@ -0,0 +1,7 @@
+// Laps per hour as the backend computes it (stats.lap_metrics): the laps - 1
+// intervals between the first and the last lap over that span, 2 decimals.
+export function lapsPerHourBetween(totalLaps: number, firstLapMs: number, lastLapMs: number): number {
+  const durationHours = (lastLapMs - firstLapMs) / (1000 * 60 * 60);
+  if (totalLaps < 2 || durationHours <= 0) return 0;
+  return Math.round(((totalLaps - 1) / durationHours) * 100) / 100;
+}
@@ -3,6 +3,7 @@ import jsPDF from 'jspdf';
 import autoTable from 'jspdf-autotable';
 import { Competition, Team, Swimmer } from '@/types';
 import { LapCount } from '@/lib/api/types';
+import { lapsPerHourBetween } from '@/lib/utils/lapRate';
 
 interface TeamStats {
   team: Team;
@@ -79,8 +80,7 @@ export function generateCompetitionResultsPDF(
       // Calculate laps per hour
       const firstLap = new Date(sortedLaps[0].timestamp).getTime();
       const lastLap = new Date(sortedLaps[sortedLaps.length - 1].timestamp).getTime();
-      const durationHours = (lastLap - firstLap) / (1000 * 60 * 60);
-      lapsPerHour = durationHours > 0 ? totalLaps / durationHours : 0;
+      lapsPerHour = lapsPerHourBetween(totalLaps, firstLap, lastLap);
     }
     
     return { team, totalLaps, totalMeters, lapsPerHour, fastestLap };
@@ -13,7 +13,7 @@ import { Label } from '@/components/ui/label';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import { Alert, AlertDescription, AlertTitle } from '@/components/ui/alert';
 import { Competition, Team, Swimmer } from '@/types';
-import { dataApi, getTeamStats, getSwimmerStats, isRemoteMode } from '@/lib/api';
+import { dataApi, getTeamStats, getSwimmerStats, waitForStatsChange, isRemoteMode } from '@/lib/api';
 import { loadSiteConfig } from '@/lib/config/siteConfig';
 import { Trophy, Clock, Zap, Moon, Sun, Waves, RefreshCw, ArrowUpDown, Users, User, MapPin, Calendar, Ruler, AlertCircle, QrCode } from 'lucide-react';
 
@@ -131,23 +131,47 @@ export default function Monitor() {
     loadStats();
   }, [loadStats]);
 
-  // Auto-refresh interval
+  // Auto-refresh: in remote mode the backend holds a long-poll until the data changes,
+  // so stats reload right after a lap instead of on the next tick; locally poll on an interval.
+  const selectedCompetitionId = selectedCompetition?.id;
   useEffect(() => {
     if (intervalRef.current) {
       clearInterval(intervalRef.current);
       intervalRef.current = null;
     }
-    
-    if (autoRefresh && selectedCompetition) {
-      intervalRef.current = setInterval(loadStats, refreshInterval);
+    if (!autoRefresh || !selectedCompetitionId) return;
+
+    if (isRemoteMode()) {
+      let cancelled = false;
+      const follow = async () => {
+        let version = 0;
+        while (!cancelled) {
+          try {
+            const next = await waitForStatsChange(selectedCompetitionId, version);
+            if (cancelled) break;
+            if (next !== version) {
+              version = next;
+              await loadStats();
+            }
+          } catch (error) {
+            console.error('Error waiting for stats changes:', error);
+            await new Promise(resolve => setTimeout(resolve, refreshInterval));
+          }
+        }
+      };
+      follow();
+      return () => {
+        cancelled = true;
+      };
     }
-    
+
+    intervalRef.current = setInterval(loadStats, refreshInterval);
     return () => {
       if (intervalRef.current) {
         clearInterval(intervalRef.current);
       }
     };
-  }, [autoRefresh, refreshInterval, loadStats, selectedCompetition]);
+  }, [autoRefresh, refreshInterval, loadStats, selectedCompetitionId]);
 
   // Countdown timer - pauses when competition is paused
   const frozenCountdownRef = useRef<string | null>(null);
@@ -107,6 +107,7 @@ export default function OrganizerDashboard() {
         numberOfLanes: parseInt(formData.get('numberOfLanes') as string),
         laneLength: parseInt(formData.get('laneLength') as string),
         doubleCountTimeout: parseInt(formData.get('doubleCountTimeout') as string) || 15,
+        timezone: (formData.get('timezone') as string).trim() || null,
         organizerId: user!.id,
         status: editingCompetition?.status || 'upcoming',
         autoStart: false,
@@ -460,9 +461,20 @@ export default function OrganizerDashboard() {
                     <Input id="location" name="location" defaultValue={editingCompetition?.location} required />
                   </div>
                 </div>
-                <div className="space-y-2">
-                  <Label htmlFor="startTime">Start Time</Label>
-                  <Input id="startTime" name="startTime" type="time" defaultValue={editingCompetition?.startTime || '08:00'} required />
+                <div className="grid grid-cols-2 gap-4">
+                  <div className="space-y-2">
+                    <Label htmlFor="startTime">Start Time</Label>
+                    <Input id="startTime" name="startTime" type="time" defaultValue={editingCompetition?.startTime || '08:00'} required />
+                  </div>
+                  <div className="space-y-2">
+                    <Label htmlFor="timezone">Timezone</Label>
+                    <Input
+                      id="timezone"
+                      name="timezone"
+                      placeholder="Europe/Berlin"
+                      defaultValue={editingCompetition ? editingCompetition.timezone || '' : Intl.DateTimeFormat().resolvedOptions().timeZone}
+                    />
+                  </div>
                 </div>
                 <div className="grid grid-cols-3 gap-4">
                   <div className="space-y-2">
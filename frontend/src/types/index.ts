@@ -22,6 +22,7 @@ export interface Competition {
   numberOfLanes: number;
   laneLength: number; // in meters
   doubleCountTimeout: number; // timeout in seconds to prevent double counting
+  timezone?: string | null; // IANA name (e.g. Europe/Berlin) for start time and early/late bird hours; unset = UTC
   organizerId: string;
   status: 'upcoming' | 'active' | 'paused' | 'completed' | 'stopped';
   autoStart: boolean;